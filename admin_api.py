@@ -0,0 +1,237 @@
+"""
+HTTP API для офиса: заявки, отчеты и нагрузка техников только для чтения.
+
+Запускается вместе с ботом (см. ADMIN_API_* в README) и читает базу через
+отдельное соединение в режиме только для чтения, поэтому запросы панелей
+не мешают записи заявок ботом. Агрегаты (нагрузка, счетчики статусов)
+кэшируются на ADMIN_API_CACHE_TTL секунд: панели, опрашивающие API каждые
+несколько секунд, обращаются к базе не чаще одного раза за этот срок.
+
+Все запросы, кроме /api/health, требуют заголовок
+    Authorization: Bearer <ADMIN_API_TOKEN>
+
+Маршруты:
+    GET /api/health
+    GET /api/orders?status=&user_id=&from=&to=&q=&limit=&offset=
+    GET /api/orders/{id}
+    GET /api/workload
+    GET /api/status-counts
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import time
+from dataclasses import asdict
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from aiohttp import web
+
+from database import Database, OrderStatus
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Маршруты без проверки токена
+PUBLIC_PATHS = frozenset({"/api/health"})
+
+_dumps = partial(json.dumps, ensure_ascii=False)
+
+
+class TTLCache:
+    """Кэш результатов на ttl секунд.
+
+    Одновременные запросы одного ключа после истечения срока ждут одну
+    загрузку, а не обращаются к базе каждый сам.
+    """
+
+    def __init__(self, ttl: float = 5.0):
+        self.ttl = ttl
+        self._entries: Dict[Hashable, tuple] = {}
+        self._loading: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Значение из кэша или результат loader()"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        task = self._loading.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(loader())
+            self._loading[key] = task
+            task.add_done_callback(partial(self._loaded, key))
+        else:
+            self.hits += 1
+        # shield: отмена одного запроса не отменяет загрузку для остальных
+        return await asyncio.shield(task)
+
+    def _loaded(self, key: Hashable, task: asyncio.Task):
+        """Сохранение результата загрузки (ошибки не кэшируются)"""
+        self._loading.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self._entries[key] = (time.monotonic() + self.ttl, task.result())
+
+    def clear(self):
+        """Сброс сохраненных значений"""
+        self._entries.clear()
+
+
+def _bad_request(message: str) -> web.HTTPBadRequest:
+    return web.HTTPBadRequest(text=_dumps({"error": message}), content_type="application/json")
+
+
+def _int_param(request: web.Request, name: str, default: Optional[int] = None,
+               minimum: int = 0, maximum: Optional[int] = None) -> Optional[int]:
+    """Целочисленный параметр запроса с проверкой границ"""
+    value = request.query.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise _bad_request(f"{name}: ожидается целое число")
+    if number < minimum or (maximum is not None and number > maximum):
+        bounds = f"от {minimum}" + (f" до {maximum}" if maximum is not None else "")
+        raise _bad_request(f"{name}: допустимо {bounds}")
+    return number
+
+
+def _time_param(request: web.Request, name: str, end: bool = False) -> Optional[str]:
+    """Граница по created_at: дата или дата со временем (UTC, как в базе).
+
+    Для верхней границы (end) дата без времени включает весь день.
+    """
+    value = request.query.get(name)
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise _bad_request(f"{name}: ожидается дата ГГГГ-ММ-ДД или ГГГГ-ММ-ДД ЧЧ:ММ:СС")
+    if moment.tzinfo is not None:
+        raise _bad_request(f"{name}: время указывается в UTC без часового пояса")
+    if end and len(value) == 10:
+        moment += timedelta(days=1)
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _order_json(order, latest_report=None) -> Dict[str, Any]:
+    data = asdict(order)
+    data["latest_report"] = asdict(latest_report) if latest_report else None
+    return data
+
+
+class AdminApi:
+    """aiohttp-приложение API администратора поверх базы только для чтения"""
+
+    def __init__(self, db: Database, token: str, cache_ttl: float = 5.0):
+        if not token:
+            raise ValueError("Не задан токен API администратора")
+        self.db = db
+        self.token = token
+        self.cache = TTLCache(cache_ttl)
+        self.requests = 0
+        self.rejected = 0
+        self._runner: Optional[web.AppRunner] = None
+
+        self.app = web.Application(middlewares=[self._auth_middleware])
+        self.app.add_routes([
+            web.get("/api/health", self.health),
+            web.get("/api/orders", self.orders),
+            web.get("/api/orders/{order_id:\\d+}", self.order),
+            web.get("/api/workload", self.workload),
+            web.get("/api/status-counts", self.status_counts),
+        ])
+
+    @web.middleware
+    async def _auth_middleware(self, request: web.Request, handler):
+        """Проверка токена в заголовке Authorization"""
+        self.requests += 1
+        if request.path not in PUBLIC_PATHS:
+            scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+            if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), self.token.encode()):
+                self.rejected += 1
+                raise web.HTTPUnauthorized(
+                    text=_dumps({"error": "неверный или отсутствующий токен"}),
+                    content_type="application/json",
+                    headers={"WWW-Authenticate": "Bearer"}
+                )
+        return await handler(request)
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({"ok": True}, dumps=_dumps)
+
+    async def orders(self, request: web.Request) -> web.Response:
+        """Список заявок с фильтрами и постраничным выводом"""
+        status = request.query.get("status") or None
+        if status is not None and status not in {s.value for s in OrderStatus}:
+            raise _bad_request(f"status: неизвестный статус {status}")
+        limit = _int_param(request, "limit", DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+        offset = _int_param(request, "offset", 0)
+        orders, total = await self.db.list_orders(
+            status=status,
+            user_id=_int_param(request, "user_id"),
+            created_from=_time_param(request, "from"),
+            created_to=_time_param(request, "to", end=True),
+            search=request.query.get("q") or None,
+            limit=limit,
+            offset=offset
+        )
+        latest_reports = await self.db.get_latest_reports([order.id for order in orders])
+        return web.json_response({
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "items": [_order_json(order, latest_reports.get(order.id)) for order in orders]
+        }, dumps=_dumps)
+
+    async def order(self, request: web.Request) -> web.Response:
+        """Заявка со всеми отчетами"""
+        order_id = int(request.match_info["order_id"])
+        order = await self.db.get_order_by_id(order_id)
+        if order is None:
+            raise web.HTTPNotFound(
+                text=_dumps({"error": f"заявка #{order_id} не найдена"}),
+                content_type="application/json"
+            )
+        data = asdict(order)
+        data["reports"] = [asdict(report) for report in await self.db.get_order_reports(order_id)]
+        return web.json_response(data, dumps=_dumps)
+
+    async def workload(self, request: web.Request) -> web.Response:
+        """Нагрузка по техникам (кэшируется)"""
+        return web.json_response(await self.cache.get("workload", self.db.get_workload), dumps=_dumps)
+
+    async def status_counts(self, request: web.Request) -> web.Response:
+        """Количество заявок по статусам (кэшируется)"""
+        return web.json_response(await self.cache.get("status_counts", self.db.get_status_counts), dumps=_dumps)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080):
+        """Запуск HTTP-сервера в текущем цикле событий"""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"API администратора: http://{host}:{port}/api/")
+
+    async def stop(self):
+        """Остановка HTTP-сервера"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "запросов": self.requests,
+            "отклонено": self.rejected,
+            "кэш, попаданий": self.cache.hits,
+            "кэш, промахов": self.cache.misses
+        }
@@ -0,0 +1,98 @@
+"""
+План дня техника: какие заявки выполнять сегодня и в каком порядке объезжать.
+
+Время заявки - свободный текст ("14:00", "25.12 утром", "завтра после 18"),
+поэтому дата из него извлекается эвристически. Заявки без даты и просроченные
+активные заявки попадают в план, заявки на будущие дни - нет.
+"""
+
+import re
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from database import Order
+from geo import nearest_neighbor_route
+
+_DATE_ISO_RE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+_DATE_RU_RE = re.compile(r"\b(\d{1,2})[./](\d{1,2})(?:[./](\d{2}|\d{4}))?\b")
+_RELATIVE_DAYS = (("послезавтра", 2), ("завтра", 1), ("сегодня", 0))
+
+
+def _created_date(order: Order) -> date:
+    try:
+        return datetime.fromisoformat(order.created_at).date()
+    except (TypeError, ValueError):
+        return date.today()
+
+
+def _next_date(day: int, month: int, after: date) -> Optional[date]:
+    """Ближайшая дата day.month не раньше after - для дат без года"""
+    for year in (after.year, after.year + 1):
+        try:
+            candidate = date(year, month, day)
+        except ValueError:
+            continue  # "14.30" - это время, а не дата
+        if candidate >= after:
+            return candidate
+    return None
+
+
+def scheduled_date(order: Order) -> Optional[date]:
+    """Дата выполнения заявки, если ее удалось извлечь из текста времени.
+
+    Дата без года ("05.01") - ближайшая такая дата после создания заявки:
+    заявка от 30.12 на "05.01" выполняется в январе следующего года.
+    """
+    text = order.time.lower()
+    match = _DATE_ISO_RE.search(text)
+    if match:
+        year, month, day = (int(part) for part in match.groups())
+    else:
+        match = _DATE_RU_RE.search(text)
+        if match:
+            day, month = int(match.group(1)), int(match.group(2))
+            year = match.group(3)
+            if year is None:
+                scheduled = _next_date(day, month, _created_date(order))
+                if scheduled is not None:
+                    return scheduled
+                match = None
+            else:
+                year = int(year) + (2000 if len(year) == 2 else 0)
+    if match:
+        try:
+            return date(year, month, day)
+        except ValueError:
+            pass  # "14.30" - это время, а не дата
+
+    for word, offset in _RELATIVE_DAYS:
+        if word in text:
+            return _created_date(order) + timedelta(days=offset)
+    return None
+
+
+def is_due_on(order: Order, day: date) -> bool:
+    """Входит ли заявка в план на день day"""
+    scheduled = scheduled_date(order)
+    return scheduled is None or scheduled <= day
+
+
+def plan_route(
+    orders: List[Order],
+    start: Optional[Tuple[float, float]] = None
+) -> Tuple[List[Tuple[Order, float]], List[Order]]:
+    """Порядок объезда заявок.
+
+    Возвращает заявки с координатами в порядке маршрута (с расстоянием от
+    предыдущей точки, км) и заявки без координат - их порядок не меняется.
+    """
+    by_id = {order.id: order for order in orders}
+    located = [
+        (order.id, order.latitude, order.longitude)
+        for order in orders if order.latitude is not None and order.longitude is not None
+    ]
+    route, legs = nearest_neighbor_route(start, located)
+    routed = set(route)
+    stops = [(by_id[order_id], km) for order_id, km in zip(route, legs)]
+    unlocated = [order for order in orders if order.id not in routed]
+    return stops, unlocated
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Онлайн-резервное копирование базы данных через SQLite backup API.
+
+Копирование идет небольшими порциями страниц с паузами, поэтому бот может
+продолжать писать в базу во время резервного копирования.
+
+Примеры:
+    python3 backup.py backup                          # сделать снимок сейчас
+    python3 backup.py list                            # список снимков
+    python3 backup.py verify backups/orders_....db.gz # проверка целостности снимка
+    python3 backup.py restore backups/orders_....db.gz  # восстановление (бот остановлен!)
+"""
+
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from settings import SettingsError, load_settings
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед повтором неудавшегося резервного копирования, секунды
+RETRY_DELAY = 600.0
+
+
+class BackupError(Exception):
+    """Ошибка резервного копирования или восстановления"""
+
+
+def check_integrity(db_path: str) -> str:
+    """Результат PRAGMA integrity_check ("ok", если база не повреждена)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("PRAGMA integrity_check").fetchall()
+    finally:
+        conn.close()
+    return "; ".join(row[0] for row in rows)
+
+
+def _decompress_to_temp(snapshot_path: str, directory: str) -> str:
+    """Распаковка .gz снимка во временный файл потоково, без загрузки в память"""
+    fd, tmp_path = tempfile.mkstemp(suffix=".db", dir=directory)
+    with os.fdopen(fd, "wb") as dst, gzip.open(snapshot_path, "rb") as src:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    return tmp_path
+
+
+class BackupManager:
+    """Снимки базы данных: создание, ротация, проверка и восстановление"""
+
+    def __init__(
+        self,
+        db_path: str,
+        backup_dir: str = "backups",
+        pages_per_step: int = 100,
+        step_pause: float = 0.01,
+        keep: int = 7,
+        compress: bool = True
+    ):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.keep = keep
+        self.compress = compress
+        self.last_result: Optional[Dict] = None
+
+    @property
+    def _prefix(self) -> str:
+        return os.path.splitext(os.path.basename(self.db_path))[0] + "_"
+
+    def list_snapshots(self) -> List[str]:
+        """Снимки от новых к старым"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        names = [
+            name for name in os.listdir(self.backup_dir)
+            if name.startswith(self._prefix) and (name.endswith(".db") or name.endswith(".db.gz"))
+        ]
+        return [os.path.join(self.backup_dir, name) for name in sorted(names, reverse=True)]
+
+    def backup(self) -> Dict:
+        """Создание снимка (блокирующий вызов, из бота - через run_backup)"""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        started = time.perf_counter()
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        raw_path = os.path.join(self.backup_dir, f"{self._prefix}{stamp}.db")
+        tmp_path = raw_path + ".part"
+        steps = 0
+        total_pages = 0
+
+        def progress(status, remaining, total):
+            nonlocal steps, total_pages
+            steps += 1
+            total_pages = total
+
+        src = sqlite3.connect(self.db_path)
+        dst = sqlite3.connect(tmp_path)
+        try:
+            # Между порциями блокировка чтения с базы снимается, писатели не ждут
+            src.backup(dst, pages=self.pages_per_step, progress=progress, sleep=self.step_pause)
+        except sqlite3.Error as e:
+            dst.close()
+            os.remove(tmp_path)
+            raise BackupError(f"Ошибка копирования: {e}") from e
+        finally:
+            src.close()
+        dst.close()
+        copy_seconds = time.perf_counter() - started
+
+        integrity = check_integrity(tmp_path)
+        if integrity != "ok":
+            os.remove(tmp_path)
+            raise BackupError(f"Снимок поврежден: {integrity}")
+
+        if self.compress:
+            path = raw_path + ".gz"
+            with open(tmp_path, "rb") as src_file, gzip.open(path, "wb", compresslevel=6) as dst_file:
+                shutil.copyfileobj(src_file, dst_file, 1024 * 1024)
+            os.remove(tmp_path)
+        else:
+            path = raw_path
+            os.replace(tmp_path, path)
+
+        removed = self.rotate()
+        result = {
+            "path": path,
+            "size_bytes": os.path.getsize(path),
+            "pages": total_pages,
+            "steps": steps,
+            "pages_per_step": self.pages_per_step,
+            "copy_s": round(copy_seconds, 3),
+            "total_s": round(time.perf_counter() - started, 3),
+            "integrity": integrity,
+            "rotated": len(removed),
+            "finished_at": datetime.now().isoformat(timespec="seconds")
+        }
+        self.last_result = result
+        logger.info(
+            f"Резервная копия {path}: {total_pages} страниц за {steps} шагов, "
+            f"копирование {result['copy_s']} с, всего {result['total_s']} с"
+        )
+        return result
+
+    def rotate(self) -> List[str]:
+        """Удаление старых снимков сверх self.keep"""
+        removed = []
+        for path in self.list_snapshots()[self.keep:]:
+            os.remove(path)
+            removed.append(path)
+        return removed
+
+    def verify(self, snapshot_path: str) -> str:
+        """Проверка целостности снимка"""
+        if not snapshot_path.endswith(".gz"):
+            return check_integrity(snapshot_path)
+        tmp_path = _decompress_to_temp(snapshot_path, os.path.dirname(os.path.abspath(snapshot_path)))
+        try:
+            return check_integrity(tmp_path)
+        finally:
+            os.remove(tmp_path)
+
+    def restore(self, snapshot_path: str) -> Optional[str]:
+        """Восстановление базы из снимка. Бот должен быть остановлен.
+
+        Текущая база предварительно сохраняется рядом с суффиксом .before_restore.
+        Возвращает путь к этой копии (None, если базы еще не было).
+        """
+        db_dir = os.path.dirname(os.path.abspath(self.db_path))
+        source = snapshot_path
+        if snapshot_path.endswith(".gz"):
+            source = _decompress_to_temp(snapshot_path, db_dir)
+        try:
+            integrity = check_integrity(source)
+            if integrity != "ok":
+                raise BackupError(f"Снимок поврежден: {integrity}")
+
+            saved_path = None
+            if os.path.exists(self.db_path):
+                saved_path = self.db_path + ".before_restore"
+                current = sqlite3.connect(self.db_path)
+                saved = sqlite3.connect(saved_path)
+                try:
+                    current.backup(saved)
+                finally:
+                    saved.close()
+                    current.close()
+
+            # backup API перезаписывает базу целиком и корректно обрабатывает журнал
+            src = sqlite3.connect(source)
+            dst = sqlite3.connect(self.db_path)
+            try:
+                src.backup(dst, pages=self.pages_per_step)
+            finally:
+                dst.close()
+                src.close()
+        finally:
+            if source != snapshot_path:
+                os.remove(source)
+        logger.info(f"База {self.db_path} восстановлена из {snapshot_path}")
+        return saved_path
+
+    async def run_backup(self) -> Dict:
+        """Создание снимка в отдельном потоке, не блокируя цикл событий"""
+        return await asyncio.to_thread(self.backup)
+
+    def seconds_until_due(self, interval_hours: float) -> float:
+        """Время до следующего снимка, отсчитанное от самого нового снимка;
+        0, если снимков нет или срок уже прошел"""
+        snapshots = self.list_snapshots()
+        if not snapshots:
+            return 0.0
+        try:
+            age = time.time() - os.path.getmtime(snapshots[0])
+        except OSError:
+            return 0.0
+        return max(0.0, interval_hours * 3600 - age)
+
+    async def run_periodically(self, interval_hours: float):
+        """Резервное копирование по расписанию (запускается через asyncio.create_task).
+
+        Срок считается от последнего снимка, а не от запуска: перезапуски бота
+        и смена интервала не откладывают копирование.
+        """
+        while True:
+            await asyncio.sleep(self.seconds_until_due(interval_hours))
+            try:
+                await self.run_backup()
+            except Exception as e:
+                logger.exception(f"Ошибка резервного копирования: {e}")
+                await asyncio.sleep(min(interval_hours * 3600, RETRY_DELAY))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        config = load_settings(require=False)
+    except SettingsError as e:
+        print(f"❌ Ошибка в настройках: {e}")
+        return 1
+
+    parser = argparse.ArgumentParser(description="Резервное копирование базы заявок")
+    parser.add_argument("--db", default=config.database_path,
+                        help="путь к базе данных (по умолчанию DATABASE_PATH из .env)")
+    parser.add_argument("--dir", default=config.backup_dir,
+                        help="каталог снимков (по умолчанию BACKUP_DIR из .env)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("backup", help="сделать снимок")
+    subparsers.add_parser("list", help="список снимков")
+    verify_parser = subparsers.add_parser("verify", help="проверить целостность снимка")
+    verify_parser.add_argument("snapshot")
+    restore_parser = subparsers.add_parser("restore", help="восстановить базу из снимка")
+    restore_parser.add_argument("snapshot")
+    args = parser.parse_args()
+
+    manager = BackupManager(
+        args.db,
+        args.dir,
+        pages_per_step=config.backup_pages_per_step,
+        keep=config.backup_keep,
+        compress=config.backup_compress
+    )
+
+    try:
+        if args.command == "backup":
+            result = manager.backup()
+            print(f"✅ Снимок создан: {result['path']} ({result['size_bytes']} байт, "
+                  f"{result['pages']} страниц, {result['total_s']} с)")
+        elif args.command == "list":
+            for path in manager.list_snapshots():
+                print(f"{path}\t{os.path.getsize(path)}")
+        elif args.command == "verify":
+            integrity = manager.verify(args.snapshot)
+            print(f"{'✅' if integrity == 'ok' else '❌'} {args.snapshot}: {integrity}")
+            return 0 if integrity == "ok" else 1
+        elif args.command == "restore":
+            print("⚠️ Убедитесь, что бот остановлен: sudo systemctl stop telegram-order-bot.service")
+            saved_path = manager.restore(args.snapshot)
+            print(f"✅ База восстановлена из {args.snapshot}")
+            if saved_path:
+                print(f"   Предыдущая версия сохранена в {saved_path}")
+    except (BackupError, sqlite3.Error, OSError) as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
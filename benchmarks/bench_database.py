@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+Бенчмарки слоя доступа к данным (database.Database) на больших базах.
+
+База заполняется заявками (с отчетами, вложениями, языками пользователей и
+журналом событий), затем каждый метод, которым пользуются бот и API
+администратора, вызывается из нескольких конкурентных задач asyncio
+(micro), а также выполняется смешанная нагрузка, похожая на работу бота
+(macro). Каждый замер повторяется для соединения на каждый вызов и для пула
+соединений, с индексами из database.INDEXES и без них.
+
+Результаты пишутся в JSON (--output), чтобы сравнивать выпуски между собой;
+--baseline печатает изменение p95 относительно прошлого файла.
+
+Пример:
+    python3 benchmarks/bench_database.py --orders 10000 100000 --concurrency 1 16 \\
+        --output bench-results.json --baseline bench-previous.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiosqlite
+
+from database import Database, INDEXES, OrderEventType
+from geo import geohash_encode, normalize_address
+
+STATUSES = ("pending", "in_progress", "long_repair", "completed", "completed", "cancelled", "refused")
+# Подстроки для поиска в list_orders (адрес или проблема)
+SEARCH_TERMS = ("Тестовая, д. 12", "кв. 5", "сливает", "нет такой строки")
+# Область координат (примерно Москва)
+LAT_RANGE = (55.55, 55.95)
+LON_RANGE = (37.35, 37.85)
+
+
+class Context:
+    """Параметры заполненной базы и объекты, созданные во время замеров"""
+
+    def __init__(self, orders: int, users: int, events: int):
+        self.orders = orders
+        self.users = users
+        self.events = events
+        self.created = []        # (order_id, user_id) новых заявок
+        self.attachments = []    # id новых вложений
+        self.counter = 0
+
+    def user_of(self, order_id: int) -> int:
+        return (order_id - 1) % self.users + 1
+
+    def next_id(self) -> int:
+        self.counter += 1
+        return self.counter
+
+
+def seed(db_path: str, orders: int, reports_per_order: int, orders_per_user: int) -> Context:
+    """Заполнение базы тестовыми данными пачками в одной транзакции"""
+    users = max(1, orders // orders_per_user)
+    rng = random.Random(42)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    def order_rows():
+        for i in range(orders):
+            address = f"ул. Тестовая, д. {i % 5000}, кв. {i % 97}"
+            if i % 10 < 7:
+                lat = rng.uniform(*LAT_RANGE)
+                lon = rng.uniform(*LON_RANGE)
+                geohash = geohash_encode(lat, lon)
+            else:
+                lat = lon = geohash = None
+            created_at = now - timedelta(minutes=rng.randrange(365 * 24 * 60))
+            yield (
+                i % users + 1, address, "10:00", "Стиральная машина", "Не сливает воду",
+                STATUSES[i % len(STATUSES)], created_at.strftime("%Y-%m-%d %H:%M:%S"),
+                normalize_address(address), lat, lon, geohash
+            )
+
+    def report_rows():
+        for order_id in range(1, orders + 1):
+            status = STATUSES[(order_id - 1) % len(STATUSES)]
+            if status == "pending":
+                continue
+            for _ in range(reports_per_order):
+                yield (order_id, status, 5000.0, 3000.0, 4000.0, "01.01.2030", "12:00", "Заменить насос")
+
+    def attachment_rows():
+        for order_id in range(1, orders + 1, 5):
+            yield (
+                order_id, (order_id - 1) % users + 1, "photo", f"file-{order_id}", f"u{order_id}",
+                120_000, f"thumb-{order_id}", f"{order_id:064x}" if order_id % 2 else None
+            )
+
+    conn = sqlite3.connect(db_path)
+    conn.executemany("""
+        INSERT INTO orders (user_id, address, time, equipment_type, problem, status, created_at,
+                            address_key, latitude, longitude, geohash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, order_rows())
+    conn.executemany("""
+        INSERT INTO reports (order_id, status, total_amount, cost_price, agreed_amount,
+                             completion_date, completion_time, what_to_do)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, report_rows())
+    conn.executemany("""
+        INSERT INTO attachments (order_id, user_id, kind, file_id, file_unique_id,
+                                 file_size, thumb_file_id, sha256)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, attachment_rows())
+    # Язык выбран у каждого второго пользователя
+    conn.executemany(
+        "INSERT INTO user_settings (user_id, locale) VALUES (?, ?)",
+        ((user_id, "en" if user_id % 3 == 0 else "ru") for user_id in range(1, users + 1, 2))
+    )
+    conn.execute("""
+        INSERT INTO order_events (order_id, user_id, event_type, payload)
+        SELECT id, user_id, ?, json_object('address', address, 'status', status)
+        FROM orders ORDER BY id
+    """, (OrderEventType.CREATED.value,))
+    events = conn.execute("SELECT MAX(seq) FROM order_events").fetchone()[0]
+    conn.commit()
+    conn.close()
+    return Context(orders, users, events)
+
+
+def drop_indexes(db_path: str):
+    """Удаление вторичных индексов (уникальные ограничения остаются)"""
+    conn = sqlite3.connect(db_path)
+    for name in INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    conn.commit()
+    conn.close()
+
+
+def random_point(rng: random.Random):
+    return rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+
+
+# Операции: (db, ctx, rng) -> корутина. Чтение работает по заполненным данным,
+# запись - по заявкам, созданным в create_order (заполненные данные не меняются).
+
+async def op_get_user_orders(db, ctx, rng):
+    await db.get_user_orders(rng.randint(1, ctx.users))
+
+
+async def op_get_completed_orders(db, ctx, rng):
+    await db.get_completed_orders(rng.randint(1, ctx.users))
+
+
+async def op_get_order(db, ctx, rng):
+    order_id = rng.randint(1, ctx.orders)
+    await db.get_order(order_id, ctx.user_of(order_id))
+
+
+async def op_get_order_by_id(db, ctx, rng):
+    await db.get_order_by_id(rng.randint(1, ctx.orders))
+
+
+async def op_list_orders(db, ctx, rng):
+    # Фильтр по статусу (idx_orders_status), страницы ближе к началу списка
+    await db.list_orders(status=rng.choice(STATUSES), limit=50, offset=50 * rng.randrange(10))
+
+
+async def op_list_orders_search(db, ctx, rng):
+    await db.list_orders(status=rng.choice((None,) + STATUSES), search=rng.choice(SEARCH_TERMS))
+
+
+async def op_get_workload(db, ctx, rng):
+    await db.get_workload()
+
+
+async def op_get_order_reports(db, ctx, rng):
+    await db.get_order_reports(rng.randint(1, ctx.orders))
+
+
+async def op_get_latest_reports(db, ctx, rng):
+    await db.get_latest_reports([rng.randint(1, ctx.orders) for _ in range(100)])
+
+
+async def op_get_attachments(db, ctx, rng):
+    await db.get_attachments(rng.randint(1, ctx.orders))
+
+
+async def op_get_first_attachments(db, ctx, rng):
+    await db.get_first_attachments([rng.randint(1, ctx.orders) for _ in range(100)])
+
+
+async def op_get_known_hash(db, ctx, rng):
+    await db.get_known_hash(f"u{rng.randint(1, ctx.orders)}")
+
+
+async def op_get_user_locale(db, ctx, rng):
+    await db.get_user_locale(rng.randint(1, ctx.users))
+
+
+async def op_find_duplicate_orders(db, ctx, rng):
+    await db.find_duplicate_orders(300)
+
+
+async def op_get_status_counts(db, ctx, rng):
+    await db.get_status_counts()
+
+
+async def op_get_events(db, ctx, rng):
+    await db.get_events(rng.randint(0, ctx.events), 100)
+
+
+async def op_get_orders_near(db, ctx, rng):
+    await db.get_orders_near(*random_point(rng), 1.0)
+
+
+async def op_create_order(db, ctx, rng):
+    user_id = rng.randint(1, ctx.users)
+    number = ctx.next_id()
+    order_id = await db.create_order(
+        user_id, f"ул. Новая, д. {number}", "12:00", "Холодильник", "Не морозит"
+    )
+    ctx.created.append((order_id, user_id))
+
+
+async def op_create_report(db, ctx, rng):
+    if not ctx.created:
+        return
+    order_id, _ = rng.choice(ctx.created)
+    await db.create_report(order_id, "long_repair", agreed_amount=1000.0,
+                           completion_date="01.01.2030", completion_time="12:00",
+                           what_to_do="Заказать деталь")
+
+
+async def op_add_attachment(db, ctx, rng):
+    if not ctx.created:
+        return
+    order_id, user_id = rng.choice(ctx.created)
+    number = ctx.next_id()
+    attachment_id = await db.add_attachment(
+        order_id, user_id, "photo", f"new-{number}", f"new-u{number}", 100_000, f"thumb-new-{number}"
+    )
+    if attachment_id is not None:
+        ctx.attachments.append(attachment_id)
+
+
+async def op_set_attachment_hash(db, ctx, rng):
+    if not ctx.attachments:
+        return
+    await db.set_attachment_hash(rng.choice(ctx.attachments), f"{ctx.next_id():064x}")
+
+
+async def op_set_order_location(db, ctx, rng):
+    if not ctx.created:
+        return
+    order_id, user_id = rng.choice(ctx.created)
+    await db.set_order_location(order_id, user_id, *random_point(rng))
+
+
+async def op_set_user_locale(db, ctx, rng):
+    await db.set_user_locale(rng.randint(1, ctx.users), rng.choice(("ru", "en")))
+
+
+async def op_delete_order(db, ctx, rng):
+    if not ctx.created:
+        return
+    order_id, user_id = ctx.created.pop()
+    await db.delete_order(order_id, user_id)
+
+
+# Порядок важен: операции записи используют заявки и вложения, созданные раньше
+OPERATIONS = {
+    "get_user_orders": op_get_user_orders,
+    "get_completed_orders": op_get_completed_orders,
+    "get_order": op_get_order,
+    "get_order_by_id": op_get_order_by_id,
+    "list_orders": op_list_orders,
+    "list_orders_search": op_list_orders_search,
+    "get_workload": op_get_workload,
+    "get_order_reports": op_get_order_reports,
+    "get_latest_reports": op_get_latest_reports,
+    "get_attachments": op_get_attachments,
+    "get_first_attachments": op_get_first_attachments,
+    "get_known_hash": op_get_known_hash,
+    "get_user_locale": op_get_user_locale,
+    "find_duplicate_orders": op_find_duplicate_orders,
+    "get_status_counts": op_get_status_counts,
+    "get_events": op_get_events,
+    "get_orders_near": op_get_orders_near,
+    "create_order": op_create_order,
+    "create_report": op_create_report,
+    "add_attachment": op_add_attachment,
+    "set_attachment_hash": op_set_attachment_hash,
+    "set_order_location": op_set_order_location,
+    "set_user_locale": op_set_user_locale,
+    "delete_order": op_delete_order,
+}
+
+# Смешанная нагрузка: доли операций примерно как у работающего бота
+MACRO_WEIGHTS = {
+    "get_user_orders": 25,
+    "get_order": 20,
+    "get_user_locale": 20,
+    "get_latest_reports": 10,
+    "get_order_reports": 10,
+    "get_first_attachments": 8,
+    "get_completed_orders": 5,
+    "get_status_counts": 2,
+    "list_orders": 2,
+    "get_workload": 1,
+    "get_orders_near": 5,
+    "create_order": 5,
+    "create_report": 5,
+    "add_attachment": 5,
+}
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, round(q * (len(sorted_values) - 1)))]
+
+
+async def run_load(db: Database, ctx: Context, pick, calls: int, concurrency: int, seed_value: int):
+    """calls вызовов из concurrency задач; pick(rng) выбирает операцию"""
+    latencies = []
+    errors = 0
+    remaining = calls
+
+    async def worker(worker_id: int):
+        nonlocal remaining, errors
+        rng = random.Random(seed_value * 1000 + worker_id)
+        while remaining > 0:
+            remaining -= 1
+            operation = pick(rng)
+            started = time.perf_counter()
+            try:
+                await operation(db, ctx, rng)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "calls": calls,
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "ops_per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+def result_key(result):
+    return (result["orders"], result["indexes"], result["connection"],
+            result["concurrency"], result["suite"], result["operation"])
+
+
+def print_row(result, baseline):
+    change = ""
+    previous = baseline.get(result_key(result))
+    if previous and previous["p95_ms"]:
+        change = f"{(result['p95_ms'] / previous['p95_ms'] - 1) * 100:+.0f}%"
+    print(f"{result['suite']:<6} {result['operation']:<22} {result['concurrency']:>4} "
+          f"{result['ops_per_sec']:>10.1f} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+          f"{result['p99_ms']:>9.2f} {result['errors']:>6} {change:>8}")
+
+
+async def run_config(db_path, ctx, args, connection, indexes, baseline):
+    """Все замеры для одного сочетания размера базы, соединений и индексов"""
+    pool_size = args.pool_size if connection == "pool" else 0
+    db = Database(db_path, pool_size=pool_size)
+    results = []
+    operations = [name for name in OPERATIONS if not args.operations or name in args.operations]
+    macro = [(name, weight) for name, weight in MACRO_WEIGHTS.items() if name in operations]
+
+    print(f"\n== заявок: {ctx.orders}, соединения: {connection}"
+          f"{f' ({pool_size})' if pool_size else ''}, индексы: {'да' if indexes else 'нет'}")
+    print(f"{'набор':<6} {'операция':<22} {'задач':>4} {'опер/с':>10} {'p50, мс':>9} "
+          f"{'p95, мс':>9} {'p99, мс':>9} {'ошибок':>6} {'p95 Δ':>8}")
+    try:
+        for concurrency in args.concurrency:
+            base = {"orders": ctx.orders, "indexes": indexes, "connection": connection,
+                    "pool_size": pool_size, "concurrency": concurrency}
+            for number, name in enumerate(operations):
+                operation = OPERATIONS[name]
+                stats = await run_load(db, ctx, lambda rng: operation, args.calls,
+                                       concurrency, number)
+                result = {**base, "suite": "micro", "operation": name, **stats}
+                results.append(result)
+                print_row(result, baseline)
+
+            if macro:
+                names = [OPERATIONS[name] for name, _ in macro]
+                weights = [weight for _, weight in macro]
+                stats = await run_load(
+                    db, ctx, lambda rng: rng.choices(names, weights)[0],
+                    args.calls * args.macro_factor, concurrency, len(OPERATIONS)
+                )
+                result = {**base, "suite": "macro", "operation": "mixed", **stats}
+                results.append(result)
+                print_row(result, baseline)
+    finally:
+        await db.close()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def load_baseline(path):
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return {result_key(result): result for result in json.load(f)["results"]}
+
+
+async def run(args):
+    baseline = load_baseline(args.baseline)
+    connections = [c for c in ("per_call", "pool") if c in args.connections]
+    index_modes = [True] if args.skip_unindexed else [True, False]
+    results = []
+
+    for orders in args.orders:
+        with tempfile.TemporaryDirectory(dir=args.tmpdir) as tmp:
+            db_path = os.path.join(tmp, "bench.db")
+            await Database(db_path).init_db()
+            started = time.perf_counter()
+            ctx = seed(db_path, orders, args.reports_per_order, args.orders_per_user)
+            # Повторная инициализация пересчитывает счетчики статусов
+            await Database(db_path).init_db()
+            print(f"\nЗаполнено заявок: {orders} за {time.perf_counter() - started:.1f} с, "
+                  f"размер базы {os.path.getsize(db_path) / 2**20:.1f} МБ")
+
+            for indexes in index_modes:
+                if not indexes:
+                    drop_indexes(db_path)
+                for connection in connections:
+                    results.extend(await run_config(db_path, ctx, args, connection, indexes, baseline))
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "aiosqlite": getattr(aiosqlite, "__version__", None),
+            "platform": platform.platform(),
+            "args": {key: value for key, value in vars(args).items() if key != "tmpdir"},
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки database.Database")
+    parser.add_argument("--orders", type=int, nargs="+", default=[10_000],
+                        help="размеры базы (количество заявок), например 10000 100000 1000000")
+    parser.add_argument("--reports-per-order", type=int, default=2,
+                        help="отчетов на каждую заявку не в статусе pending")
+    parser.add_argument("--orders-per-user", type=int, default=200,
+                        help="заявок на одного техника")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32],
+                        help="количество конкурентных задач asyncio")
+    parser.add_argument("--calls", type=int, default=200, help="вызовов каждой операции")
+    parser.add_argument("--macro-factor", type=int, default=5,
+                        help="во сколько раз больше вызовов в смешанной нагрузке")
+    parser.add_argument("--pool-size", type=int, default=8, help="размер пула соединений")
+    parser.add_argument("--connections", nargs="+", default=["per_call", "pool"],
+                        choices=["per_call", "pool"], help="режимы соединений")
+    parser.add_argument("--skip-unindexed", action="store_true", help="не измерять без индексов")
+    parser.add_argument("--operations", nargs="+", choices=list(OPERATIONS),
+                        help="только указанные операции")
+    parser.add_argument("--output", help="файл для результатов в формате JSON")
+    parser.add_argument("--baseline", help="JSON прошлого запуска для сравнения p95")
+    parser.add_argument("--tmpdir", help="каталог для временной базы (нужно место для 10^6 заявок)")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Сравнение памяти и времени: строки как dict (aiosqlite.Row -> dict) против
+типизированных записей Order, которые строит row_factory из database.py.
+
+Пример:
+    python3 benchmarks/bench_records.py --rows 100000
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiosqlite
+
+from database import Database, ORDER_COLUMNS, _order_factory
+
+
+def seed(db_path: str, rows: int):
+    """Заполнение базы тестовыми заявками одной транзакцией"""
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO orders (user_id, address, time, equipment_type, problem, status) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (1, f"ул. Ленина, д. {i % 300}, кв. {i % 97}", "10:00", "Стиральная машина",
+             "Не сливает воду", "pending" if i % 3 else "long_repair")
+            for i in range(rows)
+        )
+    )
+    conn.commit()
+    conn.close()
+
+
+async def load_dicts(db_path: str):
+    """Старый способ: aiosqlite.Row и dict(row) для каждой строки"""
+    async with aiosqlite.connect(db_path) as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute("SELECT * FROM orders WHERE user_id = ?", (1,)) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
+
+async def load_records(db_path: str):
+    """Новый способ: записи Order строятся прямо в row_factory"""
+    async with aiosqlite.connect(db_path) as db:
+        db.row_factory = _order_factory
+        async with db.execute(
+            f"SELECT {ORDER_COLUMNS} FROM orders WHERE user_id = ?", (1,)
+        ) as cursor:
+            return await cursor.fetchall()
+
+
+def measure(loader, db_path: str):
+    """Время загрузки, пик выделенной памяти и память, удерживаемая результатом"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = asyncio.run(loader(db_path))
+    elapsed = time.perf_counter() - started
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(result), elapsed, retained, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память и время: dict против Order")
+    parser.add_argument("--rows", type=int, default=100_000, help="количество заявок")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        asyncio.run(Database(db_path).init_db())
+        seed(db_path, args.rows)
+
+        print(f"{'способ':<10} {'строк':>8} {'время, с':>10} {'удержано, МБ':>14} {'пик, МБ':>10}")
+        for name, loader in (("dict", load_dicts), ("Order", load_records)):
+            count, elapsed, retained, peak = measure(loader, db_path)
+            print(f"{name:<10} {count:>8} {elapsed:>10.3f} "
+                  f"{retained / 2**20:>14.1f} {peak / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,249 @@
 import asyncio
-import os
 import logging
 import sys
-from aiogram import Bot, Dispatcher, F
-from aiogram.filters import Command
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, Optional
+from aiogram import BaseMiddleware, Bot, Dispatcher, F, Router
+from aiogram.filters import Command, StateFilter
+from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, InputMediaPhoto, TelegramObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.exceptions import TelegramAPIError
-from dotenv import load_dotenv
-from database import Database, OrderStatus
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('bot.log', encoding='utf-8')
-    ]
-)
+from database import Database, OrderStatus, InvalidTransitionError, is_final
+from executor import JobExecutor, LoopLagMonitor, ExecutorBusyError, JobAbortedError, JobTimeoutError
+from rendering import render_active_orders, render_completed_orders, render_route
+from agenda import is_due_on, plan_route
+from geo import haversine_km
+from backup import BackupManager
+from deadletter import DeadLetter, DeadLetterStore, RetryWorker, KIND_CREATE_ORDER, KIND_CREATE_REPORT
+from media_cache import MediaCache
+from idempotency import RecentKeys, order_key
+from i18n import Catalog, LocaleResolver, Translator, STATUS_EMOJI, get_catalog
+from admin_api import AdminApi
+from settings import LOG_FORMAT, Settings, SettingsError, SettingsManager, configure_logging
+from monitoring import InflightMiddleware, Watchdog, SamplingProfiler, format_snapshot, hot_stacks
+
 logger = logging.getLogger(__name__)
 
-load_dotenv()
+# Обработчики регистрируются в router при импорте, а настройки, соединения и
+# остальные компоненты создаются в setup() при запуске. Рабочие процессы пула
+# (spawn) импортируют этот модуль как __mp_main__ и не должны ни читать
+# настройки, ни открывать журнал, базу и сессию бота.
+router = Router()
+
+# Настройки (см. settings.py) перечитываются по SIGHUP и при изменении .env;
+# config - значения на момент запуска, в обработчиках - settings.current
+settings: SettingsManager
+config: Settings
+bot: Bot
+dp: Dispatcher
+db: Database
+catalog: Catalog
+locales: LocaleResolver
+executor: JobExecutor
+loop_lag: LoopLagMonitor
+recent_order_keys: RecentKeys
+inflight: InflightMiddleware
+watchdog: Watchdog
+profiler: SamplingProfiler
+backups: BackupManager
+dead_letters: DeadLetterStore
+media_cache: Optional[MediaCache]
+admin_api: Optional[AdminApi]
+retry_worker: RetryWorker
+
+# Ссылки на фоновые задачи, чтобы их не удалил сборщик мусора
+background_tasks = set()
+# Задача резервного копирования по расписанию (см. schedule_backups)
+backup_task = None
+
+
+def spawn_background(coro) -> asyncio.Task:
+    """Запуск фоновой задачи с сохранением ссылки до ее завершения"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+async def on_replay_success(item: DeadLetter, result):
+    """Уведомление пользователя об успешной отложенной записи"""
+    t = await locales.translator_for(item.user_id)
+    if item.kind == KIND_CREATE_ORDER:
+        if item.payload.get("idempotency_key"):
+            recent_order_keys.put(item.payload["idempotency_key"], result)
+        text = t(
+            "order.replayed",
+            order_id=result,
+            address=item.payload["address"],
+            time=item.payload["time"],
+            equipment_type=item.payload["equipment_type"],
+            problem=item.payload["problem"]
+        )
+    else:
+        text = t("report.replayed", order_id=item.payload["order_id"])
+    try:
+        await bot.send_message(item.chat_id, text)
+    except TelegramAPIError as e:
+        logger.warning(f"Не удалось уведомить пользователя {item.user_id}: {e}")
+
+
+async def on_replay_failure(item: DeadLetter, error: Exception):
+    """Уведомление пользователя о том, что отложенную запись сохранить не удалось"""
+    t = await locales.translator_for(item.user_id)
+    key = "order.replay_failed" if item.kind == KIND_CREATE_ORDER else "report.replay_failed"
+    try:
+        await bot.send_message(item.chat_id, t(key, error=error))
+    except TelegramAPIError as e:
+        logger.warning(f"Не удалось уведомить пользователя {item.user_id}: {e}")
+
+
+def schedule_backups(interval_hours: float):
+    """(Пере)запуск резервного копирования по расписанию; 0 - отключить"""
+    global backup_task
+    if backup_task is not None:
+        backup_task.cancel()
+        backup_task = None
+    if interval_hours > 0:
+        backup_task = spawn_background(backups.run_periodically(interval_hours))
+
+
+async def apply_settings(new: Settings, changed):
+    """Применение перечитанных настроек к работающим компонентам"""
+    if changed.keys() & {"log_level", "log_file"}:
+        configure_logging(new)
+    if "database_pool_size" in changed:
+        await db.resize_pool(new.database_pool_size)
+    if "executor_workers" in changed:
+        executor.resize(new.executor_workers)
+    executor.max_pending = new.executor_max_pending
+    executor.job_timeout = new.executor_job_timeout
+    recent_order_keys.resize(new.idempotency_cache_size)
+    watchdog.interval = new.watchdog_interval
+    profiler.output_dir = new.profile_dir
+    backups.backup_dir = new.backup_dir
+    backups.keep = new.backup_keep
+    backups.compress = new.backup_compress
+    backups.pages_per_step = new.backup_pages_per_step
+    if "backup_interval_hours" in changed:
+        schedule_backups(new.backup_interval_hours)
+    retry_worker.base_delay = new.dlq_base_delay
+    retry_worker.max_delay = new.dlq_max_delay
+    retry_worker.max_attempts = new.dlq_max_attempts
+    if media_cache is not None:
+        media_cache.max_bytes = new.media_cache_max_mb * 2**20
+    if admin_api is not None and "admin_api_cache_ttl" in changed:
+        admin_api.cache.ttl = new.admin_api_cache_ttl
+        admin_api.cache.clear()
+
+
+class LocaleMiddleware(BaseMiddleware):
+    """Передает обработчикам t - функцию перевода на язык пользователя"""
+
+    def __init__(self, resolver: LocaleResolver):
+        self.resolver = resolver
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        data["t"] = await self.resolver.translator_for(
+            user.id if user else None, user.language_code if user else None
+        )
+        return await handler(event, data)
+
 
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-DATABASE_PATH = os.getenv("DATABASE_PATH", "orders.db")
+def setup() -> Dispatcher:
+    """Чтение настроек и создание компонентов бота"""
+    global settings, config, bot, dp, db, catalog, locales, executor, loop_lag
+    global recent_order_keys, inflight, watchdog, profiler, backups, dead_letters
+    global media_cache, admin_api, retry_worker
+    try:
+        settings = SettingsManager()
+    except SettingsError as e:
+        logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+        logger.error(f"Ошибка в настройках: {e}")
+        raise
+    config = settings.current
+    configure_logging(config)
+
+    bot = Bot(token=config.bot_token)
+    dp = Dispatcher(storage=MemoryStorage())
+    db = Database(config.database_path, pool_size=config.database_pool_size)
+    # Шаблоны сообщений компилируются один раз при запуске
+    catalog = get_catalog()
+    locales = LocaleResolver(catalog, db)
+    dp.message.middleware(LocaleMiddleware(locales))
+    executor = JobExecutor(
+        max_workers=config.executor_workers,
+        max_pending=config.executor_max_pending,
+        job_timeout=config.executor_job_timeout
+    )
+    loop_lag = LoopLagMonitor()
+    recent_order_keys = RecentKeys(config.idempotency_cache_size)
+    inflight = InflightMiddleware()
+    dp.message.middleware(inflight)
+    watchdog = Watchdog(loop_lag, inflight, interval=config.watchdog_interval)
+    profiler = SamplingProfiler(config.profile_dir)
+    backups = BackupManager(
+        config.database_path,
+        config.backup_dir,
+        pages_per_step=config.backup_pages_per_step,
+        keep=config.backup_keep,
+        compress=config.backup_compress
+    )
+    dead_letters = DeadLetterStore(config.dead_letter_path)
+    media_cache = MediaCache(
+        bot, config.media_cache_dir, config.media_cache_max_mb * 2**20
+    ) if config.media_cache_dir else None
+    # Отдельное постоянное соединение только для чтения: запросы API не занимают
+    # соединения бота и не блокируют его запись
+    admin_api = AdminApi(
+        Database(config.database_path, pool_size=1, read_only=True),
+        config.admin_api_token,
+        cache_ttl=config.admin_api_cache_ttl
+    ) if config.admin_api_token else None
+    retry_worker = RetryWorker(
+        dead_letters,
+        db,
+        on_success=on_replay_success,
+        on_failure=on_replay_failure,
+        base_delay=config.dlq_base_delay,
+        max_delay=config.dlq_max_delay,
+        max_attempts=config.dlq_max_attempts
+    )
 
-if not BOT_TOKEN:
-    logger.error("BOT_TOKEN не установлен в .env файле")
-    raise ValueError("BOT_TOKEN не установлен в .env файле")
+    settings.subscribe(apply_settings)
+    dp.include_router(router)
+    return dp
 
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
-db = Database(DATABASE_PATH)
+
+async def defer_failed_write(message: Message, state: FSMContext, kind: str, payload, error) -> bool:
+    """Сохранение неудавшейся записи в очередь повторов вместе с данными FSM.
+
+    Возвращает False, если сохранить не удалось и данные пользователя потеряны.
+    """
+    if payload is None:
+        return False
+    try:
+        item_id = await dead_letters.add(
+            kind,
+            message.from_user.id,
+            message.chat.id,
+            payload,
+            await state.get_data(),
+            repr(error),
+            delay=settings.current.dlq_base_delay
+        )
+    except Exception as e:
+        logger.exception(f"Не удалось сохранить запись в очередь повторов: {e}")
+        return False
+    logger.warning(f"Запись {kind} отложена (#{item_id}): {error}")
+    return True
 
 
 class OrderStates(StatesGroup):
@@ -58,445 +267,603 @@ class ReportStates(StatesGroup):
     waiting_what_to_do = State()
 
 
+class AttachStates(StatesGroup):
+    """Состояния для добавления фото к заявке или отчету"""
+    waiting_order_id = State()
+    waiting_target = State()
+    waiting_photos = State()
+
+
+class LocationStates(StatesGroup):
+    """Состояния для указания координат заявки"""
+    waiting_order_id = State()
+    waiting_location = State()
+
+
+class RouteStates(StatesGroup):
+    """Состояния для построения маршрута на день"""
+    waiting_start = State()
+
+
 class DeleteOrderStates(StatesGroup):
     """Состояния для удаления заявки"""
     waiting_order_id = State()
     waiting_confirmation = State()
 
 
-def get_main_keyboard():
+# Кнопки статусов отчета -> статус заявки
+REPORT_STATUS_BUTTONS = {
+    "button.status.in_progress": "in_progress",
+    "button.status.long_repair": "long_repair",
+    "button.status.completed": "completed",
+    "button.status.cancelled": "cancelled",
+    "button.status.refused": "refused"
+}
+
+
+def button(key: str):
+    """Фильтр кнопки: текст кнопки на любом из языков"""
+    return F.text.func(lambda text: get_catalog().matches(text, key))
+
+
+def transition_error(t: Translator, e: InvalidTransitionError) -> str:
+    """Текст ошибки смены статуса на языке пользователя"""
+    if e.current_status is None:
+        return t("common.order_not_found_id", order_id=e.order_id)
+    return t(
+        "common.invalid_transition",
+        order_id=e.order_id,
+        current=t(f"status.{e.current_status}"),
+        new=t(f"status.{e.new_status}")
+    )
+
+
+def get_main_keyboard(t: Translator):
     """Главная клавиатура"""
     return ReplyKeyboardMarkup(
         keyboard=[
-            [KeyboardButton(text="📝 Новая заявка"), KeyboardButton(text="📋 Мои заявки")],
-            [KeyboardButton(text="✅ Завершенные заявки"), KeyboardButton(text="📊 Создать отчет")],
-            [KeyboardButton(text="🗑️ Удалить заявку")]
+            [KeyboardButton(text=t("button.new_order")), KeyboardButton(text=t("button.my_orders"))],
+            [KeyboardButton(text=t("button.completed_orders")), KeyboardButton(text=t("button.report"))],
+            [KeyboardButton(text=t("button.attach")), KeyboardButton(text=t("button.delete_order"))],
+            [KeyboardButton(text=t("button.route"))]
         ],
         resize_keyboard=True
     )
 
 
-def get_confirmation_keyboard():
+def get_confirmation_keyboard(t: Translator):
     """Клавиатура подтверждения удаления"""
     return ReplyKeyboardMarkup(
         keyboard=[
-            [KeyboardButton(text="✅ Да, удалить"), KeyboardButton(text="❌ Отмена")]
+            [KeyboardButton(text=t("button.confirm_delete")), KeyboardButton(text=t("button.cancel"))]
         ],
         resize_keyboard=True
     )
 
 
-def get_report_status_keyboard():
-    """Клавиатура выбора статуса отчета"""
+def get_attach_target_keyboard(t: Translator):
+    """Клавиатура выбора: фото к заявке или к последнему отчету"""
     return ReplyKeyboardMarkup(
         keyboard=[
-            [KeyboardButton(text="⏳ Длительный ремонт")],
-            [KeyboardButton(text="✅ Завершен")],
-            [KeyboardButton(text="❌ Отмена")],
-            [KeyboardButton(text="🚫 Отказ")],
-            [KeyboardButton(text="🔙 Назад")]
+            [KeyboardButton(text=t("button.attach_to_order")), KeyboardButton(text=t("button.attach_to_report"))]
         ],
         resize_keyboard=True
     )
 
 
-@dp.message(Command("start"))
-async def cmd_start(message: Message):
+def get_attach_done_keyboard(t: Translator):
+    """Клавиатура завершения добавления фото"""
+    return ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=t("button.done"))]],
+        resize_keyboard=True
+    )
+
+
+def get_location_keyboard(t: Translator, alternative_key: str):
+    """Клавиатура с кнопкой отправки геопозиции"""
+    return ReplyKeyboardMarkup(
+        keyboard=[
+            [KeyboardButton(text=t("button.send_location"), request_location=True)],
+            [KeyboardButton(text=t(alternative_key))]
+        ],
+        resize_keyboard=True
+    )
+
+
+def get_report_status_keyboard(t: Translator):
+    """Клавиатура выбора статуса отчета"""
+    return ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=t(key))] for key in REPORT_STATUS_BUTTONS]
+        + [[KeyboardButton(text=t("button.back"))]],
+        resize_keyboard=True
+    )
+
+
+@router.message(Command("start"))
+async def cmd_start(message: Message, t: Translator):
     """Обработчик команды /start"""
-    await message.answer(
-        "👋 Добро пожаловать в бот управления заявками!\n\n"
-        "Вы можете:\n"
-        "• Создать новую заявку\n"
-        "• Просмотреть активные заявки\n"
-        "• Просмотреть завершенные заявки\n"
-        "• Создать отчет по заявке",
-        reply_markup=get_main_keyboard()
+    await message.answer(t("start.welcome"), reply_markup=get_main_keyboard(t))
+
+
+@router.message(Command("lang"))
+async def cmd_lang(message: Message, t: Translator):
+    """Выбор языка интерфейса: /lang [код]"""
+    args = (message.text or "").split()[1:]
+    available = ", ".join(
+        f"{code} ({catalog.translator(code)('language.name')})" for code in catalog.locales
     )
+    if not args:
+        await message.answer(t("lang.current", name=t("language.name"), available=available))
+        return
+
+    code = args[0].lower()
+    if code not in catalog:
+        await message.answer(t("lang.unknown", code=code, available=available))
+        return
+    try:
+        await locales.choose(message.from_user.id, code)
+    except Exception as e:
+        logger.exception(f"Ошибка при сохранении языка: {e}")
+        await message.answer(t("lang.error"))
+        return
+    t = catalog.translator(code)
+    await message.answer(t("lang.changed", name=t("language.name")), reply_markup=get_main_keyboard(t))
 
 
-@dp.message(F.text == "📝 Новая заявка")
-@dp.message(Command("new_order"))
-async def cmd_new_order(message: Message, state: FSMContext):
+@router.message(button("button.new_order"))
+@router.message(Command("new_order"))
+async def cmd_new_order(message: Message, state: FSMContext, t: Translator):
     """Начало создания новой заявки"""
+    # Номер сообщения, начавшего сценарий, входит в ключ идемпотентности:
+    # одинаковые заявки из разных сценариев не считаются повтором
+    await state.set_data({"flow_id": message.message_id})
     await state.set_state(OrderStates.waiting_address)
-    await message.answer(
-        "📝 Создание новой заявки\n\n"
-        "Введите адрес:",
-        reply_markup=ReplyKeyboardRemove()
-    )
+    await message.answer(t("order.start"), reply_markup=ReplyKeyboardRemove())
 
 
-@dp.message(OrderStates.waiting_address)
-async def process_address(message: Message, state: FSMContext):
+@router.message(OrderStates.waiting_address)
+async def process_address(message: Message, state: FSMContext, t: Translator):
     """Обработка адреса"""
-    await state.update_data(address=message.text)
+    if message.venue:
+        # Место из Telegram: есть и адрес, и координаты
+        await state.update_data(
+            address=message.venue.address or message.venue.title,
+            latitude=message.venue.location.latitude,
+            longitude=message.venue.location.longitude
+        )
+    elif message.location:
+        await state.update_data(
+            latitude=message.location.latitude,
+            longitude=message.location.longitude
+        )
+        await message.answer(t("order.location_saved"))
+        return
+    elif not message.text:
+        await message.answer(t("order.ask_address_text"))
+        return
+    else:
+        await state.update_data(address=message.text)
     await state.set_state(OrderStates.waiting_time)
-    await message.answer("Введите время:")
+    await message.answer(t("order.ask_time"))
 
 
-@dp.message(OrderStates.waiting_time)
-async def process_time(message: Message, state: FSMContext):
+@router.message(OrderStates.waiting_time)
+async def process_time(message: Message, state: FSMContext, t: Translator):
     """Обработка времени"""
     await state.update_data(time=message.text)
     await state.set_state(OrderStates.waiting_equipment)
-    await message.answer("Введите тип техники:")
+    await message.answer(t("order.ask_equipment"))
 
 
-@dp.message(OrderStates.waiting_equipment)
-async def process_equipment(message: Message, state: FSMContext):
+@router.message(OrderStates.waiting_equipment)
+async def process_equipment(message: Message, state: FSMContext, t: Translator):
     """Обработка типа техники"""
     await state.update_data(equipment_type=message.text)
     await state.set_state(OrderStates.waiting_problem)
-    await message.answer("Опишите проблему:")
+    await message.answer(t("order.ask_problem"))
 
 
-@dp.message(OrderStates.waiting_problem)
-async def process_problem(message: Message, state: FSMContext):
+@router.message(OrderStates.waiting_problem)
+async def process_problem(message: Message, state: FSMContext, t: Translator):
     """Обработка проблемы и сохранение заявки"""
-    try:
-        data = await state.get_data()
-        data["problem"] = message.text
-        
-        order_id = await db.create_order(
-            user_id=message.from_user.id,
-            address=data["address"],
-            time=data["time"],
-            equipment_type=data["equipment_type"],
-            problem=data["problem"]
-        )
-        
+    data = await state.get_data()
+    data["problem"] = message.text
+    key = order_key(message.from_user.id, data.get("flow_id"), data["address"],
+                    data["time"], data["equipment_type"], data["problem"])
+
+    # Повтор того же сообщения (двойное нажатие, повторная доставка)
+    existing_id = recent_order_keys.get(key)
+    if existing_id is not None:
         await state.clear()
         await message.answer(
-            f"✅ Заявка #{order_id} успешно создана!\n\n"
-            f"Адрес: {data['address']}\n"
-            f"Время: {data['time']}\n"
-            f"Тип техники: {data['equipment_type']}\n"
-            f"Проблема: {data['problem']}",
-            reply_markup=get_main_keyboard()
+            t("order.already_created", order_id=existing_id),
+            reply_markup=get_main_keyboard(t)
         )
+        return
+
+    payload = dict(
+        user_id=message.from_user.id,
+        address=data["address"],
+        time=data["time"],
+        equipment_type=data["equipment_type"],
+        problem=data["problem"],
+        latitude=data.get("latitude"),
+        longitude=data.get("longitude"),
+        idempotency_key=key
+    )
+    # В очередь повторов попадает только неудавшаяся запись: ошибка отправки
+    # ответа после записи не должна приводить к ее повтору
+    try:
+        order_id = await db.create_order(**payload)
     except Exception as e:
         logger.exception(f"Ошибка при создании заявки: {e}")
+        deferred = await defer_failed_write(message, state, KIND_CREATE_ORDER, payload, e)
         await state.clear()
-        await message.answer(
-            "❌ Произошла ошибка при создании заявки. Попробуйте еще раз.",
-            reply_markup=get_main_keyboard()
+        if deferred:
+            await message.answer(t("order.deferred"), reply_markup=get_main_keyboard(t))
+            return
+        await message.answer(t("order.create_error"), reply_markup=get_main_keyboard(t))
+        return
+    recent_order_keys.put(key, order_id)
+
+    await state.clear()
+    await message.answer(
+        t(
+            "order.created",
+            order_id=order_id,
+            address=data["address"],
+            time=data["time"],
+            equipment_type=data["equipment_type"],
+            problem=data["problem"]
+        ),
+        reply_markup=get_main_keyboard(t)
+    )
+
+
+async def deliver_rendered(message: Message, t: Translator, render_func, orders, latest_reports):
+    """Формирование списка в пуле процессов и отправка результата"""
+    try:
+        chunks = await executor.submit(render_func, orders, latest_reports, t.locale)
+    except ExecutorBusyError:
+        await message.answer(t("list.busy"), reply_markup=get_main_keyboard(t))
+        return
+    except JobTimeoutError as e:
+        logger.error(f"Превышено время формирования списка: {e}")
+        await message.answer(t("list.timeout"), reply_markup=get_main_keyboard(t))
+        return
+    except JobAbortedError as e:
+        logger.error(f"Формирование списка прервано: {e}")
+        await message.answer(t("list.aborted"), reply_markup=get_main_keyboard(t))
+        return
+    except Exception as e:
+        logger.exception(f"Ошибка при формировании списка: {e}")
+        await message.answer(t("list.render_error"), reply_markup=get_main_keyboard(t))
+        return
+
+    for chunk in chunks:
+        await message.answer(chunk, reply_markup=get_main_keyboard(t))
+    await send_thumbnails(message, t, orders)
+
+
+async def send_thumbnails(message: Message, t: Translator, orders):
+    """Миниатюры первых фото заявок из списка (не больше 10 - лимит альбома)"""
+    try:
+        first = await db.get_first_attachments([order.id for order in orders])
+    except Exception as e:
+        logger.exception(f"Ошибка при получении вложений: {e}")
+        return
+    media = [
+        InputMediaPhoto(
+            media=first[order.id].thumb_file_id, caption=t("common.order_caption", order_id=order.id)
         )
+        for order in orders
+        if order.id in first and first[order.id].thumb_file_id
+    ][:10]
+    try:
+        if len(media) == 1:
+            await message.answer_photo(media[0].media, caption=media[0].caption)
+        elif media:
+            await message.answer_media_group(media)
+    except TelegramAPIError as e:
+        logger.warning(f"Не удалось отправить миниатюры: {e}")
+
+
+async def send_order_list(message: Message, t: Translator, render_func, orders, latest_reports):
+    """Отправка списка заявок.
+
+    Небольшие списки формируются сразу, большие - в пуле процессов: пользователь
+    получает подтверждение немедленно, а список приходит следующим сообщением.
+    """
+    if len(orders) < settings.current.heavy_list_threshold:
+        for chunk in render_func(orders, latest_reports, t.locale):
+            await message.answer(chunk, reply_markup=get_main_keyboard(t))
+        await send_thumbnails(message, t, orders)
+        return
+
+    await message.answer(t("list.preparing", count=len(orders)))
+    spawn_background(deliver_rendered(message, t, render_func, orders, latest_reports))
 
 
-@dp.message(F.text == "📋 Мои заявки")
-@dp.message(Command("my_orders"))
-async def cmd_my_orders(message: Message):
+@router.message(button("button.my_orders"))
+@router.message(Command("my_orders"))
+async def cmd_my_orders(message: Message, t: Translator):
     """Просмотр активных заявок пользователя (исключая завершенные)"""
     try:
         orders = await db.get_user_orders(message.from_user.id, exclude_completed=True)
         
         if not orders:
-            await message.answer("У вас нет активных заявок.", reply_markup=get_main_keyboard())
+            await message.answer(t("list.no_active"), reply_markup=get_main_keyboard(t))
             return
+
+        # Отчеты нужны только для длительного ремонта
+        latest_reports = await db.get_latest_reports(
+            [order.id for order in orders if order.status == "long_repair"]
+        )
     except Exception as e:
         logger.exception(f"Ошибка при получении заявок: {e}")
         await message.answer(
-            "❌ Произошла ошибка при получении заявок. Попробуйте позже.",
-            reply_markup=get_main_keyboard()
+            t("list.fetch_error"),
+            reply_markup=get_main_keyboard(t)
         )
         return
     
-    text = "📋 Ваши активные заявки:\n\n"
-    for order in orders:
-        status_emoji = {
-            "pending": "⏳",
-            "in_progress": "🔧",
-            "long_repair": "⏳",
-            "completed": "✅",
-            "cancelled": "❌",
-            "refused": "🚫"
-        }.get(order["status"], "❓")
-        
-        text += (
-            f"{status_emoji} Заявка #{order['id']}\n"
-            f"Адрес: {order['address']}\n"
-            f"Время: {order['time']}\n"
-            f"Техника: {order['equipment_type']}\n"
-            f"Проблема: {order['problem']}\n"
-            f"Статус: {order['status']}\n"
-        )
-        
-        # Если это длительный ремонт, показываем информацию из отчета
-        if order["status"] == "long_repair":
-            reports = await db.get_order_reports(order["id"])
-            latest_report = reports[0] if reports else None
-            if latest_report:
-                text += (
-                    f"Сумма согласования: {latest_report.get('agreed_amount', 0)} руб.\n"
-                    f"Дата завершения: {latest_report.get('completion_date', 'не указана')}\n"
-                    f"Время завершения: {latest_report.get('completion_time', 'не указано')}\n"
-                    f"Что нужно сделать: {latest_report.get('what_to_do', 'не указано')}\n"
-                )
-        
-        text += "\n"
-    
-    await message.answer(text, reply_markup=get_main_keyboard())
+    await send_order_list(message, t, render_active_orders, orders, latest_reports)
 
 
-@dp.message(F.text == "✅ Завершенные заявки")
-@dp.message(Command("completed_orders"))
-async def cmd_completed_orders(message: Message):
+@router.message(button("button.completed_orders"))
+@router.message(Command("completed_orders"))
+async def cmd_completed_orders(message: Message, t: Translator):
     """Просмотр завершенных заявок пользователя"""
     try:
         orders = await db.get_completed_orders(message.from_user.id)
         
         if not orders:
-            await message.answer("У вас нет завершенных заявок.", reply_markup=get_main_keyboard())
+            await message.answer(t("list.no_completed"), reply_markup=get_main_keyboard(t))
             return
+
+        latest_reports = await db.get_latest_reports([order.id for order in orders])
     except Exception as e:
         logger.exception(f"Ошибка при получении завершенных заявок: {e}")
         await message.answer(
-            "❌ Произошла ошибка при получении заявок. Попробуйте позже.",
-            reply_markup=get_main_keyboard()
+            t("list.fetch_error"),
+            reply_markup=get_main_keyboard(t)
         )
         return
     
-    text = "✅ Завершенные заявки:\n\n"
-    for order in orders:
-        # Получаем отчеты для каждой заявки
-        reports = await db.get_order_reports(order["id"])
-        latest_report = reports[0] if reports else None
-        
-        text += (
-            f"✅ Заявка #{order['id']}\n"
-            f"Адрес: {order['address']}\n"
-            f"Время: {order['time']}\n"
-            f"Техника: {order['equipment_type']}\n"
-            f"Проблема: {order['problem']}\n"
-        )
-        
-        if latest_report and latest_report.get("total_amount"):
-            text += (
-                f"Общая сумма: {latest_report['total_amount']} руб.\n"
-                f"Себестоимость: {latest_report.get('cost_price', 0)} руб.\n"
-            )
-        
-        text += "\n"
-    
-    await message.answer(text, reply_markup=get_main_keyboard())
+    await send_order_list(message, t, render_completed_orders, orders, latest_reports)
 
 
-@dp.message(F.text == "📊 Создать отчет")
-@dp.message(Command("report"))
-async def cmd_report(message: Message, state: FSMContext):
+@router.message(button("button.report"))
+@router.message(Command("report"))
+async def cmd_report(message: Message, state: FSMContext, t: Translator):
     """Начало создания отчета"""
     await state.set_state(ReportStates.waiting_order_id)
-    await message.answer(
-        "📊 Создание отчета\n\n"
-        "Введите номер заявки:",
-        reply_markup=ReplyKeyboardRemove()
-    )
+    await message.answer(t("report.start"), reply_markup=ReplyKeyboardRemove())
 
 
-@dp.message(ReportStates.waiting_order_id)
-async def process_order_id(message: Message, state: FSMContext):
+@router.message(ReportStates.waiting_order_id)
+async def process_order_id(message: Message, state: FSMContext, t: Translator):
     """Обработка номера заявки"""
     try:
         order_id = int(message.text)
         order = await db.get_order(order_id, message.from_user.id)
         
         if not order:
-            await message.answer("❌ Заявка не найдена. Проверьте номер заявки.")
+            await message.answer(t("common.order_not_found"))
+            return
+
+        if is_final(order.status):
+            await message.answer(
+                t("report.order_closed", order_id=order_id, status=t(f"status.{order.status}"))
+            )
             return
         
         await state.update_data(order_id=order_id)
         await state.set_state(ReportStates.waiting_status)
-        await message.answer(
-            "Выберите статус отчета:",
-            reply_markup=get_report_status_keyboard()
-        )
+        await message.answer(t("report.choose_status"), reply_markup=get_report_status_keyboard(t))
     except ValueError:
-        await message.answer("❌ Введите корректный номер заявки (число).")
+        await message.answer(t("common.invalid_order_id"))
     except Exception as e:
         logger.exception(f"Ошибка при обработке номера заявки: {e}")
         await state.clear()
         await message.answer(
-            "❌ Произошла ошибка. Попробуйте еще раз.",
-            reply_markup=get_main_keyboard()
+            t("common.error_retry"),
+            reply_markup=get_main_keyboard(t)
         )
 
 
-@dp.message(ReportStates.waiting_status)
-async def process_report_status(message: Message, state: FSMContext):
+@router.message(ReportStates.waiting_status)
+async def process_report_status(message: Message, state: FSMContext, t: Translator):
     """Обработка статуса отчета"""
-    status_map = {
-        "⏳ Длительный ремонт": "long_repair",
-        "✅ Завершен": "completed",
-        "❌ Отмена": "cancelled",
-        "🚫 Отказ": "refused"
-    }
-    
-    if message.text not in status_map:
-        if message.text == "🔙 Назад":
+    status_key = catalog.key_for(message.text, REPORT_STATUS_BUTTONS)
+    if status_key is None:
+        if catalog.matches(message.text, "button.back"):
             await state.clear()
-            await message.answer("Отменено.", reply_markup=get_main_keyboard())
+            await message.answer(t("common.cancelled"), reply_markup=get_main_keyboard(t))
             return
-        await message.answer("Выберите статус из предложенных.")
+        await message.answer(t("report.choose_status_retry"))
         return
     
-    status = status_map[message.text]
+    status = REPORT_STATUS_BUTTONS[status_key]
     await state.update_data(status=status)
     
     if status == "completed":
         # Для завершенных заявок - общая сумма и себестоимость
         await state.set_state(ReportStates.waiting_total_amount)
-        await message.answer(
-            "Введите общую сумму (число):",
-            reply_markup=ReplyKeyboardRemove()
-        )
+        await message.answer(t("report.ask_total_amount"), reply_markup=ReplyKeyboardRemove())
     elif status == "long_repair":
         # Для длительного ремонта - сумма согласования
         await state.set_state(ReportStates.waiting_agreed_amount)
-        await message.answer(
-            "Введите сумму согласования (число):",
-            reply_markup=ReplyKeyboardRemove()
-        )
+        await message.answer(t("report.ask_agreed_amount"), reply_markup=ReplyKeyboardRemove())
     else:
-        # Для отмены и отказа сумма не требуется
+        # Для взятия в работу, отмены и отказа сумма не требуется
         data = await state.get_data()
-        await db.create_report(
+        payload = dict(
             order_id=data["order_id"],
             status=data["status"],
             total_amount=None,
             cost_price=None
         )
+        try:
+            await db.create_report(**payload)
+        except InvalidTransitionError as e:
+            await state.clear()
+            await message.answer(transition_error(t, e), reply_markup=get_main_keyboard(t))
+            return
+        except Exception as e:
+            logger.exception(f"Ошибка при создании отчета: {e}")
+            deferred = await defer_failed_write(message, state, KIND_CREATE_REPORT, payload, e)
+            await state.clear()
+            if deferred:
+                await message.answer(t("report.deferred"), reply_markup=get_main_keyboard(t))
+                return
+            await message.answer(t("report.create_error"), reply_markup=get_main_keyboard(t))
+            return
         await state.clear()
         await message.answer(
-            f"✅ Отчет создан для заявки #{data['order_id']}\n"
-            f"Статус: {message.text}",
-            reply_markup=get_main_keyboard()
+            t("report.created", order_id=data["order_id"], status=t(status_key)),
+            reply_markup=get_main_keyboard(t)
         )
 
 
-@dp.message(ReportStates.waiting_total_amount)
-async def process_total_amount(message: Message, state: FSMContext):
+@router.message(ReportStates.waiting_total_amount)
+async def process_total_amount(message: Message, state: FSMContext, t: Translator):
     """Обработка общей суммы"""
     try:
         total_amount = float(message.text)
         await state.update_data(total_amount=total_amount)
         await state.set_state(ReportStates.waiting_cost_price)
-        await message.answer("Введите себестоимость (число):")
+        await message.answer(t("report.ask_cost_price"))
     except ValueError:
-        await message.answer("❌ Введите корректное число.")
+        await message.answer(t("common.invalid_number"))
 
 
-@dp.message(ReportStates.waiting_cost_price)
-async def process_cost_price(message: Message, state: FSMContext):
+@router.message(ReportStates.waiting_cost_price)
+async def process_cost_price(message: Message, state: FSMContext, t: Translator):
     """Обработка себестоимости и сохранение отчета для завершенных заявок"""
     try:
         cost_price = float(message.text)
-        data = await state.get_data()
-        
-        await db.create_report(
-            order_id=data["order_id"],
-            status=data["status"],
-            total_amount=data.get("total_amount"),
-            cost_price=cost_price
-        )
-        
+    except (TypeError, ValueError):
+        await message.answer(t("common.invalid_number"))
+        return
+
+    data = await state.get_data()
+    payload = dict(
+        order_id=data["order_id"],
+        status=data["status"],
+        total_amount=data.get("total_amount"),
+        cost_price=cost_price
+    )
+    try:
+        await db.create_report(**payload)
+    except InvalidTransitionError as e:
         await state.clear()
-        
-        await message.answer(
-            f"✅ Отчет создан для заявки #{data['order_id']}\n"
-            f"Статус: ✅ Завершен\n\n"
-            f"📌 Заявка перемещена в список завершенных заявок\n\n"
-            f"Общая сумма: {data.get('total_amount', 0)} руб.\n"
-            f"Себестоимость: {cost_price} руб.",
-            reply_markup=get_main_keyboard()
-        )
-    except ValueError:
-        await message.answer("❌ Введите корректное число.")
+        await message.answer(transition_error(t, e), reply_markup=get_main_keyboard(t))
+        return
     except Exception as e:
         logger.exception(f"Ошибка при создании отчета: {e}")
+        deferred = await defer_failed_write(message, state, KIND_CREATE_REPORT, payload, e)
         await state.clear()
-        await message.answer(
-            "❌ Произошла ошибка при создании отчета. Попробуйте еще раз.",
-            reply_markup=get_main_keyboard()
-        )
+        if deferred:
+            await message.answer(t("report.deferred"), reply_markup=get_main_keyboard(t))
+            return
+        await message.answer(t("report.create_error"), reply_markup=get_main_keyboard(t))
+        return
+
+    await state.clear()
+    await message.answer(
+        t(
+            "report.created_completed",
+            order_id=data["order_id"],
+            total_amount=data.get("total_amount", 0),
+            cost_price=cost_price
+        ),
+        reply_markup=get_main_keyboard(t)
+    )
 
 
-@dp.message(ReportStates.waiting_agreed_amount)
-async def process_agreed_amount(message: Message, state: FSMContext):
+@router.message(ReportStates.waiting_agreed_amount)
+async def process_agreed_amount(message: Message, state: FSMContext, t: Translator):
     """Обработка суммы согласования для длительного ремонта"""
     try:
         agreed_amount = float(message.text)
         await state.update_data(agreed_amount=agreed_amount)
         await state.set_state(ReportStates.waiting_completion_date)
-        await message.answer("Введите дату завершения (например: 2024-12-31 или 31.12.2024):")
+        await message.answer(t("report.ask_completion_date"))
     except ValueError:
-        await message.answer("❌ Введите корректное число.")
+        await message.answer(t("common.invalid_number"))
 
 
-@dp.message(ReportStates.waiting_completion_date)
-async def process_completion_date(message: Message, state: FSMContext):
+@router.message(ReportStates.waiting_completion_date)
+async def process_completion_date(message: Message, state: FSMContext, t: Translator):
     """Обработка даты завершения"""
     await state.update_data(completion_date=message.text)
     await state.set_state(ReportStates.waiting_completion_time)
-    await message.answer("Введите время завершения (например: 18:00):")
+    await message.answer(t("report.ask_completion_time"))
 
 
-@dp.message(ReportStates.waiting_completion_time)
-async def process_completion_time(message: Message, state: FSMContext):
+@router.message(ReportStates.waiting_completion_time)
+async def process_completion_time(message: Message, state: FSMContext, t: Translator):
     """Обработка времени завершения"""
     await state.update_data(completion_time=message.text)
     await state.set_state(ReportStates.waiting_what_to_do)
-    await message.answer("Опишите, что нужно сделать:")
+    await message.answer(t("report.ask_what_to_do"))
 
 
-@dp.message(ReportStates.waiting_what_to_do)
-async def process_what_to_do(message: Message, state: FSMContext):
+@router.message(ReportStates.waiting_what_to_do)
+async def process_what_to_do(message: Message, state: FSMContext, t: Translator):
     """Обработка описания работ и сохранение отчета для длительного ремонта"""
+    data = await state.get_data()
+    data["what_to_do"] = message.text
+
+    payload = dict(
+        order_id=data["order_id"],
+        status=data["status"],
+        agreed_amount=data.get("agreed_amount"),
+        completion_date=data.get("completion_date"),
+        completion_time=data.get("completion_time"),
+        what_to_do=data.get("what_to_do")
+    )
     try:
-        data = await state.get_data()
-        data["what_to_do"] = message.text
-        
-        await db.create_report(
-            order_id=data["order_id"],
-            status=data["status"],
-            agreed_amount=data.get("agreed_amount"),
-            completion_date=data.get("completion_date"),
-            completion_time=data.get("completion_time"),
-            what_to_do=data.get("what_to_do")
-        )
-        
+        await db.create_report(**payload)
+    except InvalidTransitionError as e:
         await state.clear()
-        await message.answer(
-            f"✅ Отчет создан для заявки #{data['order_id']}\n"
-            f"Статус: ⏳ Длительный ремонт\n\n"
-            f"Сумма согласования: {data.get('agreed_amount', 0)} руб.\n"
-            f"Дата завершения: {data.get('completion_date')}\n"
-            f"Время завершения: {data.get('completion_time')}\n"
-            f"Что нужно сделать: {data.get('what_to_do')}",
-            reply_markup=get_main_keyboard()
-        )
+        await message.answer(transition_error(t, e), reply_markup=get_main_keyboard(t))
+        return
     except Exception as e:
         logger.exception(f"Ошибка при создании отчета: {e}")
+        deferred = await defer_failed_write(message, state, KIND_CREATE_REPORT, payload, e)
         await state.clear()
-        await message.answer(
-            "❌ Произошла ошибка при создании отчета. Попробуйте еще раз.",
-            reply_markup=get_main_keyboard()
-        )
+        if deferred:
+            await message.answer(t("report.deferred"), reply_markup=get_main_keyboard(t))
+            return
+        await message.answer(t("report.create_error"), reply_markup=get_main_keyboard(t))
+        return
+
+    await state.clear()
+    await message.answer(
+        t(
+            "report.created_long_repair",
+            order_id=data["order_id"],
+            agreed_amount=data.get("agreed_amount", 0),
+            completion_date=data.get("completion_date"),
+            completion_time=data.get("completion_time"),
+            what_to_do=data.get("what_to_do")
+        ),
+        reply_markup=get_main_keyboard(t)
+    )
 
 
-@dp.message(F.text == "🗑️ Удалить заявку")
-@dp.message(Command("delete_order"))
-async def cmd_delete_order(message: Message, state: FSMContext):
+@router.message(button("button.delete_order"))
+@router.message(Command("delete_order"))
+async def cmd_delete_order(message: Message, state: FSMContext, t: Translator):
     """Начало процесса удаления заявки"""
     await state.set_state(DeleteOrderStates.waiting_order_id)
-    await message.answer(
-        "🗑️ Удаление заявки\n\n"
-        "Введите номер заявки для удаления:",
-        reply_markup=ReplyKeyboardRemove()
-    )
+    await message.answer(t("delete.start"), reply_markup=ReplyKeyboardRemove())
 
 
-@dp.message(DeleteOrderStates.waiting_order_id)
-async def process_delete_order_id(message: Message, state: FSMContext):
+@router.message(DeleteOrderStates.waiting_order_id)
+async def process_delete_order_id(message: Message, state: FSMContext, t: Translator):
     """Обработка номера заявки для удаления"""
     try:
         order_id = int(message.text)
@@ -505,8 +872,8 @@ async def process_delete_order_id(message: Message, state: FSMContext):
         if not order:
             await state.clear()
             await message.answer(
-                "❌ Заявка не найдена. Проверьте номер заявки.",
-                reply_markup=get_main_keyboard()
+                t("common.order_not_found"),
+                reply_markup=get_main_keyboard(t)
             )
             return
         
@@ -514,34 +881,27 @@ async def process_delete_order_id(message: Message, state: FSMContext):
         await state.set_state(DeleteOrderStates.waiting_confirmation)
         
         # Показываем информацию о заявке для подтверждения
-        status_emoji = {
-            "pending": "⏳",
-            "in_progress": "🔧",
-            "long_repair": "⏳",
-            "completed": "✅",
-            "cancelled": "❌",
-            "refused": "🚫"
-        }.get(order["status"], "❓")
-        
         await message.answer(
-            f"⚠️ Вы уверены, что хотите удалить эту заявку?\n\n"
-            f"{status_emoji} Заявка #{order['id']}\n"
-            f"Адрес: {order['address']}\n"
-            f"Время: {order['time']}\n"
-            f"Техника: {order['equipment_type']}\n"
-            f"Проблема: {order['problem']}\n"
-            f"Статус: {order['status']}\n\n"
-            f"⚠️ Это действие нельзя отменить!",
-            reply_markup=get_confirmation_keyboard()
+            t(
+                "delete.confirm",
+                emoji=STATUS_EMOJI.get(order.status, "❓"),
+                order_id=order.id,
+                address=order.address,
+                time=order.time,
+                equipment_type=order.equipment_type,
+                problem=order.problem,
+                status=t(f"status.{order.status}")
+            ),
+            reply_markup=get_confirmation_keyboard(t)
         )
     except ValueError:
-        await message.answer("❌ Введите корректный номер заявки (число).")
+        await message.answer(t("common.invalid_order_id"))
 
 
-@dp.message(DeleteOrderStates.waiting_confirmation)
-async def process_delete_confirmation(message: Message, state: FSMContext):
+@router.message(DeleteOrderStates.waiting_confirmation)
+async def process_delete_confirmation(message: Message, state: FSMContext, t: Translator):
     """Обработка подтверждения удаления"""
-    if message.text == "✅ Да, удалить":
+    if catalog.matches(message.text, "button.confirm_delete"):
         data = await state.get_data()
         order_id = data["order_id"]
         
@@ -551,29 +911,405 @@ async def process_delete_confirmation(message: Message, state: FSMContext):
         
         if deleted:
             await message.answer(
-                f"✅ Заявка #{order_id} успешно удалена.",
-                reply_markup=get_main_keyboard()
+                t("delete.done", order_id=order_id),
+                reply_markup=get_main_keyboard(t)
             )
         else:
-            await message.answer(
-                "❌ Ошибка при удалении заявки.",
-                reply_markup=get_main_keyboard()
-            )
-    elif message.text == "❌ Отмена":
+            await message.answer(t("delete.error"), reply_markup=get_main_keyboard(t))
+    elif catalog.matches(message.text, "button.cancel"):
         await state.clear()
-        await message.answer(
-            "Отмена удаления.",
-            reply_markup=get_main_keyboard()
+        await message.answer(t("delete.cancelled"), reply_markup=get_main_keyboard(t))
+    else:
+        await message.answer(t("delete.choose"), reply_markup=get_confirmation_keyboard(t))
+
+
+@router.message(button("button.attach"))
+@router.message(Command("attach"))
+async def cmd_attach(message: Message, state: FSMContext, t: Translator):
+    """Начало добавления фото к заявке"""
+    await state.set_state(AttachStates.waiting_order_id)
+    await message.answer(t("attach.start"), reply_markup=ReplyKeyboardRemove())
+
+
+@router.message(AttachStates.waiting_order_id)
+async def process_attach_order_id(message: Message, state: FSMContext, t: Translator):
+    """Обработка номера заявки для добавления фото"""
+    try:
+        order_id = int(message.text)
+    except (TypeError, ValueError):
+        await message.answer(t("common.invalid_order_id"))
+        return
+
+    try:
+        order = await db.get_order(order_id, message.from_user.id)
+        if not order:
+            await message.answer(t("common.order_not_found"))
+            return
+        reports = await db.get_order_reports(order_id)
+    except Exception as e:
+        logger.exception(f"Ошибка при обработке номера заявки: {e}")
+        await state.clear()
+        await message.answer(t("common.error_retry"), reply_markup=get_main_keyboard(t))
+        return
+
+    await state.update_data(order_id=order_id, report_id=None, attached=0)
+    if reports:
+        await state.update_data(latest_report_id=reports[0].id)
+        await state.set_state(AttachStates.waiting_target)
+        await message.answer(t("attach.choose_target"), reply_markup=get_attach_target_keyboard(t))
+        return
+
+    await state.set_state(AttachStates.waiting_photos)
+    await message.answer(
+        t("attach.send_photos", order_id=order_id),
+        reply_markup=get_attach_done_keyboard(t)
+    )
+
+
+@router.message(AttachStates.waiting_target)
+async def process_attach_target(message: Message, state: FSMContext, t: Translator):
+    """Выбор: фото к заявке или к последнему отчету"""
+    data = await state.get_data()
+    if catalog.matches(message.text, "button.attach_to_report"):
+        await state.update_data(report_id=data["latest_report_id"])
+    elif not catalog.matches(message.text, "button.attach_to_order"):
+        await message.answer(t("common.choose_option"))
+        return
+
+    await state.set_state(AttachStates.waiting_photos)
+    await message.answer(
+        t("attach.send_photos", order_id=data["order_id"]),
+        reply_markup=get_attach_done_keyboard(t)
+    )
+
+
+async def cache_attachment(attachment_id: int, file_id: str, file_unique_id: str):
+    """Загрузка вложения в локальный кэш и сохранение хеша содержимого"""
+    try:
+        sha256 = await db.get_known_hash(file_unique_id)
+        if sha256 is None or media_cache.get(sha256) is None:
+            sha256 = await media_cache.fetch(file_id)
+        await db.set_attachment_hash(attachment_id, sha256)
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить вложение #{attachment_id} в кэш: {e}")
+
+
+@router.message(AttachStates.waiting_photos, F.photo | F.document)
+async def process_attach_photo(message: Message, state: FSMContext, t: Translator):
+    """Сохранение присланного фото или файла"""
+    if message.photo:
+        # Размеры идут по возрастанию: последний - оригинал, первый - миниатюра
+        original = message.photo[-1]
+        kind = "photo"
+        thumb_file_id = message.photo[0].file_id
+    else:
+        original = message.document
+        kind = "document"
+        thumb_file_id = message.document.thumbnail.file_id if message.document.thumbnail else None
+
+    data = await state.get_data()
+    try:
+        attachment_id = await db.add_attachment(
+            order_id=data["order_id"],
+            user_id=message.from_user.id,
+            kind=kind,
+            file_id=original.file_id,
+            file_unique_id=original.file_unique_id,
+            file_size=original.file_size,
+            thumb_file_id=thumb_file_id,
+            report_id=data.get("report_id")
         )
+    except Exception as e:
+        logger.exception(f"Ошибка при сохранении вложения: {e}")
+        await message.answer(t("attach.save_error"))
+        return
+
+    if attachment_id is None:
+        await message.answer(t("attach.duplicate"))
+        return
+
+    await state.update_data(attached=data.get("attached", 0) + 1)
+    if media_cache is not None:
+        spawn_background(cache_attachment(attachment_id, original.file_id, original.file_unique_id))
+
+
+@router.message(AttachStates.waiting_photos)
+async def process_attach_done(message: Message, state: FSMContext, t: Translator):
+    """Завершение добавления фото"""
+    if not catalog.matches(message.text, "button.done"):
+        await message.answer(t("attach.send_or_done"))
+        return
+
+    data = await state.get_data()
+    await state.clear()
+    await message.answer(
+        t("attach.done", order_id=data["order_id"], count=data.get("attached", 0)),
+        reply_markup=get_main_keyboard(t)
+    )
+
+
+@router.message(Command("photos"))
+async def cmd_photos(message: Message, t: Translator):
+    """Просмотр всех фото заявки: /photos <номер>"""
+    args = (message.text or "").split()[1:]
+    try:
+        order_id = int(args[0])
+    except (IndexError, ValueError):
+        await message.answer(t("photos.usage"))
+        return
+
+    try:
+        order = await db.get_order(order_id, message.from_user.id)
+        attachments = await db.get_attachments(order_id) if order else []
+    except Exception as e:
+        logger.exception(f"Ошибка при получении вложений: {e}")
+        await message.answer(t("common.error_later"), reply_markup=get_main_keyboard(t))
+        return
+
+    if not order:
+        await message.answer(t("common.order_not_found"))
+        return
+    photos = [a for a in attachments if a.kind == "photo"]
+    documents = [a for a in attachments if a.kind != "photo"]
+    if not attachments:
+        await message.answer(t("photos.none", order_id=order_id), reply_markup=get_main_keyboard(t))
+        return
+
+    caption = t("common.order_caption", order_id=order_id)
+    for start in range(0, len(photos), 10):
+        batch = photos[start:start + 10]
+        if len(batch) == 1:
+            await message.answer_photo(batch[0].file_id, caption=caption)
+        else:
+            await message.answer_media_group([
+                InputMediaPhoto(media=a.file_id, caption=caption if i == 0 else None)
+                for i, a in enumerate(batch)
+            ])
+    for attachment in documents:
+        await message.answer_document(attachment.file_id, caption=caption)
+
+
+@router.message(button("button.route"))
+@router.message(Command("route"))
+async def cmd_route(message: Message, state: FSMContext, t: Translator):
+    """Начало построения маршрута: запрос начальной точки"""
+    await state.set_state(RouteStates.waiting_start)
+    await message.answer(
+        t("route.start"),
+        reply_markup=get_location_keyboard(t, "button.no_start_point")
+    )
+
+
+@router.message(RouteStates.waiting_start)
+async def process_route_start(message: Message, state: FSMContext, t: Translator):
+    """Построение маршрута по активным заявкам на сегодня"""
+    if message.location:
+        start = (message.location.latitude, message.location.longitude)
+    elif catalog.matches(message.text, "button.no_start_point"):
+        start = None
     else:
+        await message.answer(t("route.ask_start"))
+        return
+    await state.clear()
+
+    today = date.today()
+    try:
+        orders = await db.get_user_orders(message.from_user.id, exclude_completed=True)
+    except Exception as e:
+        logger.exception(f"Ошибка при получении заявок: {e}")
         await message.answer(
-            "Пожалуйста, выберите один из вариантов:",
-            reply_markup=get_confirmation_keyboard()
+            t("list.fetch_error"),
+            reply_markup=get_main_keyboard(t)
+        )
+        return
+
+    # Сначала заявки, созданные раньше (у заявок без координат порядок сохраняется)
+    orders = sorted(
+        (order for order in orders if not is_final(order.status) and is_due_on(order, today)),
+        key=lambda order: order.id
+    )
+    if not orders:
+        await message.answer(t("route.empty"), reply_markup=get_main_keyboard(t))
+        return
+
+    if len(orders) < settings.current.heavy_list_threshold:
+        stops, unlocated = plan_route(orders, start)
+    else:
+        # Большой план строится в пуле процессов, как и большие списки
+        try:
+            stops, unlocated = await executor.submit(plan_route, orders, start)
+        except ExecutorBusyError:
+            await message.answer(t("list.busy"), reply_markup=get_main_keyboard(t))
+            return
+        except JobTimeoutError as e:
+            logger.error(f"Превышено время построения маршрута: {e}")
+            await message.answer(t("list.timeout"), reply_markup=get_main_keyboard(t))
+            return
+        except JobAbortedError as e:
+            logger.error(f"Построение маршрута прервано: {e}")
+            await message.answer(t("list.aborted"), reply_markup=get_main_keyboard(t))
+            return
+        except Exception as e:
+            logger.exception(f"Ошибка при построении маршрута: {e}")
+            await message.answer(t("list.render_error"), reply_markup=get_main_keyboard(t))
+            return
+    for chunk in render_route(stops, unlocated, today.strftime("%d.%m.%Y"), t.locale):
+        await message.answer(chunk, reply_markup=get_main_keyboard(t))
+
+
+@router.message(Command("location"))
+async def cmd_location(message: Message, state: FSMContext, t: Translator):
+    """Указание координат заявки: /location [номер]"""
+    args = (message.text or "").split()[1:]
+    if args and args[0].isdigit():
+        await ask_order_location(message, state, t, int(args[0]))
+        return
+    await state.set_state(LocationStates.waiting_order_id)
+    await message.answer(t("location.start"), reply_markup=ReplyKeyboardRemove())
+
+
+async def ask_order_location(message: Message, state: FSMContext, t: Translator, order_id: int):
+    """Проверка заявки и запрос геопозиции"""
+    try:
+        order = await db.get_order(order_id, message.from_user.id)
+    except Exception as e:
+        logger.exception(f"Ошибка при получении заявки: {e}")
+        await state.clear()
+        await message.answer(t("common.error_retry"), reply_markup=get_main_keyboard(t))
+        return
+    if not order:
+        await state.set_state(LocationStates.waiting_order_id)
+        await message.answer(t("common.order_not_found"))
+        return
+
+    await state.update_data(order_id=order_id)
+    await state.set_state(LocationStates.waiting_location)
+    await message.answer(
+        t("location.ask", order_id=order_id, address=order.address),
+        reply_markup=get_location_keyboard(t, "button.cancel")
+    )
+
+
+@router.message(LocationStates.waiting_order_id)
+async def process_location_order_id(message: Message, state: FSMContext, t: Translator):
+    """Обработка номера заявки для указания координат"""
+    try:
+        order_id = int(message.text)
+    except (TypeError, ValueError):
+        await message.answer(t("common.invalid_order_id"))
+        return
+    await ask_order_location(message, state, t, order_id)
+
+
+@router.message(LocationStates.waiting_location)
+async def process_order_location(message: Message, state: FSMContext, t: Translator):
+    """Сохранение координат заявки"""
+    location = message.venue.location if message.venue else message.location
+    if not location:
+        if catalog.matches(message.text, "button.cancel"):
+            await state.clear()
+            await message.answer(t("common.cancelled"), reply_markup=get_main_keyboard(t))
+            return
+        await message.answer(t("location.ask_retry"))
+        return
+
+    data = await state.get_data()
+    await state.clear()
+    try:
+        same_address = await db.set_order_location(
+            data["order_id"], message.from_user.id, location.latitude, location.longitude
         )
+    except Exception as e:
+        logger.exception(f"Ошибка при сохранении координат: {e}")
+        await message.answer(t("location.save_error"), reply_markup=get_main_keyboard(t))
+        return
 
+    if same_address is None:
+        await message.answer(t("common.order_not_found_short"), reply_markup=get_main_keyboard(t))
+        return
+    key = "location.saved_same_address" if same_address else "location.saved"
+    await message.answer(
+        t(key, order_id=data["order_id"], count=same_address),
+        reply_markup=get_main_keyboard(t)
+    )
 
-@dp.message()
-async def handle_unknown_message(message: Message, state: FSMContext):
+
+@router.message(StateFilter(None), F.location)
+async def handle_location(message: Message, t: Translator):
+    """Геопозиция вне сценариев: активные заявки рядом"""
+    radius_km = settings.current.nearby_radius_km
+    try:
+        orders = await db.get_orders_near(
+            message.location.latitude, message.location.longitude,
+            radius_km, user_id=message.from_user.id
+        )
+    except Exception as e:
+        logger.exception(f"Ошибка при поиске заявок рядом: {e}")
+        await message.answer(t("common.error_later"), reply_markup=get_main_keyboard(t))
+        return
+
+    if not orders:
+        await message.answer(t("nearby.none", radius=radius_km), reply_markup=get_main_keyboard(t))
+        return
+    parts = [t("nearby.header", radius=radius_km)]
+    for order in orders:
+        km = haversine_km(message.location.latitude, message.location.longitude,
+                          order.latitude, order.longitude)
+        parts.append(t("nearby.item", order_id=order.id, km=km, address=order.address, time=order.time))
+    await message.answer("".join(parts), reply_markup=get_main_keyboard(t))
+
+
+@router.message(Command("debug"))
+async def cmd_debug(message: Message, t: Translator):
+    """Диагностика для администраторов: /debug или /debug profile [секунды]"""
+    if message.from_user.id not in settings.current.admin_ids:
+        await message.answer(t("debug.admin_only"))
+        return
+
+    args = (message.text or "").split()[1:]
+    if args and args[0] == "profile":
+        try:
+            duration = min(float(args[1]), 120.0) if len(args) > 1 else 10.0
+        except ValueError:
+            await message.answer(t("debug.profile_usage"))
+            return
+        if profiler.running:
+            await message.answer(t("debug.profile_running"))
+            return
+        await message.answer(t("debug.profiling", duration=duration))
+        spawn_background(deliver_profile(message, t, duration))
+        return
+
+    extra = {
+        "Заявки по статусам": await db.get_status_counts(),
+        "Пул процессов": executor.stats(),
+        "Кэш вложений": media_cache.stats() if media_cache else {"включен": "нет"},
+        "Ключи идемпотентности": recent_order_keys.stats(),
+        "Очередь повторов": {
+            "ожидают": await dead_letters.count_pending(),
+            **retry_worker.stats()
+        }
+    }
+    extra["Настройки"] = settings.stats()
+    if admin_api:
+        extra["API администратора"] = admin_api.stats()
+    if backups.last_result:
+        extra["Последняя резервная копия"] = backups.last_result
+    await message.answer(format_snapshot(watchdog.snapshot(), extra=extra))
+
+
+async def deliver_profile(message: Message, t: Translator, duration: float):
+    """Профилирование в фоне и отправка самых частых стеков"""
+    try:
+        path = await profiler.profile(duration)
+        await message.answer(t("debug.profile_saved", path=path, stacks=hot_stacks(path)))
+    except Exception as e:
+        logger.exception(f"Ошибка профилирования: {e}")
+        await message.answer(t("debug.profile_error", error=e))
+
+
+@router.message()
+async def handle_unknown_message(message: Message, state: FSMContext, t: Translator):
     """Обработчик неизвестных сообщений"""
     # Проверяем, что это текстовое сообщение
     if not message.text:
@@ -587,11 +1323,7 @@ async def handle_unknown_message(message: Message, state: FSMContext):
         return
     
     # Для остальных неизвестных сообщений
-    await message.answer(
-        "🤔 Я не понимаю эту команду.\n\n"
-        "Используйте кнопки меню или команду /start для начала работы.",
-        reply_markup=get_main_keyboard()
-    )
+    await message.answer(t("common.unknown"), reply_markup=get_main_keyboard(t))
 
 
 async def main():
@@ -600,6 +1332,16 @@ async def main():
         logger.info("Инициализация базы данных...")
         await db.init_db()
         logger.info("База данных инициализирована")
+
+        executor.start()
+        spawn_background(loop_lag.run())
+        spawn_background(watchdog.run())
+        spawn_background(retry_worker.run())
+        schedule_backups(config.backup_interval_hours)
+        if admin_api:
+            await admin_api.start(config.admin_api_host, config.admin_api_port)
+        settings.install_signal_handler(spawn_background)
+        spawn_background(settings.watch())
         
         logger.info("Запуск бота...")
         print("Бот запущен...")
@@ -620,12 +1362,19 @@ async def main():
         print(f"❌ Критическая ошибка: {e}")
         sys.exit(1)
     finally:
+        logger.info("Остановка пула процессов...")
+        await executor.shutdown()
+        if admin_api:
+            await admin_api.stop()
+            await admin_api.db.close()
+        await db.close()
         logger.info("Закрытие соединения с ботом...")
         await bot.session.close()
 
 
 if __name__ == "__main__":
     try:
+        setup()
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Получен сигнал остановки")
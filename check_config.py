@@ -5,28 +5,35 @@
 
 import os
 import sys
-from dotenv import load_dotenv
 import requests
 
+from settings import ENV_FILE, SettingsError, load_settings
+
 def check_env_file():
     """Проверка наличия и содержимого .env файла"""
     print("🔍 Проверка файла .env...")
     
-    if not os.path.exists(".env"):
+    if not os.path.exists(ENV_FILE):
         print("❌ Файл .env не найден!")
         print("   Создайте файл .env на основе .env.example")
         return False
     
-    load_dotenv()
+    # Те же типы и проверки значений, что и при запуске бота (settings.py)
+    try:
+        settings = load_settings()
+    except SettingsError as e:
+        for error in e.errors:
+            print(f"❌ {error}")
+        print("   Исправьте значения в файле .env")
+        return False
     
-    bot_token = os.getenv("BOT_TOKEN")
-    if not bot_token or bot_token == "your_telegram_bot_token_here":
-        print("❌ BOT_TOKEN не установлен или имеет значение по умолчанию")
+    if settings.bot_token == "your_telegram_bot_token_here":
+        print("❌ BOT_TOKEN имеет значение по умолчанию")
         print("   Укажите ваш токен бота в файле .env")
         return False
     
-    print("✅ Файл .env найден и содержит BOT_TOKEN")
-    return True, bot_token
+    print("✅ Файл .env найден, параметры корректны")
+    return True, settings
 
 def check_bot_token(bot_token):
     """Проверка валидности токена бота через Telegram API"""
@@ -89,11 +96,10 @@ def check_dependencies():
     
     return True
 
-def check_database_dir():
+def check_database_dir(db_path):
     """Проверка возможности создания базы данных"""
     print("\n🔍 Проверка прав на создание базы данных...")
     
-    db_path = os.getenv("DATABASE_PATH", "orders.db")
     db_dir = os.path.dirname(os.path.abspath(db_path)) or "."
     
     if not os.path.exists(db_dir):
@@ -130,11 +136,12 @@ def main():
     
     # Проверка .env файла
     env_check = check_env_file()
+    settings = None
     if isinstance(env_check, tuple):
-        env_ok, bot_token = env_check
+        env_ok, settings = env_check
         if env_ok:
             # Проверка токена
-            if not check_bot_token(bot_token):
+            if not check_bot_token(settings.bot_token):
                 all_ok = False
         else:
             all_ok = False
@@ -142,7 +149,7 @@ def main():
         all_ok = False
     
     # Проверка базы данных
-    if not check_database_dir():
+    if not check_database_dir(settings.database_path if settings else "orders.db"):
         all_ok = False
     
     print("\n" + "=" * 50)
@@ -1,9 +1,16 @@
 import aiosqlite
+import asyncio
+import json
 import os
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, fields
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Any, Optional, List, Dict, AsyncIterator, FrozenSet, Tuple
+from urllib.parse import quote
 from enum import Enum
 
+from geo import normalize_address, geohash_encode, geohash_neighborhood, precision_for_radius, haversine_km
+
 
 class OrderStatus(Enum):
     """Статусы заявок"""
@@ -15,13 +22,240 @@ class OrderStatus(Enum):
     REFUSED = "refused"
 
 
+# Допустимые переходы статусов заявки. Завершенная, отмененная заявка
+# и отказ - конечные состояния: отчет по ним создать нельзя.
+ORDER_TRANSITIONS: Dict[OrderStatus, FrozenSet[OrderStatus]] = {
+    OrderStatus.PENDING: frozenset({
+        OrderStatus.IN_PROGRESS, OrderStatus.LONG_REPAIR, OrderStatus.COMPLETED,
+        OrderStatus.CANCELLED, OrderStatus.REFUSED
+    }),
+    OrderStatus.IN_PROGRESS: frozenset({
+        OrderStatus.LONG_REPAIR, OrderStatus.COMPLETED, OrderStatus.CANCELLED, OrderStatus.REFUSED
+    }),
+    # Повторный отчет о длительном ремонте обновляет сроки и сумму согласования
+    OrderStatus.LONG_REPAIR: frozenset({
+        OrderStatus.LONG_REPAIR, OrderStatus.COMPLETED, OrderStatus.CANCELLED, OrderStatus.REFUSED
+    }),
+    OrderStatus.COMPLETED: frozenset(),
+    OrderStatus.CANCELLED: frozenset(),
+    OrderStatus.REFUSED: frozenset(),
+}
+
+
+def allowed_sources(target: OrderStatus) -> List[str]:
+    """Статусы, из которых заявку можно перевести в target"""
+    return [source.value for source, targets in ORDER_TRANSITIONS.items() if target in targets]
+
+
+def is_final(status: str) -> bool:
+    """Конечный ли статус (из него нет переходов)"""
+    return not ORDER_TRANSITIONS.get(OrderStatus(status))
+
+
+class InvalidTransitionError(Exception):
+    """Недопустимая смена статуса заявки"""
+
+    def __init__(self, order_id: int, current_status: Optional[str], new_status: str):
+        self.order_id = order_id
+        self.current_status = current_status
+        self.new_status = new_status
+        if current_status is None:
+            message = f"Заявка #{order_id} не найдена"
+        else:
+            message = f"Заявку #{order_id} нельзя перевести из {current_status} в {new_status}"
+        super().__init__(message)
+
+
+# Вторичные индексы: имя -> "таблица (колонки)". Создаются в init_db;
+# benchmarks/bench_database.py удаляет их для сравнения с запуском без индексов.
+INDEXES: Dict[str, str] = {
+    "idx_orders_user_status": "orders (user_id, status)",
+    # Списки заявок в API администратора с фильтром по статусу
+    "idx_orders_status": "orders (status)",
+    "idx_orders_address_key": "orders (address_key)",
+    # Поиск рядом - диапазоном по префиксу geohash
+    "idx_orders_geohash": "orders (geohash)",
+    "idx_reports_order": "reports (order_id)",
+    "idx_attachments_file_unique_id": "attachments (file_unique_id)",
+}
+
+
+class OrderEventType(Enum):
+    """Типы событий в журнале order_events"""
+    SNAPSHOT = "order_snapshot"
+    CREATED = "order_created"
+    REPORTED = "report_created"
+    DELETED = "order_deleted"
+    ATTACHED = "attachment_added"
+    LOCATED = "location_set"
+
+
+@dataclass(slots=True)
+class Order:
+    """Заявка"""
+    id: int
+    user_id: int
+    address: str
+    time: str
+    equipment_type: str
+    problem: str
+    status: str
+    created_at: str
+    # Канонический ключ адреса и координаты (см. geo.py)
+    address_key: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    geohash: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Report:
+    """Отчет по заявке"""
+    id: int
+    order_id: int
+    status: str
+    total_amount: Optional[float]
+    cost_price: Optional[float]
+    agreed_amount: Optional[float]
+    completion_date: Optional[str]
+    completion_time: Optional[str]
+    what_to_do: Optional[str]
+    created_at: str
+
+
+@dataclass(slots=True)
+class Attachment:
+    """Вложение (фото или файл) к заявке или отчету.
+
+    Хранится только file_id Telegram; sha256 заполняется, когда файл скачан
+    в локальный кэш (см. media_cache.py).
+    """
+    id: int
+    order_id: int
+    report_id: Optional[int]
+    user_id: int
+    kind: str
+    file_id: str
+    file_unique_id: str
+    file_size: Optional[int]
+    thumb_file_id: Optional[str]
+    sha256: Optional[str]
+    created_at: str
+
+
+def _columns(record_type) -> str:
+    """Список колонок для SELECT в порядке полей записи"""
+    return ", ".join(field.name for field in fields(record_type))
+
+
+ORDER_COLUMNS = _columns(Order)
+REPORT_COLUMNS = _columns(Report)
+ATTACHMENT_COLUMNS = _columns(Attachment)
+
+
+def _order_factory(cursor, row) -> Order:
+    """row_factory: строка запроса с ORDER_COLUMNS -> Order без промежуточного dict"""
+    return Order(*row)
+
+
+def _report_factory(cursor, row) -> Report:
+    """row_factory: строка запроса с REPORT_COLUMNS -> Report"""
+    return Report(*row)
+
+
+def _attachment_factory(cursor, row) -> Attachment:
+    """row_factory: строка запроса с ATTACHMENT_COLUMNS -> Attachment"""
+    return Attachment(*row)
+
+
+async def _add_event(db: aiosqlite.Connection, order_id: int, user_id: int,
+                     event_type: OrderEventType, payload: Dict):
+    """Запись события в журнал (в рамках текущей транзакции соединения db)"""
+    await db.execute("""
+        INSERT INTO order_events (order_id, user_id, event_type, payload)
+        VALUES (?, ?, ?, ?)
+    """, (order_id, user_id, event_type.value, json.dumps(payload, ensure_ascii=False)))
+
+
 class Database:
-    def __init__(self, db_path: str = "orders.db"):
+    def __init__(self, db_path: str = "orders.db", pool_size: int = 0, read_only: bool = False):
+        """pool_size = 0 - новое соединение на каждый вызов; иначе пул из
+        pool_size постоянных соединений. read_only - соединения только для
+        чтения (mode=ro), методы записи на них завершаются ошибкой"""
         self.db_path = db_path
+        self.pool_size = pool_size
+        self.read_only = read_only
+        self._pool: Optional[asyncio.Queue] = None
+        self._opened = 0
+
+    def _open(self) -> aiosqlite.Connection:
+        """Новое соединение с базой"""
+        if self.read_only:
+            uri = f"file:{quote(os.path.abspath(self.db_path))}?mode=ro"
+            return aiosqlite.connect(uri, uri=True)
+        return aiosqlite.connect(self.db_path)
+
+    @asynccontextmanager
+    async def _connect(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Соединение для одного вызова метода"""
+        if not self.pool_size:
+            async with self._open() as db:
+                yield db
+            return
+
+        if self._pool is None:
+            self._pool = asyncio.Queue()
+        if self._pool.empty() and self._opened < self.pool_size:
+            self._opened += 1
+            try:
+                db = await self._open()
+            except BaseException:
+                self._opened -= 1
+                raise
+        else:
+            db = await self._pool.get()
+        try:
+            yield db
+        finally:
+            # Соединение возвращается в пул без незавершенной транзакции
+            try:
+                if db.in_transaction:
+                    await db.rollback()
+                db.row_factory = None
+            except Exception:
+                self._opened -= 1
+                await db.close()
+            else:
+                if self._opened > self.pool_size:
+                    # Пул уменьшили, пока соединение было занято
+                    self._opened -= 1
+                    await db.close()
+                else:
+                    self._pool.put_nowait(db)
+
+    async def resize_pool(self, pool_size: int):
+        """Изменение размера пула без перезапуска: лишние свободные соединения
+        закрываются сразу, занятые - при возврате"""
+        self.pool_size = pool_size
+        while self._pool is not None and self._opened > pool_size and not self._pool.empty():
+            await self._pool.get_nowait().close()
+            self._opened -= 1
+
+    async def close(self):
+        """Закрытие соединений пула"""
+        if self._pool is None:
+            return
+        while not self._pool.empty():
+            await self._pool.get_nowait().close()
+            self._opened -= 1
 
     async def init_db(self):
         """Инициализация базы данных"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
+            # WAL: чтение (в том числе API администратора) не блокирует запись
+            # бота. Режим сохраняется в файле базы
+            await db.execute("PRAGMA journal_mode=WAL")
+
             # Таблица заявок
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS orders (
@@ -73,6 +307,130 @@ class Database:
                 await db.execute("ALTER TABLE reports ADD COLUMN what_to_do TEXT")
             except aiosqlite.OperationalError:
                 pass
+
+            # Нормализованный адрес и координаты заявки
+            for column in ("address_key TEXT", "latitude REAL", "longitude REAL", "geohash TEXT"):
+                try:
+                    await db.execute(f"ALTER TABLE orders ADD COLUMN {column}")
+                except aiosqlite.OperationalError:
+                    pass
+
+            # Ключ идемпотентности (см. idempotency.py); NULL у старых заявок
+            # уникальности не нарушает
+            try:
+                await db.execute("ALTER TABLE orders ADD COLUMN idempotency_key TEXT")
+            except aiosqlite.OperationalError:
+                pass
+            await db.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_idempotency_key
+                ON orders (idempotency_key)
+            """)
+            async with db.execute(
+                "SELECT id, address FROM orders WHERE address_key IS NULL"
+            ) as cursor:
+                missing = await cursor.fetchall()
+            if missing:
+                await db.executemany(
+                    "UPDATE orders SET address_key = ? WHERE id = ?",
+                    [(normalize_address(address), order_id) for order_id, address in missing]
+                )
+
+            # Журнал изменений заявок (только добавление, seq монотонно растет)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS order_events (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    order_id INTEGER NOT NULL,
+                    user_id INTEGER,
+                    event_type TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Заявки, созданные до появления журнала, попадают в него снимками
+            async with db.execute("SELECT 1 FROM order_events LIMIT 1") as cursor:
+                has_events = await cursor.fetchone() is not None
+            if not has_events:
+                await db.execute("""
+                    INSERT INTO order_events (order_id, user_id, event_type, payload)
+                    SELECT id, user_id, ?, json_object(
+                        'address', address, 'time', time, 'equipment_type', equipment_type,
+                        'problem', problem, 'status', status, 'created_at', created_at
+                    )
+                    FROM orders ORDER BY id
+                """, (OrderEventType.SNAPSHOT.value,))
+
+            # Вложения: в базе только ссылки file_id на файлы в Telegram
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS attachments (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    order_id INTEGER NOT NULL,
+                    report_id INTEGER,
+                    user_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    file_id TEXT NOT NULL,
+                    file_unique_id TEXT NOT NULL,
+                    file_size INTEGER,
+                    thumb_file_id TEXT,
+                    sha256 TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (order_id) REFERENCES orders (id),
+                    FOREIGN KEY (report_id) REFERENCES reports (id),
+                    UNIQUE (order_id, file_unique_id)
+                )
+            """)
+
+            # Счетчики заявок по статусам поддерживаются триггерами в тех же
+            # транзакциях, что и изменения заявок
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS order_status_counts (
+                    status TEXT PRIMARY KEY,
+                    count INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS order_status_counts_insert
+                AFTER INSERT ON orders
+                BEGIN
+                    INSERT INTO order_status_counts (status, count) VALUES (NEW.status, 1)
+                    ON CONFLICT(status) DO UPDATE SET count = count + 1;
+                END
+            """)
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS order_status_counts_delete
+                AFTER DELETE ON orders
+                BEGIN
+                    UPDATE order_status_counts SET count = count - 1 WHERE status = OLD.status;
+                END
+            """)
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS order_status_counts_update
+                AFTER UPDATE OF status ON orders
+                WHEN OLD.status IS NOT NEW.status
+                BEGIN
+                    UPDATE order_status_counts SET count = count - 1 WHERE status = OLD.status;
+                    INSERT INTO order_status_counts (status, count) VALUES (NEW.status, 1)
+                    ON CONFLICT(status) DO UPDATE SET count = count + 1;
+                END
+            """)
+            # Настройки пользователей (язык интерфейса)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS user_settings (
+                    user_id INTEGER PRIMARY KEY,
+                    locale TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            for name, target in INDEXES.items():
+                await db.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+
+            # Пересчет при запуске: счетчики верны и для баз, созданных до триггеров
+            await db.execute("DELETE FROM order_status_counts")
+            await db.execute("""
+                INSERT INTO order_status_counts (status, count)
+                SELECT status, COUNT(*) FROM orders GROUP BY status
+            """)
             
             await db.commit()
 
@@ -82,60 +440,177 @@ class Database:
         address: str,
         time: str,
         equipment_type: str,
-        problem: str
+        problem: str,
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None,
+        idempotency_key: Optional[str] = None
     ) -> int:
-        """Создание новой заявки"""
-        async with aiosqlite.connect(self.db_path) as db:
+        """Создание новой заявки.
+
+        Если координаты не переданы, они берутся из последней заявки с тем же
+        нормализованным адресом. Если заявка с таким idempotency_key уже есть,
+        новая не создается и возвращается номер существующей.
+        """
+        address_key = normalize_address(address)
+        async with self._connect() as db:
+            if latitude is None or longitude is None:
+                async with db.execute("""
+                    SELECT latitude, longitude FROM orders
+                    WHERE address_key = ? AND latitude IS NOT NULL
+                    ORDER BY id DESC LIMIT 1
+                """, (address_key,)) as cursor:
+                    row = await cursor.fetchone()
+                latitude, longitude = row if row else (None, None)
+            geohash = geohash_encode(latitude, longitude) if latitude is not None else None
+
             cursor = await db.execute("""
-                INSERT INTO orders (user_id, address, time, equipment_type, problem)
-                VALUES (?, ?, ?, ?, ?)
-            """, (user_id, address, time, equipment_type, problem))
+                INSERT INTO orders (user_id, address, time, equipment_type, problem,
+                                    address_key, latitude, longitude, geohash, idempotency_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (idempotency_key) DO NOTHING
+            """, (user_id, address, time, equipment_type, problem,
+                  address_key, latitude, longitude, geohash, idempotency_key))
+            if cursor.rowcount == 0:
+                async with db.execute(
+                    "SELECT id FROM orders WHERE idempotency_key = ?", (idempotency_key,)
+                ) as cur:
+                    row = await cur.fetchone()
+                await db.rollback()
+                return row[0]
+            order_id = cursor.lastrowid
+            await _add_event(db, order_id, user_id, OrderEventType.CREATED, {
+                "address": address,
+                "time": time,
+                "equipment_type": equipment_type,
+                "problem": problem,
+                "status": OrderStatus.PENDING.value,
+                "latitude": latitude,
+                "longitude": longitude
+            })
             await db.commit()
-            return cursor.lastrowid
+            return order_id
 
-    async def get_user_orders(self, user_id: int, exclude_completed: bool = True) -> List[Dict]:
+    async def get_user_orders(self, user_id: int, exclude_completed: bool = True) -> List[Order]:
         """Получение заявок пользователя (по умолчанию исключает завершенные)"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._connect() as db:
+            db.row_factory = _order_factory
             if exclude_completed:
-                async with db.execute("""
-                    SELECT * FROM orders 
+                async with db.execute(f"""
+                    SELECT {ORDER_COLUMNS} FROM orders 
                     WHERE user_id = ? AND status != 'completed'
                     ORDER BY created_at DESC
                 """, (user_id,)) as cursor:
-                    rows = await cursor.fetchall()
-                    return [dict(row) for row in rows]
+                    return await cursor.fetchall()
             else:
-                async with db.execute("""
-                    SELECT * FROM orders 
+                async with db.execute(f"""
+                    SELECT {ORDER_COLUMNS} FROM orders 
                     WHERE user_id = ? 
                     ORDER BY created_at DESC
                 """, (user_id,)) as cursor:
-                    rows = await cursor.fetchall()
-                    return [dict(row) for row in rows]
+                    return await cursor.fetchall()
 
-    async def get_completed_orders(self, user_id: int) -> List[Dict]:
+    async def get_completed_orders(self, user_id: int) -> List[Order]:
         """Получение только завершенных заявок пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute("""
-                SELECT * FROM orders 
+        async with self._connect() as db:
+            db.row_factory = _order_factory
+            async with db.execute(f"""
+                SELECT {ORDER_COLUMNS} FROM orders 
                 WHERE user_id = ? AND status = 'completed'
                 ORDER BY created_at DESC
             """, (user_id,)) as cursor:
-                rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+                return await cursor.fetchall()
 
-    async def get_order(self, order_id: int, user_id: int) -> Optional[Dict]:
-        """Получение конкретной заявки"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+    async def list_orders(
+        self,
+        status: Optional[str] = None,
+        user_id: Optional[int] = None,
+        created_from: Optional[str] = None,
+        created_to: Optional[str] = None,
+        search: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0
+    ) -> Tuple[List[Order], int]:
+        """Заявки всех пользователей с фильтрами, от новых к старым.
+
+        created_from / created_to - границы created_at ("2024-12-31" или
+        "2024-12-31 18:00:00", created_to не включается), search - подстрока
+        адреса или проблемы. Возвращает страницу и общее количество.
+        """
+        conditions = []
+        params: List[Any] = []
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        if created_from is not None:
+            conditions.append("created_at >= ?")
+            params.append(created_from)
+        if created_to is not None:
+            conditions.append("created_at < ?")
+            params.append(created_to)
+        if search:
+            conditions.append("(address LIKE ? ESCAPE '\\' OR problem LIKE ? ESCAPE '\\')")
+            pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            params.extend((pattern, pattern))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        async with self._connect() as db:
+            async with db.execute(f"SELECT COUNT(*) FROM orders {where}", params) as cursor:
+                (total,) = await cursor.fetchone()
+            db.row_factory = _order_factory
+            async with db.execute(f"""
+                SELECT {ORDER_COLUMNS} FROM orders {where}
+                ORDER BY id DESC
+                LIMIT ? OFFSET ?
+            """, (*params, limit, offset)) as cursor:
+                orders = await cursor.fetchall()
+        return orders, total
+
+    async def get_workload(self) -> List[Dict[str, Any]]:
+        """Нагрузка по техникам: заявки по статусам и время последней заявки"""
+        workload: Dict[int, Dict[str, Any]] = {}
+        async with self._connect() as db:
             async with db.execute("""
-                SELECT * FROM orders 
+                SELECT user_id, status, COUNT(*), MAX(created_at)
+                FROM orders
+                GROUP BY user_id, status
+            """) as cursor:
+                async for user_id, status, count, last_created_at in cursor:
+                    entry = workload.setdefault(user_id, {
+                        "user_id": user_id,
+                        "active": 0,
+                        "total": 0,
+                        "statuses": {},
+                        "last_order_at": None
+                    })
+                    entry["statuses"][status] = count
+                    entry["total"] += count
+                    if not is_final(status):
+                        entry["active"] += count
+                    if entry["last_order_at"] is None or last_created_at > entry["last_order_at"]:
+                        entry["last_order_at"] = last_created_at
+        return sorted(workload.values(), key=lambda entry: (-entry["active"], entry["user_id"]))
+
+    async def get_order(self, order_id: int, user_id: int) -> Optional[Order]:
+        """Получение конкретной заявки"""
+        async with self._connect() as db:
+            db.row_factory = _order_factory
+            async with db.execute(f"""
+                SELECT {ORDER_COLUMNS} FROM orders 
                 WHERE id = ? AND user_id = ?
             """, (order_id, user_id)) as cursor:
-                row = await cursor.fetchone()
-                return dict(row) if row else None
+                return await cursor.fetchone()
+
+    async def get_order_by_id(self, order_id: int) -> Optional[Order]:
+        """Получение заявки по номеру без проверки владельца (для администратора)"""
+        async with self._connect() as db:
+            db.row_factory = _order_factory
+            async with db.execute(f"""
+                SELECT {ORDER_COLUMNS} FROM orders WHERE id = ?
+            """, (order_id,)) as cursor:
+                return await cursor.fetchone()
 
     async def create_report(
         self,
@@ -148,12 +623,24 @@ class Database:
         completion_time: Optional[str] = None,
         what_to_do: Optional[str] = None
     ) -> int:
-        """Создание отчета по заявке"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Обновляем статус заявки
-            await db.execute("""
-                UPDATE orders SET status = ? WHERE id = ?
-            """, (status, order_id))
+        """Создание отчета по заявке.
+
+        Статус меняется одним условным UPDATE: если текущий статус заявки не
+        допускает перехода (см. ORDER_TRANSITIONS), выбрасывается
+        InvalidTransitionError и отчет не создается.
+        """
+        sources = allowed_sources(OrderStatus(status))
+        placeholders = ", ".join("?" * len(sources))
+        async with self._connect() as db:
+            # Обновляем статус заявки, только если переход допустим
+            cursor = await db.execute(f"""
+                UPDATE orders SET status = ? WHERE id = ? AND status IN ({placeholders})
+            """, (status, order_id, *sources))
+            if cursor.rowcount == 0:
+                async with db.execute("SELECT status FROM orders WHERE id = ?", (order_id,)) as cur:
+                    row = await cur.fetchone()
+                await db.rollback()
+                raise InvalidTransitionError(order_id, row[0] if row else None, status)
             
             # Создаем отчет
             cursor = await db.execute("""
@@ -162,40 +649,376 @@ class Database:
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             """, (order_id, status, total_amount, cost_price, 
                   agreed_amount, completion_date, completion_time, what_to_do))
+            report_id = cursor.lastrowid
+
+            await db.execute("""
+                INSERT INTO order_events (order_id, user_id, event_type, payload)
+                SELECT id, user_id, ?, ? FROM orders WHERE id = ?
+            """, (OrderEventType.REPORTED.value, json.dumps({
+                "report_id": report_id,
+                "status": status,
+                "total_amount": total_amount,
+                "cost_price": cost_price,
+                "agreed_amount": agreed_amount,
+                "completion_date": completion_date,
+                "completion_time": completion_time,
+                "what_to_do": what_to_do
+            }, ensure_ascii=False), order_id))
             
             await db.commit()
-            return cursor.lastrowid
+            return report_id
 
-    async def get_order_reports(self, order_id: int) -> List[Dict]:
+    async def get_order_reports(self, order_id: int) -> List[Report]:
         """Получение всех отчетов по заявке"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute("""
-                SELECT * FROM reports 
+        async with self._connect() as db:
+            db.row_factory = _report_factory
+            async with db.execute(f"""
+                SELECT {REPORT_COLUMNS} FROM reports 
                 WHERE order_id = ? 
                 ORDER BY created_at DESC
             """, (order_id,)) as cursor:
-                rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+                return await cursor.fetchall()
+
+    async def get_latest_reports(self, order_ids: List[int]) -> Dict[int, Report]:
+        """Получение последних отчетов по списку заявок одним запросом на пачку"""
+        result = {}
+        async with self._connect() as db:
+            db.row_factory = _report_factory
+            # Ограничение SQLite на количество параметров в запросе
+            for start in range(0, len(order_ids), 500):
+                chunk = order_ids[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                async with db.execute(f"""
+                    SELECT {REPORT_COLUMNS} FROM reports
+                    WHERE id IN (
+                        SELECT MAX(id) FROM reports
+                        WHERE order_id IN ({placeholders})
+                        GROUP BY order_id
+                    )
+                """, chunk) as cursor:
+                    async for report in cursor:
+                        result[report.order_id] = report
+        return result
 
     async def delete_order(self, order_id: int, user_id: int) -> bool:
         """Удаление заявки и всех связанных отчетов"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Проверяем, что заявка принадлежит пользователю
-            order = await self.get_order(order_id, user_id)
-            if not order:
+        async with self._connect() as db:
+            # Удаляем заявку, только если она принадлежит пользователю
+            cursor = await db.execute("""
+                DELETE FROM orders WHERE id = ? AND user_id = ?
+            """, (order_id, user_id))
+            if cursor.rowcount == 0:
+                await db.rollback()
                 return False
             
-            # Удаляем все отчеты по заявке
+            # Удаляем все отчеты и вложения по заявке
             await db.execute("""
                 DELETE FROM reports WHERE order_id = ?
             """, (order_id,))
-            
-            # Удаляем заявку
             await db.execute("""
-                DELETE FROM orders WHERE id = ? AND user_id = ?
-            """, (order_id, user_id))
+                DELETE FROM attachments WHERE order_id = ?
+            """, (order_id,))
+
+            await _add_event(db, order_id, user_id, OrderEventType.DELETED, {})
             
             await db.commit()
             return True
 
+    async def set_order_location(
+        self,
+        order_id: int,
+        user_id: int,
+        latitude: float,
+        longitude: float
+    ) -> Optional[int]:
+        """Сохранение координат заявки.
+
+        Координаты также получают заявки с тем же нормализованным адресом, у
+        которых их еще нет; для каждой из них в журнал пишется свое событие
+        LOCATED. Возвращает количество таких заявок или None, если заявка не
+        найдена.
+        """
+        geohash = geohash_encode(latitude, longitude)
+        async with self._connect() as db:
+            cursor = await db.execute("""
+                UPDATE orders SET latitude = ?, longitude = ?, geohash = ?
+                WHERE id = ? AND user_id = ?
+            """, (latitude, longitude, geohash, order_id, user_id))
+            if cursor.rowcount == 0:
+                await db.rollback()
+                return None
+            # Выборка и обновление - в одной транзакции: после первого UPDATE
+            # соединение уже держит блокировку записи
+            async with db.execute("""
+                SELECT id, user_id FROM orders
+                WHERE latitude IS NULL
+                  AND address_key = (SELECT address_key FROM orders WHERE id = ?)
+            """, (order_id,)) as cursor:
+                same_address = await cursor.fetchall()
+            await db.executemany("""
+                UPDATE orders SET latitude = ?, longitude = ?, geohash = ? WHERE id = ?
+            """, [(latitude, longitude, geohash, other_id) for other_id, _ in same_address])
+            await _add_event(db, order_id, user_id, OrderEventType.LOCATED, {
+                "latitude": latitude,
+                "longitude": longitude,
+                "same_address_orders": len(same_address)
+            })
+            for other_id, other_user_id in same_address:
+                await _add_event(db, other_id, other_user_id, OrderEventType.LOCATED, {
+                    "latitude": latitude,
+                    "longitude": longitude,
+                    "same_address_as": order_id
+                })
+            await db.commit()
+            return len(same_address)
+
+    async def get_orders_near(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        user_id: Optional[int] = None,
+        active_only: bool = True
+    ) -> List[Order]:
+        """Заявки в радиусе radius_km от точки, ближайшие первыми.
+
+        Кандидаты выбираются по индексу geohash (ячейка точки и соседние),
+        затем отсеиваются по точному расстоянию.
+        """
+        precision = precision_for_radius(radius_km, latitude)
+        cells = geohash_neighborhood(latitude, longitude, precision)
+        # Префикс p покрывает строки в диапазоне [p, p + "~")
+        ranges = " OR ".join("(geohash >= ? AND geohash < ?)" for _ in cells)
+        params = [bound for cell in cells for bound in (cell, cell + "~")]
+        conditions = [f"({ranges})"]
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        if active_only:
+            finals = [status.value for status in OrderStatus if is_final(status.value)]
+            conditions.append(f"status NOT IN ({', '.join('?' * len(finals))})")
+            params.extend(finals)
+
+        async with self._connect() as db:
+            db.row_factory = _order_factory
+            async with db.execute(f"""
+                SELECT {ORDER_COLUMNS} FROM orders
+                WHERE {" AND ".join(conditions)}
+            """, params) as cursor:
+                candidates = await cursor.fetchall()
+
+        nearby = []
+        for order in candidates:
+            distance = haversine_km(latitude, longitude, order.latitude, order.longitude)
+            if distance <= radius_km:
+                nearby.append((distance, order.id, order))
+        nearby.sort()
+        return [order for _, _, order in nearby]
+
+    async def find_duplicate_orders(self, window_seconds: float = 300) -> List[Tuple[int, int, int]]:
+        """Заявки-дубликаты: (номер дубликата, номер оригинала, пользователь).
+
+        Дубликат - заявка того же пользователя с теми же адресом, временем,
+        техникой и проблемой, созданная не позже window_seconds после более
+        ранней. Заявки с отчетами или вложениями дубликатами не считаются.
+        """
+        async with self._connect() as db:
+            async with db.execute("""
+                SELECT d.id, MIN(o.id), d.user_id
+                FROM orders d
+                JOIN orders o
+                  ON o.address_key = d.address_key
+                 AND o.user_id = d.user_id
+                 AND o.id < d.id
+                 AND o.address = d.address
+                 AND o.time = d.time
+                 AND o.equipment_type = d.equipment_type
+                 AND o.problem = d.problem
+                 AND (julianday(d.created_at) - julianday(o.created_at)) * 86400 <= ?
+                WHERE NOT EXISTS (SELECT 1 FROM reports r WHERE r.order_id = d.id)
+                  AND NOT EXISTS (SELECT 1 FROM attachments a WHERE a.order_id = d.id)
+                GROUP BY d.id
+                ORDER BY d.id
+            """, (window_seconds,)) as cursor:
+                rows = await cursor.fetchall()
+
+        # Оригинал сам может оказаться дубликатом более ранней заявки
+        original_of = {duplicate_id: original_id for duplicate_id, original_id, _ in rows}
+        result = []
+        for duplicate_id, original_id, user_id in rows:
+            while original_id in original_of:
+                original_id = original_of[original_id]
+            result.append((duplicate_id, original_id, user_id))
+        return result
+
+    async def remove_duplicate_orders(self, duplicates: List[Tuple[int, int, int]]) -> int:
+        """Удаление дубликатов, найденных find_duplicate_orders, одной транзакцией"""
+        removed = 0
+        async with self._connect() as db:
+            for duplicate_id, original_id, user_id in duplicates:
+                # Повторная проверка: за это время к заявке могли добавить отчет
+                cursor = await db.execute("""
+                    DELETE FROM orders
+                    WHERE id = ? AND user_id = ?
+                      AND NOT EXISTS (SELECT 1 FROM reports WHERE order_id = ?)
+                      AND NOT EXISTS (SELECT 1 FROM attachments WHERE order_id = ?)
+                """, (duplicate_id, user_id, duplicate_id, duplicate_id))
+                if cursor.rowcount:
+                    removed += 1
+                    await _add_event(db, duplicate_id, user_id, OrderEventType.DELETED, {
+                        "duplicate_of": original_id
+                    })
+            await db.commit()
+        return removed
+
+    async def add_attachment(
+        self,
+        order_id: int,
+        user_id: int,
+        kind: str,
+        file_id: str,
+        file_unique_id: str,
+        file_size: Optional[int] = None,
+        thumb_file_id: Optional[str] = None,
+        report_id: Optional[int] = None
+    ) -> Optional[int]:
+        """Добавление вложения. Повторно тот же файл к заявке не добавляется (None)"""
+        async with self._connect() as db:
+            cursor = await db.execute("""
+                INSERT INTO attachments (order_id, report_id, user_id, kind, file_id,
+                                         file_unique_id, file_size, thumb_file_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (order_id, file_unique_id) DO NOTHING
+            """, (order_id, report_id, user_id, kind, file_id, file_unique_id,
+                  file_size, thumb_file_id))
+            if cursor.rowcount == 0:
+                await db.rollback()
+                return None
+            attachment_id = cursor.lastrowid
+            await _add_event(db, order_id, user_id, OrderEventType.ATTACHED, {
+                "attachment_id": attachment_id,
+                "report_id": report_id,
+                "kind": kind,
+                "file_id": file_id,
+                "file_size": file_size
+            })
+            await db.commit()
+            return attachment_id
+
+    async def get_attachments(self, order_id: int) -> List[Attachment]:
+        """Вложения заявки (включая вложения ее отчетов)"""
+        async with self._connect() as db:
+            db.row_factory = _attachment_factory
+            async with db.execute(f"""
+                SELECT {ATTACHMENT_COLUMNS} FROM attachments
+                WHERE order_id = ?
+                ORDER BY id
+            """, (order_id,)) as cursor:
+                return await cursor.fetchall()
+
+    async def get_first_attachments(self, order_ids: List[int]) -> Dict[int, Attachment]:
+        """Первое вложение каждой заявки из списка (для миниатюр в списках)"""
+        result = {}
+        async with self._connect() as db:
+            db.row_factory = _attachment_factory
+            for start in range(0, len(order_ids), 500):
+                chunk = order_ids[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                async with db.execute(f"""
+                    SELECT {ATTACHMENT_COLUMNS} FROM attachments
+                    WHERE id IN (
+                        SELECT MIN(id) FROM attachments
+                        WHERE order_id IN ({placeholders})
+                        GROUP BY order_id
+                    )
+                """, chunk) as cursor:
+                    async for attachment in cursor:
+                        result[attachment.order_id] = attachment
+        return result
+
+    async def get_known_hash(self, file_unique_id: str) -> Optional[str]:
+        """Хеш уже скачанного файла с таким file_unique_id (чтобы не скачивать повторно)"""
+        async with self._connect() as db:
+            async with db.execute("""
+                SELECT sha256 FROM attachments
+                WHERE file_unique_id = ? AND sha256 IS NOT NULL
+                LIMIT 1
+            """, (file_unique_id,)) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else None
+
+    async def set_attachment_hash(self, attachment_id: int, sha256: str):
+        """Сохранение хеша содержимого после загрузки в локальный кэш"""
+        async with self._connect() as db:
+            await db.execute(
+                "UPDATE attachments SET sha256 = ? WHERE id = ?", (sha256, attachment_id)
+            )
+            await db.commit()
+
+    async def get_user_locale(self, user_id: int) -> Optional[str]:
+        """Язык интерфейса, выбранный пользователем (None - не выбирал)"""
+        async with self._connect() as db:
+            async with db.execute(
+                "SELECT locale FROM user_settings WHERE user_id = ?", (user_id,)
+            ) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else None
+
+    async def set_user_locale(self, user_id: int, locale: str):
+        """Сохранение выбранного языка интерфейса"""
+        async with self._connect() as db:
+            await db.execute("""
+                INSERT INTO user_settings (user_id, locale) VALUES (?, ?)
+                ON CONFLICT (user_id) DO UPDATE
+                SET locale = excluded.locale, updated_at = CURRENT_TIMESTAMP
+            """, (user_id, locale))
+            await db.commit()
+
+    async def get_status_counts(self) -> Dict[str, int]:
+        """Количество заявок в каждом статусе (без сканирования таблицы заявок)"""
+        async with self._connect() as db:
+            async with db.execute(
+                "SELECT status, count FROM order_status_counts WHERE count > 0 ORDER BY status"
+            ) as cursor:
+                return {status: count async for status, count in cursor}
+
+    async def get_events(self, after_seq: int = 0, limit: int = 500) -> List[Dict]:
+        """Получение событий журнала с номером больше after_seq"""
+        async with self._connect() as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute("""
+                SELECT * FROM order_events
+                WHERE seq > ?
+                ORDER BY seq
+                LIMIT ?
+            """, (after_seq, limit)) as cursor:
+                rows = await cursor.fetchall()
+        events = []
+        for row in rows:
+            event = dict(row)
+            event["payload"] = json.loads(event["payload"])
+            events.append(event)
+        return events
+
+    async def stream_events(
+        self,
+        after_seq: int = 0,
+        follow: bool = False,
+        poll_interval: float = 1.0,
+        batch_size: int = 500
+    ) -> AsyncIterator[Dict]:
+        """Последовательное чтение журнала начиная с after_seq.
+
+        Без follow генератор завершается, дочитав журнал до конца; с follow -
+        ждет новых событий, опрашивая базу раз в poll_interval секунд.
+        """
+        while True:
+            events = await self.get_events(after_seq, batch_size)
+            for event in events:
+                after_seq = event["seq"]
+                yield event
+            if len(events) < batch_size:
+                if not follow:
+                    return
+                await asyncio.sleep(poll_interval)
+
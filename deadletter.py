@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Очередь неудавшихся записей (dead-letter queue).
+
+Если create_order или create_report завершились ошибкой (например, база
+заблокирована), введенные пользователем данные сохраняются в отдельный файл
+SQLite вместе с данными FSM. Фоновый RetryWorker повторяет запись с
+экспоненциальной задержкой.
+
+Примеры:
+    python3 deadletter.py list                 # ожидающие повтора записи
+    python3 deadletter.py list --status failed # записи, которые не удалось повторить
+    python3 deadletter.py replay               # повторить все ожидающие сейчас
+    python3 deadletter.py replay 3 7           # повторить записи 3 и 7 (в т.ч. failed)
+    python3 deadletter.py purge                # удалить успешно повторенные записи
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aiosqlite
+
+from database import Database, InvalidTransitionError
+from settings import SettingsError, load_settings
+
+logger = logging.getLogger(__name__)
+
+KIND_CREATE_ORDER = "create_order"
+KIND_CREATE_REPORT = "create_report"
+
+STATUS_PENDING = "pending"
+STATUS_IN_PROGRESS = "in_progress"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# Сколько секунд запись считается занятой после claim. Если обработчик упал,
+# не завершив повтор, по истечении срока запись снова попадает в due()
+CLAIM_LEASE = 300.0
+
+
+@dataclass(slots=True)
+class DeadLetter:
+    """Неудавшаяся запись"""
+    id: int
+    kind: str
+    user_id: int
+    chat_id: int
+    payload: Dict[str, Any]
+    fsm_data: Dict[str, Any]
+    error: str
+    attempts: int
+    status: str
+    next_attempt_at: float
+    created_at: str
+    result: Optional[int] = None
+
+
+_COLUMNS = ("id, kind, user_id, chat_id, payload, fsm_data, error, attempts, status, "
+            "next_attempt_at, created_at, result")
+
+
+def _dead_letter_factory(cursor, row) -> DeadLetter:
+    """row_factory: строка dead_letters -> DeadLetter"""
+    values = list(row)
+    values[4] = json.loads(values[4])
+    values[5] = json.loads(values[5])
+    return DeadLetter(*values)
+
+
+class DeadLetterStore:
+    """Хранилище неудавшихся записей в отдельном файле SQLite.
+
+    Отдельный файл нужен, чтобы сохранить данные даже тогда, когда основная
+    база заблокирована или недоступна.
+    """
+
+    def __init__(self, path: str = "dead_letters.db"):
+        self.path = path
+        self._initialized = False
+
+    async def _connect(self) -> aiosqlite.Connection:
+        db = await aiosqlite.connect(self.path, timeout=30)
+        if not self._initialized:
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS dead_letters (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    chat_id INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    fsm_data TEXT NOT NULL,
+                    error TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    next_attempt_at REAL NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    result INTEGER
+                )
+            """)
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_dead_letters_due
+                ON dead_letters (status, next_attempt_at)
+            """)
+            await db.commit()
+            self._initialized = True
+        return db
+
+    async def add(
+        self,
+        kind: str,
+        user_id: int,
+        chat_id: int,
+        payload: Dict[str, Any],
+        fsm_data: Dict[str, Any],
+        error: str,
+        delay: float = 0.0
+    ) -> int:
+        """Сохранение неудавшейся записи"""
+        db = await self._connect()
+        try:
+            cursor = await db.execute("""
+                INSERT INTO dead_letters (kind, user_id, chat_id, payload, fsm_data, error,
+                                          next_attempt_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (kind, user_id, chat_id, json.dumps(payload, ensure_ascii=False),
+                  json.dumps(fsm_data, ensure_ascii=False, default=str), error,
+                  time.time() + delay))
+            await db.commit()
+            return cursor.lastrowid
+        finally:
+            await db.close()
+
+    async def get(self, ids: List[int]) -> List[DeadLetter]:
+        """Записи по номерам"""
+        placeholders = ", ".join("?" * len(ids))
+        db = await self._connect()
+        try:
+            db.row_factory = _dead_letter_factory
+            async with db.execute(
+                f"SELECT {_COLUMNS} FROM dead_letters WHERE id IN ({placeholders}) ORDER BY id", ids
+            ) as cursor:
+                return await cursor.fetchall()
+        finally:
+            await db.close()
+
+    async def due(self, limit: int = 50) -> List[DeadLetter]:
+        """Ожидающие записи, время повтора которых наступило"""
+        db = await self._connect()
+        try:
+            db.row_factory = _dead_letter_factory
+            async with db.execute(f"""
+                SELECT {_COLUMNS} FROM dead_letters
+                WHERE status IN (?, ?) AND next_attempt_at <= ?
+                ORDER BY next_attempt_at
+                LIMIT ?
+            """, (STATUS_PENDING, STATUS_IN_PROGRESS, time.time(), limit)) as cursor:
+                return await cursor.fetchall()
+        finally:
+            await db.close()
+
+    async def list_by_status(self, status: str = STATUS_PENDING) -> List[DeadLetter]:
+        """Все записи с указанным статусом"""
+        db = await self._connect()
+        try:
+            db.row_factory = _dead_letter_factory
+            async with db.execute(
+                f"SELECT {_COLUMNS} FROM dead_letters WHERE status = ? ORDER BY id", (status,)
+            ) as cursor:
+                return await cursor.fetchall()
+        finally:
+            await db.close()
+
+    async def count_pending(self) -> int:
+        """Количество записей, ожидающих повтора"""
+        db = await self._connect()
+        try:
+            async with db.execute(
+                "SELECT COUNT(*) FROM dead_letters WHERE status = ?", (STATUS_PENDING,)
+            ) as cursor:
+                return (await cursor.fetchone())[0]
+        finally:
+            await db.close()
+
+    async def _update(self, item_id: int, **values):
+        assignments = ", ".join(f"{key} = ?" for key in values)
+        db = await self._connect()
+        try:
+            await db.execute(
+                f"UPDATE dead_letters SET {assignments} WHERE id = ?", (*values.values(), item_id)
+            )
+            await db.commit()
+        finally:
+            await db.close()
+
+    async def claim(self, item: DeadLetter) -> bool:
+        """Захват записи для повтора: False, если ее уже обрабатывает другой
+        процесс (бот и команда replay) или она изменилась после чтения"""
+        now = time.time()
+        db = await self._connect()
+        try:
+            cursor = await db.execute("""
+                UPDATE dead_letters SET status = ?, next_attempt_at = ?
+                WHERE id = ? AND status = ? AND next_attempt_at = ?
+                  AND (status != ? OR next_attempt_at <= ?)
+            """, (STATUS_IN_PROGRESS, now + CLAIM_LEASE, item.id, item.status,
+                  item.next_attempt_at, STATUS_IN_PROGRESS, now))
+            await db.commit()
+            return cursor.rowcount == 1
+        finally:
+            await db.close()
+
+    async def mark_done(self, item: DeadLetter, result: Optional[int]):
+        """Запись успешно повторена"""
+        await self._update(item.id, status=STATUS_DONE, attempts=item.attempts + 1, result=result)
+
+    async def mark_retry(self, item: DeadLetter, error: str, delay: float):
+        """Повтор не удался, следующая попытка через delay секунд"""
+        await self._update(
+            item.id, status=STATUS_PENDING, attempts=item.attempts + 1, error=error,
+            next_attempt_at=time.time() + delay
+        )
+
+    async def mark_failed(self, item: DeadLetter, error: str):
+        """Повторять бессмысленно (ошибка не временная или исчерпаны попытки)"""
+        await self._update(item.id, status=STATUS_FAILED, attempts=item.attempts + 1, error=error)
+
+    async def purge_done(self) -> int:
+        """Удаление успешно повторенных записей"""
+        db = await self._connect()
+        try:
+            cursor = await db.execute("DELETE FROM dead_letters WHERE status = ?", (STATUS_DONE,))
+            await db.commit()
+            return cursor.rowcount
+        finally:
+            await db.close()
+
+
+async def replay(db: Database, item: DeadLetter) -> Optional[int]:
+    """Повтор записи в основную базу; возвращает номер заявки или отчета"""
+    if item.kind == KIND_CREATE_ORDER:
+        return await db.create_order(**item.payload)
+    if item.kind == KIND_CREATE_REPORT:
+        return await db.create_report(**item.payload)
+    raise ValueError(f"Неизвестный тип записи: {item.kind}")
+
+
+class RetryWorker:
+    """Фоновый повтор неудавшихся записей с экспоненциальной задержкой"""
+
+    def __init__(
+        self,
+        store: DeadLetterStore,
+        db: Database,
+        on_success: Optional[Callable[[DeadLetter, Optional[int]], Awaitable[None]]] = None,
+        on_failure: Optional[Callable[[DeadLetter, Exception], Awaitable[None]]] = None,
+        base_delay: float = 5.0,
+        max_delay: float = 600.0,
+        max_attempts: int = 10,
+        poll_interval: float = 5.0
+    ):
+        self.store = store
+        self.db = db
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.replayed = 0
+        self.failed = 0
+
+    def backoff(self, attempts: int) -> float:
+        """Задержка перед следующей попыткой: base * 2^attempts с разбросом ±20%"""
+        delay = min(self.max_delay, self.base_delay * (2 ** attempts))
+        return delay * random.uniform(0.8, 1.2)
+
+    async def process(self, item: DeadLetter) -> bool:
+        """Одна попытка повтора; True, если запись сохранена"""
+        if item.status == STATUS_DONE or not await self.store.claim(item):
+            logger.info(f"Отложенная запись #{item.id} уже обработана или обрабатывается")
+            return False
+        try:
+            result = await replay(self.db, item)
+        except InvalidTransitionError as e:
+            # Статус заявки успел измениться - повтор ничего не исправит
+            await self.store.mark_failed(item, str(e))
+            self.failed += 1
+            logger.warning(f"Отложенная запись #{item.id} отклонена: {e}")
+            if self.on_failure:
+                await self.on_failure(item, e)
+            return False
+        except Exception as e:
+            if item.attempts + 1 >= self.max_attempts:
+                await self.store.mark_failed(item, repr(e))
+                self.failed += 1
+                logger.error(f"Отложенная запись #{item.id}: попытки исчерпаны: {e}")
+                if self.on_failure:
+                    await self.on_failure(item, e)
+            else:
+                delay = self.backoff(item.attempts + 1)
+                await self.store.mark_retry(item, repr(e), delay)
+                logger.warning(f"Отложенная запись #{item.id}: повтор через {delay:.0f} с ({e})")
+            return False
+
+        await self.store.mark_done(item, result)
+        self.replayed += 1
+        logger.info(f"Отложенная запись #{item.id} ({item.kind}) сохранена: {result}")
+        if self.on_success:
+            await self.on_success(item, result)
+        return True
+
+    async def run_once(self) -> int:
+        """Обработка всех записей, время которых наступило; возвращает число успешных"""
+        succeeded = 0
+        for item in await self.store.due():
+            if await self.process(item):
+                succeeded += 1
+        return succeeded
+
+    async def run(self):
+        """Бесконечный цикл повторов (запускается через asyncio.create_task)"""
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                # Очередь тоже может быть временно недоступна - пробуем позже
+                logger.exception(f"Ошибка обработки очереди повторов: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики повторов"""
+        return {"replayed": self.replayed, "failed": self.failed}
+
+
+async def _cli(args) -> int:
+    store = DeadLetterStore(args.dlq)
+
+    if args.command == "list":
+        for item in await store.list_by_status(args.status):
+            print(json.dumps({
+                "id": item.id,
+                "kind": item.kind,
+                "user_id": item.user_id,
+                "attempts": item.attempts,
+                "error": item.error,
+                "created_at": item.created_at,
+                "payload": item.payload
+            }, ensure_ascii=False))
+        return 0
+
+    if args.command == "purge":
+        print(f"Удалено записей: {await store.purge_done()}")
+        return 0
+
+    worker = RetryWorker(store, Database(args.db), max_attempts=args.max_attempts)
+    items = await store.get(args.ids) if args.ids else await store.list_by_status(STATUS_PENDING)
+    ok = 0
+    for item in items:
+        if item.status == STATUS_DONE:
+            print(f"#{item.id}: уже сохранена ({item.result})")
+            continue
+        if await worker.process(item):
+            ok += 1
+            print(f"✅ #{item.id}: сохранена")
+        else:
+            print(f"❌ #{item.id}: не удалось")
+    print(f"Повторено успешно: {ok} из {len(items)}")
+    return 0 if ok == len(items) else 1
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        config = load_settings(require=False)
+    except SettingsError as e:
+        print(f"❌ Ошибка в настройках: {e}")
+        return 1
+
+    parser = argparse.ArgumentParser(description="Очередь неудавшихся записей")
+    parser.add_argument("--db", default=config.database_path,
+                        help="основная база (по умолчанию DATABASE_PATH из .env)")
+    parser.add_argument("--dlq", default=config.dead_letter_path,
+                        help="файл очереди (по умолчанию DEAD_LETTER_PATH из .env)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    list_parser = subparsers.add_parser("list", help="показать записи")
+    list_parser.add_argument("--status", default=STATUS_PENDING,
+                             choices=(STATUS_PENDING, STATUS_IN_PROGRESS, STATUS_DONE, STATUS_FAILED))
+    replay_parser = subparsers.add_parser("replay", help="повторить записи")
+    replay_parser.add_argument("ids", nargs="*", type=int,
+                               help="номера записей (по умолчанию все ожидающие)")
+    subparsers.add_parser("purge", help="удалить успешно повторенные записи")
+    parser.set_defaults(max_attempts=config.dlq_max_attempts)
+    args = parser.parse_args()
+
+    return asyncio.run(_cli(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
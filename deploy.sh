@@ -34,7 +34,7 @@ else
 fi
 
 echo "📂 Создание директории проекта..."
-mkdir -p "$PROJECT_DIR"
+mkdir -p "$PROJECT_DIR" "$PROJECT_DIR/backups"
 chown "$SERVICE_USER:$SERVICE_USER" "$PROJECT_DIR"
 
 echo "📥 Копирование файлов проекта..."
@@ -74,6 +74,7 @@ User=$SERVICE_USER
 WorkingDirectory=$PROJECT_DIR
 Environment="PATH=$PROJECT_DIR/venv/bin"
 ExecStart=$PROJECT_DIR/venv/bin/python $PROJECT_DIR/bot.py
+ExecReload=/bin/kill -HUP \$MAINPID
 Restart=always
 RestartSec=10
 StandardOutput=journal
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Вывод журнала изменений заявок (order_events) в формате NDJSON.
+
+Примеры:
+    python3 events_tail.py                  # весь журнал
+    python3 events_tail.py --from 120       # события после seq=120
+    python3 events_tail.py --follow         # ждать новые события, как tail -f
+
+Номер последнего обработанного события (поле seq) потребитель сохраняет у себя
+и при следующем запуске передает в --from.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from database import Database
+from settings import SettingsError, load_settings
+
+
+async def tail(db_path: str, after_seq: int, follow: bool, interval: float):
+    """Печать событий по одному JSON-объекту на строку"""
+    db = Database(db_path)
+    async for event in db.stream_events(after_seq, follow=follow, poll_interval=interval):
+        sys.stdout.write(json.dumps(event, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+
+
+def main():
+    try:
+        config = load_settings(require=False)
+    except SettingsError as e:
+        print(f"❌ Ошибка в настройках: {e}", file=sys.stderr)
+        return 1
+    parser = argparse.ArgumentParser(description="Журнал изменений заявок в формате NDJSON")
+    parser.add_argument("--db", default=config.database_path,
+                        help="путь к базе данных (по умолчанию DATABASE_PATH из .env)")
+    parser.add_argument("--from", dest="after_seq", type=int, default=0,
+                        help="выводить события с seq больше указанного")
+    parser.add_argument("--follow", "-f", action="store_true",
+                        help="не завершаться, ожидать новые события")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="период опроса базы в режиме --follow, секунды")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ База данных не найдена: {args.db}", file=sys.stderr)
+        return 1
+
+    try:
+        asyncio.run(tail(args.db, args.after_seq, args.follow, args.interval))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
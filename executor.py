@@ -0,0 +1,256 @@
+"""
+Выполнение CPU-тяжелых задач (формирование больших списков, выгрузки,
+агрегации) в пуле процессов, чтобы не блокировать цикл событий бота.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import statistics
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorBusyError(Exception):
+    """Очередь задач переполнена"""
+
+
+class JobTimeoutError(Exception):
+    """Задача не уложилась в отведенное время"""
+
+
+class JobAbortedError(Exception):
+    """Задача не выполнена: пул процессов остановлен или его процесс упал"""
+
+
+class JobExecutor:
+    """Пул процессов с ограниченной очередью и таймаутами на задачу.
+
+    Задачу, которая не уложилась в таймаут и уже выполняется, остановить можно
+    только вместе с процессом: такой пул выводится из работы (его процессы
+    завершаются), а следующая задача создает новый. До завершения процессов
+    задача считается в очереди - pending и ограничение max_pending учитывают ее.
+    Остальные задачи выведенного пула передаются новому пулу в пределах своего
+    таймаута.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        max_pending: int = 32,
+        job_timeout: float = 30.0
+    ):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.job_timeout = job_timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        # Завершение процессов выведенных из работы пулов
+        self._retiring: Set[asyncio.Task] = set()
+        # Пулы, выведенные из работы по таймауту: их задачи передаются новому пулу
+        self._retired: "weakref.WeakSet[ProcessPoolExecutor]" = weakref.WeakSet()
+        self._stopping = False
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.rejected = 0
+
+    @property
+    def pending(self) -> int:
+        """Количество задач в очереди и в работе"""
+        return self._pending
+
+    def start(self):
+        """Создание пула процессов"""
+        if self._pool is None:
+            # spawn: дочерние процессы не наследуют потоки aiosqlite и сокеты бота
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+
+    async def submit(self, func: Callable, *args, timeout: Optional[float] = None) -> Any:
+        """Выполнение функции в пуле процессов.
+
+        func и аргументы должны сериализоваться pickle. Если очередь заполнена,
+        сразу выбрасывается ExecutorBusyError; по истечении таймаута - JobTimeoutError;
+        если пул остановлен или его процесс упал - JobAbortedError.
+        Отмена вызывающей задачи снимает задание из очереди пула.
+        """
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise ExecutorBusyError(f"В очереди уже {self._pending} задач")
+
+        loop = asyncio.get_running_loop()
+        job_timeout = timeout if timeout is not None else self.job_timeout
+        deadline = loop.time() + job_timeout
+        self._pending += 1
+        release = True
+        started = time.perf_counter()
+        try:
+            while True:
+                self.start()
+                pool = self._pool
+                future = pool.submit(func, *args)
+                waiter = asyncio.wrap_future(future)
+                # asyncio.wait, в отличие от wait_for, не выбрасывает CancelledError,
+                # если задание отменил пул, а не вызывающая задача
+                try:
+                    done, _ = await asyncio.wait({waiter}, timeout=max(0.0, deadline - loop.time()))
+                except asyncio.CancelledError:
+                    future.cancel()
+                    waiter.cancel()
+                    raise
+                if not done:
+                    self.timed_out += 1
+                    if not future.cancel():
+                        # Задача уже выполняется: место в очереди освобождается,
+                        # когда процессы пула будут завершены
+                        release = False
+                        logger.warning(f"{func.__name__} прервана по таймауту, пул процессов будет пересоздан")
+                        self._retire(pool, job_done=True)
+                    waiter.cancel()
+                    raise JobTimeoutError(f"{func.__name__} выполняется дольше {job_timeout} с")
+                if not waiter.cancelled() and not isinstance(waiter.exception(), BrokenProcessPool):
+                    break
+
+                if pool in self._retired and not self._stopping:
+                    # Пул выведен из работы из-за таймаута другой задачи
+                    logger.info(f"{func.__name__} передана новому пулу процессов")
+                    continue
+                if self._pool is pool and not waiter.cancelled():
+                    logger.error("Пул процессов поврежден и будет пересоздан")
+                    self._pool = None
+                self.failed += 1
+                cause = None if waiter.cancelled() else waiter.exception()
+                raise JobAbortedError(f"{func.__name__} не выполнена: пул процессов остановлен") from cause
+
+            try:
+                result = waiter.result()
+            except Exception:
+                self.failed += 1
+                raise
+        finally:
+            if release:
+                self._pending -= 1
+
+        self.completed += 1
+        logger.debug(f"{func.__name__} выполнена за {time.perf_counter() - started:.3f} с")
+        return result
+
+    def _retire(self, pool: ProcessPoolExecutor, job_done: bool = False):
+        """Вывод пула из работы: процессы завершаются, ожидающие задачи
+        отменяются в нем и передаются новому пулу (см. submit).
+        job_done - освободить место задачи, вызвавшей вывод"""
+        if self._pool is pool:
+            self._pool = None
+        self._retired.add(pool)
+        # Открытого списка процессов у ProcessPoolExecutor нет. Его нужно взять
+        # до shutdown (он очищает ссылки); если атрибута нет, зависшая задача
+        # не прерывается, но пул все равно заменяется новым
+        processes = list((getattr(pool, "_processes", None) or {}).values())
+        if not processes:
+            logger.warning("Процессы пула недоступны, зависшая задача доработает в фоне")
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+        task = asyncio.create_task(self._reap(processes, job_done))
+        self._retiring.add(task)
+        task.add_done_callback(self._retiring.discard)
+
+    async def _reap(self, processes, job_done: bool, grace: float = 5.0):
+        """Ожидание завершения процессов; не завершившиеся за grace - kill"""
+        def join():
+            deadline = time.monotonic() + grace
+            for process in processes:
+                process.join(max(0.0, deadline - time.monotonic()))
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+
+        try:
+            await asyncio.to_thread(join)
+        finally:
+            if job_done:
+                self._pending -= 1
+
+    def resize(self, max_workers: int):
+        """Новое количество процессов. Задачи, уже переданные старому пулу,
+        доработают в нем, новые пойдут в новый пул"""
+        if max_workers == self.max_workers:
+            return
+        self.max_workers = max_workers
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            pool.shutdown(wait=False)
+
+    async def shutdown(self, grace: float = 5.0):
+        """Остановка пула: ожидающие задачи отменяются, задачи, не завершившиеся
+        за grace секунд, останавливаются вместе с процессами"""
+        self._stopping = True
+        if self._pool is not None:
+            pool = self._pool
+            waiter = asyncio.ensure_future(asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True))
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), timeout=grace)
+            except asyncio.TimeoutError:
+                logger.warning("Задачи пула процессов не завершились и будут прерваны")
+                self._retire(pool)
+                await waiter
+            self._pool = None
+        if self._retiring:
+            await asyncio.gather(*self._retiring, return_exceptions=True)
+        self._stopping = False
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики задач"""
+        return {
+            "pending": self._pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "rejected": self.rejected
+        }
+
+
+class LoopLagMonitor:
+    """Измерение задержки цикла событий.
+
+    Задача засыпает на interval секунд и сравнивает фактическое время
+    пробуждения с ожидаемым: разница - время, в течение которого цикл был занят.
+    """
+
+    def __init__(self, interval: float = 0.5, window: int = 240, warn_threshold: float = 0.25):
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self._samples = deque(maxlen=window)
+
+    async def run(self):
+        """Бесконечный цикл замеров (запускается через asyncio.create_task)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self._samples.append(lag)
+            if lag > self.warn_threshold:
+                logger.warning(f"Цикл событий был заблокирован на {lag * 1000:.0f} мс")
+
+    def stats(self) -> Dict[str, float]:
+        """Задержка цикла в миллисекундах: последняя, средняя, p95 и максимальная"""
+        if not self._samples:
+            return {"last_ms": 0.0, "avg_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+        samples = sorted(self._samples)
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        return {
+            "last_ms": round(self._samples[-1] * 1000, 2),
+            "avg_ms": round(statistics.fmean(samples) * 1000, 2),
+            "p95_ms": round(p95 * 1000, 2),
+            "max_ms": round(samples[-1] * 1000, 2)
+        }
@@ -0,0 +1,245 @@
+"""
+Работа с адресами и координатами без внешних сервисов геокодирования.
+
+- normalize_address: канонический ключ адреса (одинаковый для "ул. Ленина, д.5"
+  и "улица ленина дом 5, кв 12") - по нему координаты, однажды полученные из
+  геопозиции Telegram, переиспользуются для других заявок по тому же адресу;
+- geohash: индекс для быстрого поиска заявок рядом по префиксу строки;
+- nearest_neighbor_route: приближенный кратчайший маршрут (жадный алгоритм
+  "ближайший сосед") с поиском соседей через сетку.
+"""
+
+import math
+import re
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+EARTH_RADIUS_KM = 6371.0
+
+# Сокращения в каноническом ключе адреса
+_ABBREVIATIONS = {
+    "улица": "ул", "ул": "ул",
+    "проспект": "пр", "пр-т": "пр", "просп": "пр", "пр": "пр",
+    "переулок": "пер", "пер": "пер",
+    "бульвар": "б-р", "бул": "б-р", "б-р": "б-р",
+    "шоссе": "ш", "ш": "ш",
+    "площадь": "пл", "пл": "пл",
+    "набережная": "наб", "наб": "наб",
+    "проезд": "пр-д", "пр-д": "пр-д",
+    "микрорайон": "мкр", "мкр": "мкр",
+    "город": "г", "г": "г",
+    "дом": "д", "д": "д",
+    "корпус": "к", "корп": "к", "к": "к",
+    "строение": "стр", "стр": "стр",
+}
+
+# Части адреса, не влияющие на положение здания
+_IGNORED_PARTS = {"кв", "квартира", "подъезд", "под", "этаж", "эт", "офис", "оф", "домофон"}
+
+_TOKEN_RE = re.compile(r"[0-9a-zа-я]+(?:-[0-9a-zа-я]+)*")
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def normalize_address(address: str) -> str:
+    """Канонический ключ адреса для сравнения и индексации"""
+    text = address.lower().replace("ё", "е")
+    tokens = _TOKEN_RE.findall(text)
+    result = []
+    skip_next = False
+    for token in tokens:
+        if skip_next:
+            skip_next = False
+            if token[0].isdigit():
+                continue
+        if token in _IGNORED_PARTS:
+            # "кв 12", "подъезд 3" - номер тоже пропускаем
+            skip_next = True
+            continue
+        result.append(_ABBREVIATIONS.get(token, token))
+    return " ".join(result)
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int = 8) -> str:
+    """Geohash точки (8 символов - ячейка примерно 38 x 19 м)"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits <<= 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """Размер ячейки geohash в градусах: (широта, долгота)"""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = math.floor(precision * 5 / 2)
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def geohash_neighborhood(latitude: float, longitude: float, precision: int) -> List[str]:
+    """Ячейка точки и 8 соседних ячеек - префиксы для поиска рядом"""
+    dlat, dlon = geohash_cell_size(precision)
+    cells = []
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            lat = min(90.0, max(-90.0, latitude + i * dlat))
+            lon = (longitude + j * dlon + 180.0) % 360.0 - 180.0
+            cell = geohash_encode(lat, lon, precision)
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+
+def precision_for_radius(radius_km: float, latitude: float = 0.0) -> int:
+    """Наибольшая точность geohash, при которой ячейка вокруг точки на широте
+    latitude не меньше radius_km (тогда точка и 8 соседних ячеек покрывают круг)"""
+    # Долгота сжимается к полюсам: берем косинус самой дальней от экватора
+    # широты круга
+    lat_extent = min(90.0, abs(latitude) + radius_km / 111.0)
+    lon_scale = math.cos(math.radians(lat_extent))
+    for precision in range(8, 0, -1):
+        dlat, dlon = geohash_cell_size(precision)
+        if min(dlat * 111.0, dlon * 111.0 * lon_scale) >= radius_km:
+            return precision
+    return 1
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по поверхности Земли, км"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class GridIndex:
+    """Сетка для поиска ближайшей точки без перебора всех точек.
+
+    Пока точек не больше scan_limit (обычный план на день), ближайшая ищется
+    перебором. Поиск по кольцам ячеек переходит на перебор, как только
+    просмотрено больше ячеек, чем в сетке занято: так одна далекая точка
+    (заявка в другом городе) не заставляет обходить миллионы пустых ячеек.
+    """
+
+    def __init__(self, cell_deg: float = 0.01, scan_limit: int = 64):
+        self.cell_deg = cell_deg
+        self.scan_limit = scan_limit
+        self._cells: Dict[Tuple[int, int], Dict[Hashable, Tuple[float, float]]] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return math.floor(latitude / self.cell_deg), math.floor(longitude / self.cell_deg)
+
+    def add(self, key: Hashable, latitude: float, longitude: float):
+        """Добавление точки"""
+        self._cells.setdefault(self._cell(latitude, longitude), {})[key] = (latitude, longitude)
+        self._size += 1
+
+    def remove(self, key: Hashable, latitude: float, longitude: float):
+        """Удаление точки"""
+        cell = self._cell(latitude, longitude)
+        del self._cells[cell][key]
+        if not self._cells[cell]:
+            del self._cells[cell]
+        self._size -= 1
+
+    def _scan(self, latitude: float, longitude: float) -> Tuple[Hashable, float, float]:
+        """Ближайшая точка перебором всех точек"""
+        best = None
+        best_km = math.inf
+        for points in self._cells.values():
+            for key, (lat, lon) in points.items():
+                km = haversine_km(latitude, longitude, lat, lon)
+                if km < best_km:
+                    best, best_km = (key, lat, lon), km
+        return best
+
+    def nearest(self, latitude: float, longitude: float) -> Optional[Tuple[Hashable, float, float]]:
+        """Ближайшая точка: (ключ, широта, долгота)"""
+        if not self._size:
+            return None
+        if self._size <= self.scan_limit:
+            return self._scan(latitude, longitude)
+        ci, cj = self._cell(latitude, longitude)
+        best = None
+        best_km = math.inf
+        radius = 0
+        while (2 * radius + 1) ** 2 <= len(self._cells):
+            for i in range(ci - radius, ci + radius + 1):
+                for j in range(cj - radius, cj + radius + 1):
+                    if radius and abs(i - ci) != radius and abs(j - cj) != radius:
+                        continue  # Внутренние ячейки уже просмотрены
+                    for key, (lat, lon) in self._cells.get((i, j), {}).items():
+                        km = haversine_km(latitude, longitude, lat, lon)
+                        if km < best_km:
+                            best, best_km = (key, lat, lon), km
+            # Нижняя граница расстояния до точек за кольцом radius: по широте
+            # 111 км на градус, по долготе - с косинусом самой дальней от
+            # экватора широты просмотренного квадрата
+            lat_extent = min(90.0, abs(latitude) + (radius + 1) * self.cell_deg)
+            outside_km = radius * self.cell_deg * 111.0 * math.cos(math.radians(lat_extent))
+            if best is not None and outside_km >= best_km:
+                return best
+            radius += 1
+        return self._scan(latitude, longitude)
+
+
+def nearest_neighbor_route(
+    start: Optional[Tuple[float, float]],
+    points: Sequence[Tuple[Hashable, float, float]]
+) -> Tuple[List[Hashable], List[float]]:
+    """Порядок обхода точек жадным алгоритмом "ближайший сосед".
+
+    Возвращает ключи в порядке обхода и расстояние до каждой точки от
+    предыдущей (для первой - от start; 0, если start не задан).
+    """
+    if not points:
+        return [], []
+    index = GridIndex()
+    for key, lat, lon in points:
+        index.add(key, lat, lon)
+
+    if start is None:
+        key, lat, lon = points[0]
+        index.remove(key, lat, lon)
+        order, legs = [key], [0.0]
+        current = (lat, lon)
+    else:
+        order, legs = [], []
+        current = start
+
+    while len(index):
+        key, lat, lon = index.nearest(*current)
+        index.remove(key, lat, lon)
+        order.append(key)
+        legs.append(haversine_km(current[0], current[1], lat, lon))
+        current = (lat, lon)
+    return order, legs
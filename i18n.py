@@ -0,0 +1,208 @@
+"""
+Тексты сообщений и локализация.
+
+Шаблоны лежат в locales/<код>.json (ключ -> текст с полями {name} в синтаксисе
+str.format) и компилируются один раз при первом обращении к get_catalog():
+каждый шаблон разбирается на части "текст + поле", и отрисовка - это один
+"".join без повторного разбора строки. Недостающие в переводе ключи берутся из
+языка по умолчанию (ru).
+
+Язык пользователя определяет LocaleResolver: явный выбор командой /lang
+(хранится в базе), иначе language_code из Telegram. LocaleMiddleware (bot.py)
+передает обработчикам функцию перевода t, привязанную к языку пользователя.
+
+Модуль не импортирует aiogram: его вместе с rendering загружают рабочие
+процессы пула, и холодный запуск процесса не должен ждать импорта aiogram.
+"""
+
+import json
+import logging
+import os
+import string
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCALE = "ru"
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales")
+
+# Общие таблицы форматирования (не зависят от языка)
+STATUS_EMOJI = {
+    "pending": "⏳",
+    "in_progress": "🔧",
+    "long_repair": "⏳",
+    "completed": "✅",
+    "cancelled": "❌",
+    "refused": "🚫"
+}
+
+_formatter = string.Formatter()
+
+
+class Template:
+    """Скомпилированный шаблон: части (текст, поле, формат) для одного join"""
+
+    __slots__ = ("key", "source", "fields", "_parts")
+
+    def __init__(self, key: str, source: str):
+        self.key = key
+        self.source = source
+        parts: List[Tuple[str, Optional[str], str]] = []
+        for literal, field, spec, conversion in _formatter.parse(source):
+            if conversion:
+                raise ValueError(f"{key}: преобразования !{conversion} не поддерживаются")
+            if field is not None and (not field or not field.isidentifier()):
+                raise ValueError(f"{key}: недопустимое поле {{{field}}}")
+            parts.append((literal, field, spec or ""))
+        self._parts = tuple(parts)
+        self.fields: FrozenSet[str] = frozenset(field for _, field, _ in parts if field)
+
+    def render(self, values: Mapping[str, Any]) -> str:
+        """Подстановка значений полей"""
+        if not self.fields:
+            return self.source
+        pieces = []
+        for literal, field, spec in self._parts:
+            pieces.append(literal)
+            if field is not None:
+                pieces.append(format(values[field], spec))
+        return "".join(pieces)
+
+
+class Translator:
+    """Функция перевода, привязанная к языку: t("ключ", поле=значение)"""
+
+    __slots__ = ("locale", "_templates")
+
+    def __init__(self, locale: str, templates: Dict[str, Template]):
+        self.locale = locale
+        self._templates = templates
+
+    def __call__(self, key: str, **values) -> str:
+        return self._templates[key].render(values)
+
+
+class Catalog:
+    """Скомпилированные шаблоны всех языков"""
+
+    def __init__(self, templates: Dict[str, Dict[str, Template]], default: str = DEFAULT_LOCALE):
+        if default not in templates:
+            raise ValueError(f"Нет шаблонов языка по умолчанию: {default}")
+        self.default = default
+        self._translators = {
+            locale: Translator(locale, locale_templates)
+            for locale, locale_templates in templates.items()
+        }
+        self._variants: Dict[str, FrozenSet[str]] = {}
+
+    @classmethod
+    def load(cls, directory: str = LOCALES_DIR, default: str = DEFAULT_LOCALE) -> "Catalog":
+        """Загрузка и компиляция locales/*.json с проверкой полей переводов"""
+        sources: Dict[str, Dict[str, str]] = {}
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".json"):
+                with open(os.path.join(directory, name), encoding="utf-8") as f:
+                    sources[name[:-len(".json")]] = json.load(f)
+        if default not in sources:
+            raise ValueError(f"Нет файла {default}.json в {directory}")
+
+        base = {key: Template(key, text) for key, text in sources[default].items()}
+        templates = {default: base}
+        for locale, texts in sources.items():
+            if locale == default:
+                continue
+            compiled = dict(base)
+            for key, text in texts.items():
+                if key not in base:
+                    logger.warning(f"{locale}.json: ключа {key} нет в {default}.json")
+                    continue
+                template = Template(key, text)
+                unknown = template.fields - base[key].fields
+                if unknown:
+                    raise ValueError(f"{locale}.json: {key}: неизвестные поля {sorted(unknown)}")
+                compiled[key] = template
+            missing = base.keys() - texts.keys()
+            if missing:
+                logger.warning(f"{locale}.json: нет перевода для {len(missing)} ключей, "
+                               f"используется {default}")
+            templates[locale] = compiled
+        return cls(templates, default)
+
+    @property
+    def locales(self) -> List[str]:
+        """Коды доступных языков"""
+        return sorted(self._translators)
+
+    def __contains__(self, locale) -> bool:
+        return locale in self._translators
+
+    def translator(self, locale: Optional[str]) -> Translator:
+        """Функция перевода для языка (неизвестный язык - язык по умолчанию)"""
+        return self._translators.get(locale) or self._translators[self.default]
+
+    def negotiate(self, language_code: Optional[str]) -> str:
+        """Язык по language_code Telegram ("en-US" -> "en")"""
+        if language_code:
+            code = language_code.lower().replace("_", "-").split("-")[0]
+            if code in self._translators:
+                return code
+        return self.default
+
+    def variants(self, key: str) -> FrozenSet[str]:
+        """Текст ключа на всех языках - для фильтров кнопок"""
+        if key not in self._variants:
+            self._variants[key] = frozenset(
+                translator(key) for translator in self._translators.values()
+            )
+        return self._variants[key]
+
+    def matches(self, text: Optional[str], key: str) -> bool:
+        """Совпадает ли текст сообщения с кнопкой key на любом языке"""
+        return text is not None and text in self.variants(key)
+
+    def key_for(self, text: Optional[str], keys: Iterable[str]) -> Optional[str]:
+        """Какой из ключей keys соответствует тексту (на любом языке)"""
+        for key in keys:
+            if self.matches(text, key):
+                return key
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_catalog() -> Catalog:
+    """Каталог шаблонов процесса (загружается один раз)"""
+    return Catalog.load()
+
+
+class LocaleResolver:
+    """Язык пользователя: выбор через /lang, иначе язык клиента Telegram"""
+
+    def __init__(self, catalog: Catalog, db):
+        self.catalog = catalog
+        self.db = db
+        self._chosen: Dict[int, Optional[str]] = {}
+
+    async def resolve(self, user_id: Optional[int], language_code: Optional[str] = None) -> str:
+        """Код языка пользователя"""
+        if user_id is not None:
+            if user_id not in self._chosen:
+                try:
+                    self._chosen[user_id] = await self.db.get_user_locale(user_id)
+                except Exception as e:
+                    logger.warning(f"Не удалось получить язык пользователя {user_id}: {e}")
+                    return self.catalog.negotiate(language_code)
+            chosen = self._chosen[user_id]
+            if chosen in self.catalog:
+                return chosen
+        return self.catalog.negotiate(language_code)
+
+    async def choose(self, user_id: int, locale: str):
+        """Сохранение выбранного пользователем языка"""
+        await self.db.set_user_locale(user_id, locale)
+        self._chosen[user_id] = locale
+
+    async def translator_for(self, user_id: Optional[int], language_code: Optional[str] = None) -> Translator:
+        """Функция перевода для пользователя"""
+        return self.catalog.translator(await self.resolve(user_id, language_code))
+
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Защита от повторного создания заявок.
+
+Двойное нажатие или повторная доставка сообщения Telegram могут запустить
+сохранение заявки дважды. Для каждой заявки вычисляется ключ идемпотентности -
+хеш пользователя, сценария создания (message_id команды «Новая заявка») и
+введенных данных. Ключ хранится в orders.idempotency_key с уникальным индексом:
+повторная вставка не создает заявку, а возвращает номер уже существующей.
+RecentKeys - небольшой кэш последних ключей, который отвечает без обращения к
+базе.
+
+Заявки-дубликаты, созданные до появления ключей, удаляет команда dedupe:
+    python3 idempotency.py dedupe               # показать дубликаты
+    python3 idempotency.py dedupe --window 600  # дубликаты в пределах 10 минут
+    python3 idempotency.py dedupe --apply       # удалить
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import sys
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from database import Database
+from settings import SettingsError, load_settings
+
+
+def order_key(user_id: int, flow_id: Any, address: str, time: str,
+              equipment_type: str, problem: str) -> str:
+    """Ключ идемпотентности заявки"""
+    content = json.dumps(
+        [user_id, flow_id, address, time, equipment_type, problem], ensure_ascii=False
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class RecentKeys:
+    """Ограниченный кэш последних ключей: ключ -> номер заявки (вытеснение LRU)"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[Hashable, int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Hashable) -> Optional[int]:
+        """Номер заявки по ключу, если ключ недавно встречался"""
+        value = self._items.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: int):
+        """Запоминание ключа"""
+        if self.maxsize <= 0:
+            return
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def resize(self, maxsize: int):
+        """Новый размер кэша; при уменьшении вытесняются самые старые ключи"""
+        self.maxsize = maxsize
+        while len(self._items) > max(maxsize, 0):
+            self._items.popitem(last=False)
+
+    def stats(self):
+        """Счетчики кэша"""
+        return {"size": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+async def _cli(args) -> int:
+    db = Database(args.db)
+    await db.init_db()
+    duplicates = await db.find_duplicate_orders(args.window)
+    for duplicate_id, original_id, user_id in duplicates:
+        print(json.dumps({"order_id": duplicate_id, "duplicate_of": original_id, "user_id": user_id}))
+    if not args.apply:
+        print(f"Найдено дубликатов: {len(duplicates)} (для удаления добавьте --apply)")
+        return 0
+    print(f"Удалено дубликатов: {await db.remove_duplicate_orders(duplicates)}")
+    return 0
+
+
+def main():
+    try:
+        config = load_settings(require=False)
+    except SettingsError as e:
+        print(f"❌ Ошибка в настройках: {e}")
+        return 1
+    parser = argparse.ArgumentParser(description="Заявки-дубликаты")
+    parser.add_argument("--db", default=config.database_path,
+                        help="база (по умолчанию DATABASE_PATH из .env)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    dedupe_parser = subparsers.add_parser("dedupe", help="найти и удалить дубликаты заявок")
+    dedupe_parser.add_argument("--window", type=float, default=300,
+                               help="максимальный интервал между дубликатами, секунды")
+    dedupe_parser.add_argument("--apply", action="store_true", help="удалить найденные дубликаты")
+    args = parser.parse_args()
+
+    return asyncio.run(_cli(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Локальный кэш вложений с адресацией по содержимому.
+
+Файлы скачиваются из Telegram потоково, порциями по chunk_size байт: каждая
+порция сразу пишется во временный файл и добавляется в хеш SHA-256, поэтому
+большие фото не загружаются в память целиком. Итоговое имя файла - его хеш,
+так что одинаковые фото хранятся один раз. Размер кэша ограничен max_bytes:
+при превышении удаляются файлы, к которым дольше всего не обращались (LRU).
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Dict, Optional
+
+from aiogram import Bot
+
+logger = logging.getLogger(__name__)
+
+
+class _HashingWriter:
+    """Файловый объект для Bot.download_file: пишет на диск и считает SHA-256"""
+
+    def __init__(self, file):
+        self._file = file
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes) -> int:
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+        return self._file.write(chunk)
+
+    def flush(self):
+        self._file.flush()
+
+
+class MediaCache:
+    """Кэш файлов вложений на диске"""
+
+    def __init__(self, bot: Bot, root: str, max_bytes: int = 500 * 2**20, chunk_size: int = 64 * 1024):
+        self.bot = bot
+        self.root = root
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self._lock = asyncio.Lock()
+        self.downloads = 0
+        self.deduplicated = 0
+        self.evicted = 0
+
+    def path_for(self, sha256: str) -> str:
+        """Путь к файлу в кэше по хешу содержимого"""
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def get(self, sha256: str) -> Optional[str]:
+        """Путь к файлу, если он есть в кэше; обращение обновляет время для LRU"""
+        path = self.path_for(sha256)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    async def fetch(self, file_id: str) -> str:
+        """Скачивание файла в кэш; возвращает SHA-256 содержимого"""
+        os.makedirs(self.root, exist_ok=True)
+        telegram_file = await self.bot.get_file(file_id)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                writer = _HashingWriter(tmp)
+                await self.bot.download_file(
+                    telegram_file.file_path, destination=writer,
+                    chunk_size=self.chunk_size, seek=False
+                )
+            sha256 = writer.sha256.hexdigest()
+            path = self.path_for(sha256)
+            if os.path.exists(path):
+                # Такой файл уже есть: временная копия не нужна
+                os.remove(tmp_path)
+                os.utime(path)
+                self.deduplicated += 1
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                self.downloads += 1
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        await self.evict()
+        return sha256
+
+    def _evict(self) -> int:
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".part"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return 0
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass  # В каталоге есть другие файлы
+        return removed
+
+    async def evict(self):
+        """Удаление давно не использованных файлов, пока кэш больше max_bytes"""
+        async with self._lock:
+            removed = await asyncio.to_thread(self._evict)
+        if removed:
+            self.evicted += removed
+            logger.info(f"Из кэша вложений удалено файлов: {removed}")
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики кэша"""
+        return {
+            "downloads": self.downloads,
+            "deduplicated": self.deduplicated,
+            "evicted": self.evicted
+        }
@@ -0,0 +1,212 @@
+"""
+Диагностика производительности бота: задержка цикла событий, обработчики
+в работе по группам состояний, потоки aiosqlite и сэмплирующий профилировщик.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from executor import LoopLagMonitor
+
+logger = logging.getLogger(__name__)
+
+
+class InflightMiddleware(BaseMiddleware):
+    """Подсчет обработчиков, выполняющихся прямо сейчас, по группам состояний FSM"""
+
+    def __init__(self):
+        self.inflight: Counter = Counter()
+        self.handled: Counter = Counter()
+        self.slowest: Dict[str, float] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        raw_state = data.get("raw_state")
+        # "OrderStates:waiting_address" -> "OrderStates"
+        group = raw_state.split(":", 1)[0] if raw_state else "no_state"
+        self.inflight[group] += 1
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.inflight[group] -= 1
+            self.handled[group] += 1
+            self.slowest[group] = max(self.slowest.get(group, 0.0), elapsed)
+
+
+def count_aiosqlite_threads() -> int:
+    """Количество живых рабочих потоков aiosqlite (по одному на открытое соединение)"""
+    count = 0
+    for thread in threading.enumerate():
+        target = getattr(thread, "_target", None)
+        if getattr(target, "__module__", "").startswith("aiosqlite"):
+            count += 1
+        elif type(thread).__module__.startswith("aiosqlite"):
+            # Старые версии aiosqlite: Connection наследуется от Thread
+            count += 1
+    return count
+
+
+class Watchdog:
+    """Периодический сбор метрик и предупреждения в лог"""
+
+    def __init__(
+        self,
+        lag_monitor: LoopLagMonitor,
+        inflight: InflightMiddleware,
+        interval: float = 60.0,
+        thread_warn_threshold: int = 20
+    ):
+        self.lag_monitor = lag_monitor
+        self.inflight = inflight
+        self.interval = interval
+        self.thread_warn_threshold = thread_warn_threshold
+        self.started_at = time.time()
+        self.max_aiosqlite_threads = 0
+
+    async def run(self):
+        """Бесконечный цикл сбора метрик (запускается через asyncio.create_task)"""
+        while True:
+            await asyncio.sleep(self.interval)
+            snapshot = self.snapshot()
+            logger.info(
+                f"Watchdog: задержка цикла p95={snapshot['loop_lag']['p95_ms']} мс, "
+                f"задач asyncio={snapshot['asyncio_tasks']}, "
+                f"потоков aiosqlite={snapshot['aiosqlite_threads']}"
+            )
+            if snapshot["aiosqlite_threads"] > self.thread_warn_threshold:
+                logger.warning(
+                    f"Открыто {snapshot['aiosqlite_threads']} соединений aiosqlite одновременно"
+                )
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущее состояние бота"""
+        aiosqlite_threads = count_aiosqlite_threads()
+        self.max_aiosqlite_threads = max(self.max_aiosqlite_threads, aiosqlite_threads)
+        return {
+            "uptime_s": int(time.time() - self.started_at),
+            "loop_lag": self.lag_monitor.stats(),
+            "asyncio_tasks": len(asyncio.all_tasks()),
+            "threads": threading.active_count(),
+            "aiosqlite_threads": aiosqlite_threads,
+            "aiosqlite_threads_max": self.max_aiosqlite_threads,
+            "inflight": {group: n for group, n in self.inflight.inflight.items() if n},
+            "handled": dict(self.inflight.handled),
+            "slowest_s": {group: round(t, 3) for group, t in self.inflight.slowest.items()}
+        }
+
+
+def format_snapshot(snapshot: Dict[str, Any], extra: Optional[Dict[str, Any]] = None) -> str:
+    """Текст отчета для команды /debug"""
+    lag = snapshot["loop_lag"]
+    lines = [
+        "🩺 Состояние бота",
+        "",
+        f"Время работы: {snapshot['uptime_s']} с",
+        f"Задержка цикла: последняя {lag['last_ms']} мс, p95 {lag['p95_ms']} мс, "
+        f"макс. {lag['max_ms']} мс",
+        f"Задач asyncio: {snapshot['asyncio_tasks']}",
+        f"Потоков всего: {snapshot['threads']}",
+        f"Потоков aiosqlite: {snapshot['aiosqlite_threads']} "
+        f"(макс. {snapshot['aiosqlite_threads_max']})",
+        "",
+        "Обработчики в работе:"
+    ]
+    if snapshot["inflight"]:
+        lines.extend(f"• {group}: {n}" for group, n in sorted(snapshot["inflight"].items()))
+    else:
+        lines.append("• нет")
+    lines.append("")
+    lines.append("Обработано / самый долгий:")
+    for group, n in sorted(snapshot["handled"].items()):
+        lines.append(f"• {group}: {n} / {snapshot['slowest_s'].get(group, 0)} с")
+    for title, values in (extra or {}).items():
+        lines.append("")
+        lines.append(f"{title}:")
+        lines.extend(f"• {key}: {value}" for key, value in values.items())
+    return "\n".join(lines)
+
+
+class SamplingProfiler:
+    """Сэмплирующий профилировщик всех потоков процесса.
+
+    Через равные интервалы снимает стеки всех потоков (sys._current_frames)
+    и сохраняет их в свернутом формате "функция;функция;... количество",
+    который понимают flamegraph.pl и speedscope.
+    """
+
+    def __init__(self, output_dir: str = "profiles"):
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        """Идет ли сейчас профилирование"""
+        return self._lock.locked()
+
+    def _sample(self, duration: float, interval: float) -> Counter:
+        stacks: Counter = Counter()
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                frames = [
+                    f"{os.path.basename(entry.filename)}:{entry.name}:{entry.lineno}"
+                    for entry in traceback.extract_stack(frame)
+                ]
+                stacks[";".join([names.get(thread_id, str(thread_id))] + frames)] += 1
+            time.sleep(interval)
+        return stacks
+
+    def _write(self, stacks: Counter) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(
+            self.output_dir,
+            f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.folded"
+        )
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    async def profile(self, duration: float = 10.0, interval: float = 0.01) -> str:
+        """Профилирование в отдельном потоке; возвращает путь к файлу со стеками"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Профилирование уже запущено")
+        try:
+            stacks = await asyncio.to_thread(self._sample, duration, interval)
+            return await asyncio.to_thread(self._write, stacks)
+        finally:
+            self._lock.release()
+
+
+def hot_stacks(path: str, limit: int = 5) -> str:
+    """Самые частые стеки из файла профиля (последние кадры каждого стека)"""
+    lines = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if len(lines) >= limit:
+                break
+            stack, count = line.rstrip("\n").rsplit(" ", 1)
+            frames = stack.split(";")
+            lines.append(f"{count} × {' → '.join(frames[-3:])}")
+    return "\n".join(lines)
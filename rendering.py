@@ -0,0 +1,127 @@
+"""
+Формирование текстов списков заявок.
+
+Функции модуля чистые (без обращения к БД и Telegram), поэтому их можно
+выполнять как в основном процессе, так и в пуле процессов (см. executor.py).
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from database import Order, Report
+from i18n import DEFAULT_LOCALE, STATUS_EMOJI, get_catalog
+
+# Максимальная длина сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+
+def split_message(header: str, blocks: Iterable[str], limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Разбиение текста на сообщения не длиннее limit, не разрывая блоки заявок"""
+    chunks = []
+    current = [header]
+    size = len(header)
+    for block in blocks:
+        if size + len(block) > limit and size > 0:
+            chunks.append("".join(current))
+            current = []
+            size = 0
+        # Одиночный блок длиннее лимита режем принудительно
+        while len(block) > limit:
+            chunks.append(block[:limit])
+            block = block[limit:]
+        current.append(block)
+        size += len(block)
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def render_active_orders(orders: List[Order], latest_reports: Dict[int, Report],
+                         locale: str = DEFAULT_LOCALE) -> List[str]:
+    """Текст списка активных заявок"""
+    t = get_catalog().translator(locale)
+    statuses = {status: t(f"status.{status}") for status in STATUS_EMOJI}
+    blocks = []
+    for order in orders:
+        parts = [t(
+            "list.active_item",
+            emoji=STATUS_EMOJI.get(order.status, "❓"),
+            order_id=order.id,
+            address=order.address,
+            time=order.time,
+            equipment_type=order.equipment_type,
+            problem=order.problem,
+            status=statuses.get(order.status, order.status)
+        )]
+
+        # Если это длительный ремонт, показываем информацию из отчета
+        latest_report: Optional[Report] = latest_reports.get(order.id)
+        if order.status == "long_repair" and latest_report:
+            parts.append(t(
+                "list.long_repair_details",
+                agreed_amount=latest_report.agreed_amount,
+                completion_date=latest_report.completion_date,
+                completion_time=latest_report.completion_time,
+                what_to_do=latest_report.what_to_do
+            ))
+
+        parts.append("\n")
+        blocks.append("".join(parts))
+
+    return split_message(t("list.active_header"), blocks)
+
+
+def render_completed_orders(orders: List[Order], latest_reports: Dict[int, Report],
+                            locale: str = DEFAULT_LOCALE) -> List[str]:
+    """Текст списка завершенных заявок"""
+    t = get_catalog().translator(locale)
+    blocks = []
+    for order in orders:
+        parts = [t(
+            "list.completed_item",
+            order_id=order.id,
+            address=order.address,
+            time=order.time,
+            equipment_type=order.equipment_type,
+            problem=order.problem
+        )]
+
+        latest_report: Optional[Report] = latest_reports.get(order.id)
+        if latest_report and latest_report.total_amount:
+            parts.append(t(
+                "list.completed_amounts",
+                total_amount=latest_report.total_amount,
+                cost_price=latest_report.cost_price
+            ))
+
+        parts.append("\n")
+        blocks.append("".join(parts))
+
+    return split_message(t("list.completed_header"), blocks)
+
+
+def render_route(stops: List[Tuple[Order, float]], unlocated: List[Order], day: str,
+                 locale: str = DEFAULT_LOCALE) -> List[str]:
+    """Текст маршрута на день: заявки в порядке объезда, затем заявки без координат"""
+    t = get_catalog().translator(locale)
+    blocks = []
+    for number, (order, km) in enumerate(stops, start=1):
+        blocks.append(t(
+            "route.stop",
+            number=number,
+            emoji=STATUS_EMOJI.get(order.status, "❓"),
+            order_id=order.id,
+            distance=t("route.distance", km=km) if km else "",
+            address=order.address,
+            time=order.time,
+            equipment_type=order.equipment_type
+        ))
+    if stops:
+        blocks.append(t("route.total", km=sum(km for _, km in stops)))
+
+    if unlocated:
+        blocks.append(t("route.unlocated_header"))
+        for order in unlocated:
+            blocks.append(t("route.unlocated_item", order_id=order.id,
+                            address=order.address, time=order.time))
+
+    return split_message(t("route.header", day=day), blocks)
@@ -0,0 +1,281 @@
+"""
+Настройки бота: типизированные параметры из переменных окружения и .env.
+
+Все параметры описаны в классе Settings: тип, значение по умолчанию, проверки
+и признак restart - применяется ли параметр только при запуске. load_settings()
+читает .env и окружение процесса (окружение важнее, как у load_dotenv) и
+проверяет значения; ошибки собираются в одно исключение SettingsError.
+
+SettingsManager перечитывает настройки по сигналу SIGHUP или при изменении
+файла .env и передает подписчикам изменившиеся параметры, чтобы применить их
+без перезапуска (и без потери состояний диалогов в MemoryStorage). Изменения
+параметров с restart=True не применяются до перезапуска, о чем пишется в лог.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import sys
+from dataclasses import dataclass, field, fields, replace
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List, Mapping, Optional, Tuple, Union
+
+from dotenv import dotenv_values
+
+logger = logging.getLogger(__name__)
+
+ENV_FILE = ".env"
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+
+
+class SettingsError(ValueError):
+    """Недопустимые значения настроек"""
+
+    def __init__(self, errors: List[str]):
+        self.errors = errors
+        super().__init__("; ".join(errors))
+
+
+def setting(default: Any, *, restart: bool = False, minimum: Optional[float] = None,
+            choices: Optional[Tuple[str, ...]] = None, required: bool = False):
+    """Описание параметра: значение по умолчанию и проверки"""
+    return field(default=default, metadata={
+        "restart": restart,
+        "minimum": minimum,
+        "choices": choices,
+        "required": required
+    })
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Параметры бота. Имя переменной окружения - имя поля в верхнем регистре"""
+    bot_token: str = setting("", restart=True, required=True)
+    database_path: str = setting("orders.db", restart=True)
+    # Постоянные соединения с базой (0 - новое соединение на каждый запрос)
+    database_pool_size: int = setting(0, minimum=0)
+    # Пул процессов для тяжелых задач
+    executor_workers: int = setting(2, minimum=1)
+    executor_max_pending: int = setting(16, minimum=1)
+    executor_job_timeout: float = setting(30.0, minimum=1)
+    heavy_list_threshold: int = setting(50, minimum=0)
+    admin_ids: FrozenSet[int] = setting(frozenset())
+    watchdog_interval: float = setting(60.0, minimum=1)
+    profile_dir: str = setting("profiles")
+    # Резервное копирование (интервал 0 - отключено)
+    backup_dir: str = setting("backups")
+    backup_interval_hours: float = setting(24.0, minimum=0)
+    backup_keep: int = setting(7, minimum=1)
+    backup_compress: bool = setting(True)
+    backup_pages_per_step: int = setting(100, minimum=1)
+    # Очередь неудавшихся записей
+    dead_letter_path: str = setting("dead_letters.db", restart=True)
+    dlq_max_attempts: int = setting(10, minimum=1)
+    dlq_base_delay: float = setting(5.0, minimum=0)
+    dlq_max_delay: float = setting(600.0, minimum=0)
+    # Локальный кэш вложений (пустое значение - не скачивать файлы)
+    media_cache_dir: str = setting("", restart=True)
+    media_cache_max_mb: int = setting(500, minimum=1)
+    idempotency_cache_size: int = setting(1024, minimum=0)
+    nearby_radius_km: float = setting(2.0, minimum=0.1)
+    # API администратора (пустой токен - не запускать)
+    admin_api_token: str = setting("", restart=True)
+    admin_api_host: str = setting("127.0.0.1", restart=True)
+    admin_api_port: int = setting(8080, restart=True, minimum=1)
+    admin_api_cache_ttl: float = setting(5.0, minimum=0)
+    # Журнал (пустой LOG_FILE - только вывод в консоль)
+    log_level: str = setting("INFO", choices=LOG_LEVELS)
+    log_file: str = setting("bot.log")
+    # Период проверки изменения .env, секунды (0 - только по SIGHUP)
+    settings_watch_interval: float = setting(5.0, minimum=0)
+
+    @staticmethod
+    def env_name(name: str) -> str:
+        return name.upper()
+
+    @classmethod
+    def restart_only(cls) -> FrozenSet[str]:
+        """Параметры, которые применяются только при запуске"""
+        return frozenset(f.name for f in fields(cls) if f.metadata["restart"])
+
+
+def _parse(kind: Any, raw: str) -> Any:
+    """Строка из окружения -> значение типа параметра"""
+    raw = raw.strip()
+    if kind is bool:
+        value = raw.lower()
+        if value in ("1", "true", "yes", "on"):
+            return True
+        if value in ("0", "false", "no", "off"):
+            return False
+        raise ValueError("ожидается true или false")
+    if kind is int:
+        return int(raw)
+    if kind is float:
+        return float(raw)
+    if kind == FrozenSet[int]:
+        return frozenset(int(x) for x in raw.replace(" ", "").split(",") if x)
+    return raw
+
+
+def read_environment(env_file: str = ENV_FILE,
+                     environ: Optional[Mapping[str, str]] = None) -> Dict[str, str]:
+    """Значения из .env, поверх которых - переменные окружения процесса"""
+    values = {}
+    if env_file and os.path.exists(env_file):
+        values.update((k, v) for k, v in dotenv_values(env_file).items() if v is not None)
+    values.update(os.environ if environ is None else environ)
+    return values
+
+
+def load_settings(env_file: str = ENV_FILE, environ: Optional[Mapping[str, str]] = None,
+                  require: bool = True) -> Settings:
+    """Чтение и проверка настроек; SettingsError со списком всех ошибок.
+
+    require=False - не проверять обязательные параметры: служебным командам
+    (резервные копии, очередь повторов) токен бота не нужен.
+    """
+    source = read_environment(env_file, environ)
+    values: Dict[str, Any] = {}
+    errors = []
+    for f in fields(Settings):
+        name = Settings.env_name(f.name)
+        raw = source.get(name)
+        if raw is None or raw.strip() == "":
+            if require and f.metadata["required"]:
+                errors.append(f"{name} не установлен")
+            continue
+        try:
+            value = _parse(f.type, raw)
+        except ValueError:
+            errors.append(f"{name}: недопустимое значение {raw!r}")
+            continue
+        if f.metadata["minimum"] is not None and value < f.metadata["minimum"]:
+            errors.append(f"{name}: значение должно быть не меньше {f.metadata['minimum']:g}")
+            continue
+        if f.metadata["choices"] is not None:
+            value = value.upper()
+            if value not in f.metadata["choices"]:
+                errors.append(f"{name}: допустимые значения {', '.join(f.metadata['choices'])}")
+                continue
+        values[f.name] = value
+    if errors:
+        raise SettingsError(errors)
+    return Settings(**values)
+
+
+def diff(old: Settings, new: Settings) -> Dict[str, Tuple[Any, Any]]:
+    """Изменившиеся параметры: имя -> (старое, новое)"""
+    return {
+        f.name: (getattr(old, f.name), getattr(new, f.name))
+        for f in fields(Settings)
+        if getattr(old, f.name) != getattr(new, f.name)
+    }
+
+
+def configure_logging(settings: Settings):
+    """Уровень и обработчики корневого логгера по настройкам (повторный вызов
+    заменяет обработчики, установленные ранее)"""
+    root = logging.getLogger()
+    formatter = logging.Formatter(LOG_FORMAT)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stdout)]
+    if settings.log_file:
+        handlers.append(logging.FileHandler(settings.log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        root.addHandler(handler)
+    root.setLevel(settings.log_level)
+
+
+Subscriber = Callable[[Settings, Dict[str, Tuple[Any, Any]]], Union[None, Awaitable[None]]]
+
+
+class SettingsManager:
+    """Текущие настройки и их перечитывание без перезапуска"""
+
+    def __init__(self, env_file: str = ENV_FILE):
+        self.env_file = env_file
+        # Окружение процесса на момент запуска: значения из .env в него не
+        # попадают, иначе перечитанный файл не смог бы их изменить
+        self._environ = dict(os.environ)
+        self.current = load_settings(env_file, self._environ)
+        self._subscribers: List[Subscriber] = []
+        self._lock = asyncio.Lock()
+        self._file_state = self._stat()
+        self.reloads = 0
+        self.failed_reloads = 0
+
+    def subscribe(self, callback: Subscriber):
+        """callback(settings, changed) вызывается после каждого перечитывания
+        с изменениями; может быть корутиной"""
+        self._subscribers.append(callback)
+
+    def _stat(self) -> Optional[Tuple[float, int]]:
+        try:
+            st = os.stat(self.env_file)
+        except OSError:
+            return None
+        return st.st_mtime, st.st_size
+
+    async def reload(self) -> Dict[str, Tuple[Any, Any]]:
+        """Перечитывание настроек и применение изменений; при ошибках в файле
+        остаются прежние значения"""
+        async with self._lock:
+            self._file_state = self._stat()
+            try:
+                new = load_settings(self.env_file, self._environ)
+            except SettingsError as e:
+                self.failed_reloads += 1
+                logger.error(f"Настройки не перечитаны, остаются прежние: {e}")
+                return {}
+
+            changed = diff(self.current, new)
+            pending = sorted(changed.keys() & Settings.restart_only())
+            if pending:
+                logger.warning(
+                    "Изменения применятся после перезапуска: "
+                    + ", ".join(Settings.env_name(name) for name in pending)
+                )
+                new = replace(new, **{name: getattr(self.current, name) for name in pending})
+                for name in pending:
+                    del changed[name]
+            if not changed:
+                logger.info("Настройки перечитаны: изменений нет")
+                return {}
+
+            self.current = new
+            self.reloads += 1
+            logger.info(
+                "Настройки изменены: "
+                + ", ".join(Settings.env_name(name) for name in sorted(changed))
+            )
+            for callback in self._subscribers:
+                try:
+                    result = callback(new, changed)
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    logger.exception(f"Ошибка применения настроек ({callback.__name__}): {e}")
+            return changed
+
+    def install_signal_handler(self, spawn: Callable[[Awaitable], Any]) -> bool:
+        """Перечитывание по SIGHUP (там, где сигнал поддерживается).
+        spawn - функция запуска фоновой задачи"""
+        if not hasattr(signal, "SIGHUP"):
+            return False
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, lambda: spawn(self.reload()))
+        return True
+
+    async def watch(self):
+        """Проверка изменения файла .env (запускается через asyncio.create_task)"""
+        while True:
+            await asyncio.sleep(self.current.settings_watch_interval or 5.0)
+            if self.current.settings_watch_interval and self._stat() != self._file_state:
+                await self.reload()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"перечитываний": self.reloads, "ошибок": self.failed_reloads}
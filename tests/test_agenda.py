@@ -0,0 +1,40 @@
+from datetime import date
+
+from agenda import is_due_on, plan_route, scheduled_date
+from database import Order
+
+
+def make_order(order_id, time="10:00", latitude=None, longitude=None, created_at="2024-12-30 09:00:00"):
+    return Order(order_id, 1, f"Адрес {order_id}", time, "e", "p", "pending", created_at,
+                 latitude=latitude, longitude=longitude)
+
+
+def test_scheduled_date_formats():
+    assert scheduled_date(make_order(1, "2025-01-05 14:00")) == date(2025, 1, 5)
+    assert scheduled_date(make_order(1, "05.01 утром")) == date(2025, 1, 5)
+    assert scheduled_date(make_order(1, "30.12")) == date(2024, 12, 30)
+    assert scheduled_date(make_order(1, "31.12 вечером")) == date(2024, 12, 31)
+    assert scheduled_date(make_order(1, "05.01.25")) == date(2025, 1, 5)
+    assert scheduled_date(make_order(1, "завтра после 18")) == date(2024, 12, 31)
+    assert scheduled_date(make_order(1, "14.30")) is None
+    assert scheduled_date(make_order(1, "после обеда")) is None
+
+
+def test_is_due_on():
+    day = date(2024, 12, 31)
+    assert is_due_on(make_order(1, "после обеда"), day)
+    assert is_due_on(make_order(1, "30.12"), day)
+    assert not is_due_on(make_order(1, "послезавтра"), day)
+    assert not is_due_on(make_order(1, "05.01"), day)
+
+
+def test_plan_route_keeps_unlocated_in_order():
+    orders = [
+        make_order(1, latitude=55.80, longitude=37.60),
+        make_order(2),
+        make_order(3, latitude=55.76, longitude=37.61),
+        make_order(4),
+    ]
+    stops, unlocated = plan_route(orders, (55.75, 37.60))
+    assert [order.id for order, _ in stops] == [3, 1]
+    assert [order.id for order in unlocated] == [2, 4]
@@ -0,0 +1,46 @@
+import asyncio
+import os
+import sqlite3
+import time
+
+from backup import BackupManager
+
+
+def make_manager(tmp_path):
+    db_path = tmp_path / "orders.db"
+    with sqlite3.connect(db_path) as db:
+        db.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY)")
+    return BackupManager(str(db_path), str(tmp_path / "backups"), step_pause=0)
+
+
+def test_seconds_until_due_without_snapshots(tmp_path):
+    assert make_manager(tmp_path).seconds_until_due(24) == 0.0
+
+
+def test_seconds_until_due_counts_from_newest_snapshot(tmp_path):
+    manager = make_manager(tmp_path)
+    path = manager.backup()["path"]
+    assert 23.9 * 3600 < manager.seconds_until_due(24) <= 24 * 3600
+
+    hours_ago = time.time() - 20 * 3600
+    os.utime(path, (hours_ago, hours_ago))
+    assert 3.9 * 3600 < manager.seconds_until_due(24) <= 4 * 3600
+
+    overdue = time.time() - 25 * 3600
+    os.utime(path, (overdue, overdue))
+    assert manager.seconds_until_due(24) == 0.0
+
+
+def test_run_periodically_backs_up_overdue_database_at_once(tmp_path):
+    manager = make_manager(tmp_path)
+
+    async def run():
+        task = asyncio.create_task(manager.run_periodically(24))
+        for _ in range(100):
+            await asyncio.sleep(0.05)
+            if manager.list_snapshots():
+                break
+        task.cancel()
+
+    asyncio.run(run())
+    assert len(manager.list_snapshots()) == 1
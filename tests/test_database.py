@@ -0,0 +1,104 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from database import ORDER_TRANSITIONS, Database, InvalidTransitionError, OrderStatus, is_final
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def make_db(tmp_path) -> Database:
+    db = Database(str(tmp_path / "orders.db"))
+    await db.init_db()
+    return db
+
+
+async def order_in_status(db: Database, status: OrderStatus, user_id: int = 1) -> int:
+    order_id = await db.create_order(user_id, f"ул. Тестовая, д. {status.value}", "10:00", "e", "p")
+    if status is not OrderStatus.PENDING:
+        await db.create_report(order_id, status.value)
+    return order_id
+
+
+def table_counts(db_path) -> dict:
+    with sqlite3.connect(db_path) as conn:
+        return dict(conn.execute("SELECT status, COUNT(*) FROM orders GROUP BY status ORDER BY status"))
+
+
+def test_final_statuses():
+    assert is_final("completed") and is_final("cancelled") and is_final("refused")
+    assert not is_final("pending") and not is_final("in_progress") and not is_final("long_repair")
+
+
+def test_transitions_follow_table(tmp_path):
+    async def scenario():
+        db = await make_db(tmp_path)
+        outcomes = {}
+        for source in OrderStatus:
+            for target in OrderStatus:
+                order_id = await order_in_status(db, source)
+                try:
+                    await db.create_report(order_id, target.value)
+                except InvalidTransitionError as e:
+                    assert (e.order_id, e.current_status, e.new_status) == (order_id, source.value, target.value)
+                    order = await db.get_order_by_id(order_id)
+                    reports = await db.get_order_reports(order_id)
+                    # Отклоненный переход не меняет статус и не создает отчет
+                    assert order.status == source.value
+                    assert len(reports) == (0 if source is OrderStatus.PENDING else 1)
+                    outcomes[source, target] = False
+                else:
+                    assert (await db.get_order_by_id(order_id)).status == target.value
+                    outcomes[source, target] = True
+        return outcomes
+
+    outcomes = run(scenario())
+    for (source, target), allowed in outcomes.items():
+        assert allowed == (target in ORDER_TRANSITIONS[source]), (source, target)
+    assert outcomes[OrderStatus.PENDING, OrderStatus.COMPLETED]
+    assert outcomes[OrderStatus.LONG_REPAIR, OrderStatus.LONG_REPAIR]
+    assert not outcomes[OrderStatus.COMPLETED, OrderStatus.IN_PROGRESS]
+    assert not outcomes[OrderStatus.IN_PROGRESS, OrderStatus.PENDING]
+
+
+def test_report_for_missing_order(tmp_path):
+    async def scenario():
+        db = await make_db(tmp_path)
+        with pytest.raises(InvalidTransitionError) as error:
+            await db.create_report(999, "completed")
+        return error.value
+
+    error = run(scenario())
+    assert error.current_status is None and error.order_id == 999
+
+
+def test_status_counts_match_table(tmp_path):
+    db_path = tmp_path / "orders.db"
+
+    async def scenario():
+        db = await make_db(tmp_path)
+        orders = [await order_in_status(db, status) for status in OrderStatus for _ in range(3)]
+        assert await db.get_status_counts() == {status.value: 3 for status in OrderStatus}
+
+        await db.create_report(orders[0], "in_progress")
+        await db.create_report(orders[3], "long_repair")
+        await db.create_report(orders[6], "long_repair")
+        with pytest.raises(InvalidTransitionError):
+            await db.create_report(orders[9], "pending")
+        assert await db.get_status_counts() == table_counts(db_path)
+
+        assert await db.delete_order(orders[1], 1)
+        assert await db.delete_order(orders[10], 1)
+        assert not await db.delete_order(orders[2], 2)
+        counts = await db.get_status_counts()
+        assert counts == table_counts(db_path)
+        assert sum(counts.values()) == 3 * len(OrderStatus) - 2
+
+        # Повторная инициализация пересчитывает счетчики по таблице заявок
+        await db.init_db()
+        assert await db.get_status_counts() == counts
+
+    run(scenario())
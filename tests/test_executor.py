@@ -0,0 +1,54 @@
+import asyncio
+import time
+
+import pytest
+
+from executor import JobAbortedError, JobExecutor, JobTimeoutError
+
+
+def double(x):
+    return x * 2
+
+
+def sleep_for(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def test_timeout_keeps_queued_jobs():
+    async def run():
+        executor = JobExecutor(max_workers=1, max_pending=8, job_timeout=30)
+        try:
+            # Процесс уже запущен: зависшая задача начнет выполняться сразу
+            assert await executor.submit(double, 1) == 2
+            stuck = asyncio.ensure_future(executor.submit(sleep_for, 60, timeout=2))
+            await asyncio.sleep(0.1)
+            queued = [asyncio.ensure_future(executor.submit(double, i)) for i in range(3)]
+            with pytest.raises(JobTimeoutError):
+                await stuck
+            assert await asyncio.gather(*queued) == [0, 2, 4]
+            stats = executor.stats()
+            assert stats["timed_out"] == 1 and stats["completed"] == 4 and stats["failed"] == 0
+        finally:
+            await executor.shutdown(grace=1)
+        assert executor.pending == 0
+
+    asyncio.run(run())
+
+
+def test_shutdown_aborts_queued_jobs():
+    async def run():
+        executor = JobExecutor(max_workers=1, max_pending=8, job_timeout=30)
+        running = asyncio.ensure_future(executor.submit(sleep_for, 60))
+        await asyncio.sleep(0.1)
+        queued = asyncio.ensure_future(executor.submit(double, 1))
+        await asyncio.sleep(0.1)
+        started = time.monotonic()
+        await executor.shutdown(grace=0.5)
+        assert time.monotonic() - started < 10
+        for job in (running, queued):
+            with pytest.raises(JobAbortedError):
+                await job
+        assert executor.pending == 0
+
+    asyncio.run(run())
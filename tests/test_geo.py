@@ -0,0 +1,110 @@
+import asyncio
+import random
+import time
+
+from database import Database
+from geo import (
+    GridIndex, geohash_encode, haversine_km, nearest_neighbor_route, normalize_address,
+    precision_for_radius
+)
+
+
+def test_normalize_address_ignores_abbreviations_and_flat():
+    assert normalize_address("ул. Ленина, д.5, кв. 3") == normalize_address("улица ленина дом 5")
+    assert normalize_address("Улица Ёлкина 1, подъезд 2, этаж 4") == "ул елкина 1"
+
+
+def test_geohash_reference_value():
+    assert geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geohash_encode(57.64911, 10.40744, 5) == "u4pru"
+
+
+def test_haversine_moscow_spb():
+    assert 630 < haversine_km(55.7558, 37.6173, 59.9343, 30.3351) < 640
+
+
+def test_grid_nearest_matches_brute_force():
+    rng = random.Random(1)
+    for base_lat in (55.0, 69.0, 85.0):
+        index = GridIndex(scan_limit=0)
+        points = [(i, base_lat + rng.random() * 2, rng.random() * 10) for i in range(300)]
+        for key, lat, lon in points:
+            index.add(key, lat, lon)
+        for _ in range(100):
+            lat, lon = base_lat + rng.random() * 2, rng.random() * 10
+            expected = min(points, key=lambda p: haversine_km(lat, lon, p[1], p[2]))
+            assert index.nearest(lat, lon)[0] == expected[0]
+
+
+def test_route_with_far_point_is_fast():
+    started = time.perf_counter()
+    route, legs = nearest_neighbor_route(
+        (55.75, 37.6), [(1, 60.75, 37.6), (2, 55.76, 37.61)]
+    )
+    assert route == [2, 1]
+    assert legs[0] < 2 and legs[1] > 500
+    assert time.perf_counter() - started < 1
+
+
+def test_route_with_far_point_is_fast_on_grid():
+    rng = random.Random(2)
+    points = [(i, 55.5 + rng.random(), 37.3 + rng.random()) for i in range(500)]
+    points.append((-1, 43.1, 131.9))
+    started = time.perf_counter()
+    route, _ = nearest_neighbor_route((55.75, 37.6), points)
+    assert sorted(route) == sorted(key for key, _, _ in points)
+    assert route[-1] == -1
+    assert time.perf_counter() - started < 5
+
+
+def test_route_without_start():
+    route, legs = nearest_neighbor_route(None, [(1, 55.0, 37.0), (2, 56.0, 37.0), (3, 55.1, 37.0)])
+    assert route == [1, 3, 2]
+    assert legs[0] == 0.0
+
+
+def test_precision_for_radius_covers_high_latitudes():
+    assert precision_for_radius(2, 70.0) <= precision_for_radius(2, 0.0)
+
+
+def test_get_orders_near_high_latitude(tmp_path):
+    async def scenario():
+        db = Database(str(tmp_path / "orders.db"))
+        await db.init_db()
+        # Точки к востоку от центра: долготная сторона ячейки у 69° сжата почти втрое
+        near = []
+        for i, dlon in enumerate((0.02, 0.04, 0.06)):
+            order_id = await db.create_order(
+                user_id=1, address=f"Адрес {i}", time="10:00", equipment_type="e", problem="p",
+                latitude=69.0, longitude=33.0 + dlon
+            )
+            near.append(order_id)
+        found = await db.get_orders_near(69.0, 33.0, 3.0, user_id=1)
+        return near, [order.id for order in found]
+
+    near, found = asyncio.run(scenario())
+    assert found == near
+
+
+def test_set_order_location_logs_every_located_order(tmp_path):
+    async def scenario():
+        db = Database(str(tmp_path / "orders.db"))
+        await db.init_db()
+        first = await db.create_order(1, "ул. Ленина, д. 5", "10:00", "e", "p")
+        other_user = await db.create_order(2, "улица Ленина, дом 5", "11:00", "e", "p")
+        other_address = await db.create_order(2, "ул. Мира, д. 1", "12:00", "e", "p")
+        same_address = await db.set_order_location(first, 1, 55.75, 37.62)
+        located = [
+            (event["order_id"], event["user_id"])
+            for event in await db.get_events()
+            if event["event_type"] == "location_set"
+        ]
+        moved = await db.get_order_by_id(other_user)
+        untouched = await db.get_order_by_id(other_address)
+        return same_address, located, moved, untouched, first, other_user
+
+    same_address, located, moved, untouched, first, other_user = asyncio.run(scenario())
+    assert same_address == 1
+    assert sorted(located) == [(first, 1), (other_user, 2)]
+    assert (moved.latitude, moved.longitude) == (55.75, 37.62)
+    assert untouched.latitude is None
@@ -0,0 +1,85 @@
+import asyncio
+import sqlite3
+
+from database import Database, OrderEventType
+from idempotency import RecentKeys, order_key
+
+
+def count_rows(db_path, sql, *params) -> int:
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(sql, params).fetchone()[0]
+
+
+def test_same_key_returns_same_order(tmp_path):
+    db_path = str(tmp_path / "orders.db")
+    key = order_key(1, "flow-1", "ул. Ленина, д. 5", "10:00", "e", "p")
+
+    async def scenario():
+        db = Database(db_path)
+        await db.init_db()
+        first = await db.create_order(1, "ул. Ленина, д. 5", "10:00", "e", "p", idempotency_key=key)
+        again = await db.create_order(1, "ул. Ленина, д. 5", "10:00", "e", "p", idempotency_key=key)
+        # Повторы одновременно (двойное нажатие, повтор из очереди)
+        concurrent = await asyncio.gather(*(
+            db.create_order(1, "ул. Ленина, д. 5", "10:00", "e", "p", idempotency_key=key)
+            for _ in range(5)
+        ))
+        return first, again, concurrent
+
+    first, again, concurrent = asyncio.run(scenario())
+    assert again == first and set(concurrent) == {first}
+    assert count_rows(db_path, "SELECT COUNT(*) FROM orders") == 1
+    assert count_rows(db_path, "SELECT COUNT(*) FROM order_events WHERE event_type = ?",
+                      OrderEventType.CREATED.value) == 1
+
+
+def test_orders_without_key_are_not_merged(tmp_path):
+    async def scenario():
+        db = Database(str(tmp_path / "orders.db"))
+        await db.init_db()
+        return [await db.create_order(1, "ул. Ленина, д. 5", "10:00", "e", "p") for _ in range(2)]
+
+    first, second = asyncio.run(scenario())
+    assert first != second
+
+
+def test_find_and_remove_duplicates(tmp_path):
+    async def scenario():
+        db = Database(str(tmp_path / "orders.db"))
+        await db.init_db()
+        original = await db.create_order(1, "ул. Ленина, д. 5", "10:00", "e", "p")
+        duplicate = await db.create_order(1, "ул. Ленина, д. 5", "10:00", "e", "p")
+        await db.create_order(2, "ул. Ленина, д. 5", "10:00", "e", "p")
+        duplicates = await db.find_duplicate_orders(300)
+        removed = await db.remove_duplicate_orders(duplicates)
+        return original, duplicate, duplicates, removed, await db.find_duplicate_orders(300)
+
+    original, duplicate, duplicates, removed, remaining = asyncio.run(scenario())
+    assert duplicates == [(duplicate, original, 1)]
+    assert removed == 1 and remaining == []
+
+
+def test_order_key_depends_on_flow_and_content():
+    key = order_key(1, "flow-1", "ул. Ленина, д. 5", "10:00", "e", "p")
+    assert key == order_key(1, "flow-1", "ул. Ленина, д. 5", "10:00", "e", "p")
+    assert key != order_key(1, "flow-2", "ул. Ленина, д. 5", "10:00", "e", "p")
+    assert key != order_key(2, "flow-1", "ул. Ленина, д. 5", "10:00", "e", "p")
+    assert key != order_key(1, "flow-1", "ул. Ленина, д. 5", "11:00", "e", "p")
+
+
+def test_recent_keys_evicts_least_recently_used():
+    keys = RecentKeys(2)
+    keys.put("a", 1)
+    keys.put("b", 2)
+    assert keys.get("a") == 1
+    keys.put("c", 3)
+    assert keys.get("b") is None
+    assert (keys.get("a"), keys.get("c")) == (1, 3)
+    assert keys.stats() == {"size": 2, "hits": 3, "misses": 1}
+
+    keys.resize(1)
+    assert len(keys) == 1 and keys.get("c") == 3
+
+    disabled = RecentKeys(0)
+    disabled.put("a", 1)
+    assert disabled.get("a") is None and len(disabled) == 0